@@ -0,0 +1,229 @@
+"""Benchmark translation cache lookups in the v1 and v2 schemas.
+
+Fills a database of each schema with the same synthetic translations and
+measures point lookups of cached and missing texts, batch lookups of a page
+of texts, and the size of the database files.
+
+v1 keys rows by a UNIQUE index over the engine, the params JSON and the text.
+v2 keys rows by a 64-bit digest of the params id and the text, as the rowid.
+
+Usage::
+
+    python benchmark/bench_cache.py [--rows 10000000] [--lookups 20000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from pdf2zh.cache import text_key
+
+V1_SCHEMA = """
+CREATE TABLE _translationcache (
+    id INTEGER NOT NULL PRIMARY KEY,
+    translate_engine VARCHAR(20) NOT NULL,
+    translate_engine_params TEXT NOT NULL,
+    original_text TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    UNIQUE (translate_engine, translate_engine_params, original_text)
+    ON CONFLICT REPLACE
+)
+"""
+V1_LOOKUP = (
+    "SELECT translation FROM _translationcache WHERE translate_engine = ? "
+    "AND translate_engine_params = ? AND original_text = ?"
+)
+
+V2_SCHEMA = """
+CREATE TABLE _translationparams (
+    id INTEGER NOT NULL PRIMARY KEY,
+    translate_engine VARCHAR(20) NOT NULL,
+    translate_engine_params TEXT NOT NULL
+);
+CREATE UNIQUE INDEX _translationparams_engine_params
+    ON _translationparams (translate_engine, translate_engine_params);
+CREATE TABLE _translationcache (
+    key INTEGER NOT NULL PRIMARY KEY,
+    params_id INTEGER NOT NULL,
+    original_text TEXT NOT NULL,
+    translation TEXT NOT NULL
+);
+"""
+V2_LOOKUP = (
+    "SELECT params_id, original_text, translation FROM _translationcache "
+    "WHERE key = ?"
+)
+
+WORDS = [
+    "".join(random.Random(i).choices("abcdefghijklmnopqrstuvwxyz", k=3 + i % 8))
+    for i in range(5000)
+]
+ENGINE = "openai"
+PARAMS = [
+    json.dumps(
+        {
+            "lang_in": "en",
+            "lang_out": lang,
+            "model": "gpt-4o-mini",
+            "prompt": "You are a professional, authentic machine translation "
+            "engine. " * 4,
+            "temperature": 0,
+        }
+    )
+    for lang in ["zh", "ja", "ko", "fr"]
+]
+
+
+def paragraph(i: int) -> str:
+    rnd = random.Random(i)
+    return f"{i} " + " ".join(rnd.choices(WORDS, k=rnd.randint(5, 60)))
+
+
+def rows(count: int):
+    for i in range(count):
+        yield i % len(PARAMS), paragraph(i), f"译文 {i}"
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = wal")
+    return conn
+
+
+def fill_v1(path: str, count: int) -> None:
+    conn = connect(path)
+    conn.execute(V1_SCHEMA)
+    conn.execute("BEGIN")
+    data = (
+        (ENGINE, PARAMS[params], text, translation)
+        for params, text, translation in rows(count)
+    )
+    conn.executemany(
+        "INSERT INTO _translationcache (translate_engine, translate_engine_params, "
+        "original_text, translation) VALUES (?, ?, ?, ?)",
+        data,
+    )
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def fill_v2(path: str, count: int) -> None:
+    conn = connect(path)
+    conn.executescript(V2_SCHEMA)
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO _translationparams VALUES (?, ?, ?)",
+        [(i + 1, ENGINE, params) for i, params in enumerate(PARAMS)],
+    )
+    data = (
+        (text_key(params + 1, text), params + 1, text, translation)
+        for params, text, translation in rows(count)
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO _translationcache VALUES (?, ?, ?, ?)", data
+    )
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def lookup_v1(conn: sqlite3.Connection, params: int, text: str):
+    row = conn.execute(V1_LOOKUP, (ENGINE, PARAMS[params], text)).fetchone()
+    return row and row[0]
+
+
+def lookup_v2(conn: sqlite3.Connection, params: int, text: str):
+    row = conn.execute(V2_LOOKUP, (text_key(params + 1, text),)).fetchone()
+    if row is None or row[0] != params + 1 or row[1] != text:
+        return None
+    return row[2]
+
+
+def lookup_many_v1(conn: sqlite3.Connection, params: int, texts: list) -> dict:
+    query = (
+        "SELECT original_text, translation FROM _translationcache "
+        "WHERE translate_engine = ? AND translate_engine_params = ? "
+        f"AND original_text IN ({','.join('?' * len(texts))})"
+    )
+    return dict(conn.execute(query, (ENGINE, PARAMS[params], *texts)))
+
+
+def lookup_many_v2(conn: sqlite3.Connection, params: int, texts: list) -> dict:
+    keys = {text_key(params + 1, text): text for text in texts}
+    query = (
+        "SELECT key, params_id, original_text, translation FROM _translationcache "
+        f"WHERE key IN ({','.join('?' * len(keys))})"
+    )
+    return {
+        text: translation
+        for key, params_id, text, translation in conn.execute(query, list(keys))
+        if params_id == params + 1 and text == keys[key]
+    }
+
+
+def latencies(fn, conn, queries) -> list:
+    times = []
+    for params, text in queries:
+        start = time.perf_counter()
+        fn(conn, params, text)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(name: str, times: list) -> None:
+    times = sorted(times)
+    p99 = times[int(len(times) * 0.99)]
+    print(
+        f"  {name:14s} mean {statistics.mean(times) * 1e6:7.1f} us  "
+        f"p50 {times[len(times) // 2] * 1e6:7.1f} us  p99 {p99 * 1e6:7.1f} us"
+    )
+
+
+def file_size(path: str) -> float:
+    return sum(
+        os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)
+    ) / (1 << 20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--page", type=int, default=50, help="Texts per batch.")
+    parser.add_argument("--dir", type=str, help="Keep the databases here.")
+    args = parser.parse_args()
+
+    folder = args.dir or tempfile.mkdtemp()
+    rnd = random.Random(1)
+    hits = [
+        (i % len(PARAMS), paragraph(i))
+        for i in rnd.sample(range(args.rows), min(args.lookups, args.rows))
+    ]
+    misses = [(params, text + " missing") for params, text in hits]
+    for version, fill, lookup, lookup_many in [
+        (1, fill_v1, lookup_v1, lookup_many_v1),
+        (2, fill_v2, lookup_v2, lookup_many_v2),
+    ]:
+        path = os.path.join(folder, f"bench.v{version}.db")
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            fill(path, args.rows)
+            print(f"v{version}: filled in {time.perf_counter() - start:.1f} s")
+        conn = connect(path)
+        print(f"v{version}: {args.rows} rows, {file_size(path):.0f} MB")
+        assert all(lookup(conn, params, text) for params, text in hits[:100])
+        assert not any(lookup(conn, params, text) for params, text in misses[:100])
+        report("hit", latencies(lookup, conn, hits))
+        report("miss", latencies(lookup, conn, misses))
+        texts = [text for params, text in hits if params == 0]
+        pages = [(0, texts[i : i + args.page]) for i in range(0, len(texts), args.page)]
+        report(f"page of {args.page}", latencies(lookup_many, conn, pages))
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark the content-stream interpreter on plot-heavy pages.
+
+Generates pages whose content streams hold many vector path operators, as
+found in plots and figures, and times ``PDFPageInterpreterEx.render_contents``
+over them. Throughput is reported in MB of decompressed content per second.
+
+Usage::
+
+    python benchmark/bench_interpreter.py [--pages 5] [--paths 50000]
+"""
+
+import argparse
+import io
+import random
+import time
+
+import pymupdf
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+from pdf2zh.converter import PDFConverterEx
+from pdf2zh.pdfinterp import PDFPageInterpreterEx
+
+
+def plot_stream(paths: int, seed: int = 0) -> bytes:
+    rnd = random.Random(seed)
+    ops = [b"q 0.5 w 0.2 0.4 0.8 RG 0.9 0.1 0.1 rg"]
+    for i in range(paths):
+        x, y = rnd.uniform(50, 550), rnd.uniform(50, 750)
+        if i % 3 == 0:
+            ops.append(b"%.3f %.3f 2 2 re f" % (x, y))
+        else:
+            ops.append(
+                b"%.3f %.3f m %.3f %.3f l %.3f %.3f %.3f %.3f %.3f %.3f c S"
+                % (x, y, x + 3, y + 1, x + 4, y + 2, x + 5, y, x + 6, y - 1)
+            )
+    ops.append(b"Q")
+    return b"\n".join(ops)
+
+
+def build_pdf(pages: int, paths: int) -> bytes:
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page()
+        xref = doc.get_new_xref()
+        doc.update_object(xref, "<<>>")
+        doc.update_stream(xref, plot_stream(paths, seed=i))
+        page.set_contents(xref)
+    return doc.tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--paths", type=int, default=50000)
+    args = parser.parse_args()
+
+    data = build_pdf(args.pages, args.paths)
+    doc = PDFDocument(PDFParser(io.BytesIO(data)))
+    rsrcmgr = PDFResourceManager()
+    device = PDFConverterEx(rsrcmgr)
+    interpreter = PDFPageInterpreterEx(rsrcmgr, device, {})
+
+    size = 0
+    elapsed = 0.0
+    for pageno, page in enumerate(PDFPage.create_pages(doc)):
+        page.pageno = pageno
+        size += sum(len(s.get_data()) for s in page.contents)
+        ctm = (1, 0, 0, 1, 0, 0)
+        device.begin_page(page, ctm)
+        start = time.perf_counter()
+        interpreter.render_contents(page.resources, page.contents, ctm=ctm)
+        elapsed += time.perf_counter() - start
+
+    print(
+        f"{size / 1e6:.1f} MB of content in {elapsed:.2f}s "
+        f"({size / 1e6 / elapsed:.2f} MB/s, {elapsed / args.pages * 1000:.0f} ms/page)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark content-stream tokenizers.
+
+Tokenizes synthetic content streams with pdfminer's ``PDFContentParser`` and
+with ``pdf2zh.contentparser.ContentParser`` and reports throughput in MB of
+decompressed content per second. Both must produce the same objects.
+
+Usage::
+
+    python benchmark/bench_tokenizer.py [--paths 50000] [--lines 20000]
+"""
+
+import argparse
+import random
+import time
+
+from pdfminer.pdfinterp import PDFContentParser
+from pdfminer.pdftypes import PDFStream
+from pdfminer.psexceptions import PSEOF
+
+from bench_interpreter import plot_stream
+from pdf2zh.contentparser import ContentParser
+
+
+def text_stream(lines: int, seed: int = 0) -> bytes:
+    rnd = random.Random(seed)
+    ops = [b"BT /F1 10 Tf 12 TL"]
+    for i in range(lines):
+        words = [b"word%d" % rnd.randrange(1000) for _ in range(8)]
+        ops.append(b"1 0 0 1 72 %.2f Tm" % (800 - i % 60 * 12))
+        ops.append(
+            b"[(%s) -250 (%s)] TJ" % (b" ".join(words[:4]), b" ".join(words[4:]))
+        )
+        if i % 10 == 0:
+            ops.append(b"/Span <</MCID %d>> BDC <00410042> Tj EMC" % i)
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+
+def pdfminer_objects(data: bytes) -> list:
+    parser = PDFContentParser([PDFStream({}, data)])
+    objs = []
+    while True:
+        try:
+            objs.append(parser.nextobject())
+        except PSEOF:
+            return objs
+
+
+def fast_objects(data: bytes) -> list:
+    return list(ContentParser(data))
+
+
+def measure(fn, data: bytes) -> tuple:
+    start = time.perf_counter()
+    objs = fn(data)
+    return objs, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", type=int, default=50000)
+    parser.add_argument("--lines", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, data in [
+        ("paths", plot_stream(args.paths)),
+        ("text", text_stream(args.lines)),
+    ]:
+        size = len(data) / 1e6
+        expected, base = measure(pdfminer_objects, data)
+        objs, fast = measure(fast_objects, data)
+        assert [repr(o) for o in objs] == [repr(o) for o in expected]
+        print(
+            f"{name:6s} {size:.1f} MB  pdfminer {size / base:.2f} MB/s  "
+            f"ContentParser {size / fast:.2f} MB/s  ({base / fast:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
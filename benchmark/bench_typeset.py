@@ -0,0 +1,104 @@
+"""Benchmark paragraph typesetting (phase C of ``receive_layout``).
+
+Builds a synthetic page of Latin paragraphs, translates them into much longer
+CJK text so that most paragraphs overflow their box, and times
+``TranslateConverter.receive_layout`` with and without ``reflow``.
+
+Usage::
+
+    python benchmark/bench_typeset.py [--font path/to/cjk.ttf] [--pages 20]
+"""
+
+import argparse
+import time
+
+import numpy as np
+from pdfminer.layout import LTChar, LTPage
+from pdfminer.pdfinterp import PDFResourceManager
+from pdfminer.psparser import LIT
+from pymupdf import Font
+
+from pdf2zh.converter import TranslateConverter
+from pdf2zh.high_level import download_remote_fonts
+
+WIDTH, HEIGHT = 612, 792
+SOURCE = "The quick brown fox jumps over the lazy dog and keeps running. "
+TARGET = "敏捷的棕色狐狸跳过了懒狗，然后继续奔跑，直到天黑才停下来休息。"
+
+
+def build_page(pageid: int, font, paragraphs: int = 12, lines: int = 3) -> LTPage:
+    page = LTPage(pageid, (0, 0, WIDTH, HEIGHT))
+    size = 10.0
+    y = HEIGHT - 72
+    for _ in range(paragraphs):
+        for _ in range(lines):
+            x = 72.0
+            for ch in SOURCE:
+                width = font.char_width(ord(ch))
+                item = LTChar(
+                    (1, 0, 0, 1, x, y),
+                    font,
+                    size,
+                    1.0,
+                    0,
+                    ch,
+                    width,
+                    None,
+                    None,
+                    None,
+                )
+                item.cid = ord(ch)
+                item.font = font
+                page.add(item)
+                x += width * size
+            y -= size * 1.2
+        y -= size
+    return page
+
+
+def run(converter: TranslateConverter, pages: list, reflow: bool) -> float:
+    converter.reflow = reflow
+    start = time.perf_counter()
+    for page in pages:
+        converter.receive_layout(page)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--font", type=str, default=None)
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    rsrcmgr = PDFResourceManager()
+    tiro = rsrcmgr.get_font(
+        None, {"Subtype": LIT("Type1"), "BaseFont": LIT("Times-Roman")}
+    )
+    noto = Font("noto", args.font or download_remote_fonts("zh"))
+    layout = {i: np.ones((HEIGHT, WIDTH)) for i in range(args.pages)}
+    converter = TranslateConverter(
+        rsrcmgr,
+        thread=1,
+        layout=layout,
+        lang_in="en",
+        lang_out="zh",
+        service="google",
+        noto_name="noto",
+        noto=noto,
+    )
+    converter.translator.translate = lambda text: TARGET * (len(text) // 30)
+    converter.fontmap = {"tiro": tiro}
+    converter.fontid = {tiro: "tiro"}
+    pages = [build_page(i, tiro) for i in range(args.pages)]
+
+    run(converter, pages[:1], False)  # warm up glyph tables
+    for reflow in (False, True):
+        elapsed = run(converter, pages, reflow)
+        print(
+            f"reflow={reflow}: {elapsed:.3f}s for {args.pages} pages "
+            f"({elapsed / args.pages * 1000:.1f} ms/page)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -48,7 +48,7 @@ def translate_task(
     doc_mono, doc_dual = translate_stream(
         stream,
         callback=progress_bar,
-        model=ModelInstance.value,
+        model=ModelInstance.get(),
         **args,
     )
     return doc_mono, doc_dual
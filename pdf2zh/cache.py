@@ -1,36 +1,731 @@
+import argparse
+import atexit
+import hashlib
 import logging
 import os
 import json
-from peewee import Model, SqliteDatabase, AutoField, CharField, TextField, SQL
-from typing import Optional
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from peewee import (
+    SQL,
+    CharField,
+    IntegerField,
+    Model,
+    OperationalError,
+    SqliteDatabase,
+    TextField,
+    fn,
+)
+from playhouse.sqlite_ext import AutoIncrementField
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
 
+from pdf2zh.config import ConfigManager
 
 # we don't init the database here
 db = SqliteDatabase(None)
+SCHEMA_VERSION = 2
 logger = logging.getLogger(__name__)
 
 
-class _TranslationCache(Model):
-    id = AutoField()
+class _TranslationParams(Model):
+    """Engine and parameter combinations, stored once and referenced by id."""
+
+    # AUTOINCREMENT, so that the id of a pruned combination is never given to
+    # another one, whose translators would find the rows written with it
+    id = AutoIncrementField()
     translate_engine = CharField(max_length=20)
     translate_engine_params = TextField()
+    # Unix time the combination was added, see prune
+    created = IntegerField(default=lambda: int(time.time()))
+
+    class Meta:
+        database = db
+        indexes = ((("translate_engine", "translate_engine_params"), True),)
+
+
+class _TranslationCache(Model):
+    # Digest of the params id and the original text, see text_key. As the
+    # INTEGER PRIMARY KEY it is the rowid, so a lookup is a single search of
+    # the table's own b-tree and there is no separate index on long strings.
+    key = IntegerField(primary_key=True)
+    params_id = IntegerField(index=True)
     original_text = TextField()
     translation = TextField()
+    # Unix time of the last write or lookup, updated in batches by CacheWriter
+    last_access = IntegerField(index=True, default=0)
 
     class Meta:
         database = db
-        constraints = [
-            SQL(
-                """
-            UNIQUE (
-                translate_engine,
-                translate_engine_params,
-                original_text
+
+
+class _Migration(Model):
+    """Progress of the copy of a version 1 database, see migrate_v1."""
+
+    # The id of the last version 1 row copied
+    last_id = IntegerField()
+    max_id = IntegerField()
+    # Unix time the copy started
+    started = IntegerField()
+
+    class Meta:
+        database = db
+
+
+def text_key(params_id: int, original_text: str) -> int:
+    """Return the 64-bit row key of a text translated with ``params_id``."""
+    digest = hashlib.blake2b(
+        original_text.encode("utf-8", "surrogatepass"),
+        digest_size=8,
+        person=params_id.to_bytes(8, "big"),
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def find_params_id(
+    translate_engine: str, translate_engine_params: str
+) -> Optional[int]:
+    """Return the id of a params combination, None if it was never stored."""
+    return (
+        _TranslationParams.select(_TranslationParams.id)
+        .where(
+            (_TranslationParams.translate_engine == translate_engine)
+            & (_TranslationParams.translate_engine_params == translate_engine_params)
+        )
+        .scalar()
+    )
+
+
+def get_params_id(translate_engine: str, translate_engine_params: str) -> int:
+    """Return the id of a params combination, adding it if it is new."""
+    _TranslationParams.insert(
+        translate_engine=translate_engine,
+        translate_engine_params=translate_engine_params,
+    ).on_conflict_ignore().execute()
+    return find_params_id(translate_engine, translate_engine_params)
+
+
+class LRUCache:
+    """
+    Thread-safe mapping holding at most ``maxsize`` entries, evicting the
+    least recently used one first. ``maxsize`` 0 disables it.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: str) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+# Recent translations of all translators in this process, in front of SQLite.
+# Repeated strings (running headers, "Figure", reference markers) are served
+# from here without a query.
+memory_cache = LRUCache(int(ConfigManager.get("CACHE_MEMORY_SIZE") or 10000))
+
+# Variables allowed in one statement by older SQLite builds
+MAX_VARIABLES = 999
+ROW_FIELDS = [
+    _TranslationCache.key,
+    _TranslationCache.params_id,
+    _TranslationCache.original_text,
+    _TranslationCache.translation,
+    _TranslationCache.last_access,
+]
+
+# key, params_id, original_text, translation
+Row = Tuple[int, int, str, str]
+
+
+def write_rows(rows: List[Row]) -> None:
+    """Insert or replace rows, in the caller's transaction if there is one."""
+    now = int(time.time())
+    size = MAX_VARIABLES // len(ROW_FIELDS)
+    for i in range(0, len(rows), size):
+        _TranslationCache.replace_many(
+            [(*row, now) for row in rows[i : i + size]], fields=ROW_FIELDS
+        ).execute()
+
+
+def touch_rows(keys: List[int]) -> None:
+    """Set the last access time of rows to now."""
+    now = int(time.time())
+    for i in range(0, len(keys), MAX_VARIABLES):
+        _TranslationCache.update(last_access=now).where(
+            _TranslationCache.key.in_(keys[i : i + MAX_VARIABLES])
+        ).execute()
+
+
+def _delete_rows(query, limit: int, batch_size: int) -> int:
+    """Delete up to ``limit`` rows selected by ``query``, a batch per transaction."""
+    deleted = 0
+    while deleted < limit:
+        keys = query.limit(min(batch_size, limit - deleted))
+        with _TranslationCache._meta.database.atomic():
+            count = (
+                _TranslationCache.delete()
+                .where(_TranslationCache.key.in_(keys))
+                .execute()
+            )
+        if not count:
+            break
+        deleted += count
+    return deleted
+
+
+def database_stats() -> dict:
+    """Return the number of rows and params, and the bytes used and free."""
+    database = _TranslationCache._meta.database
+    page_size = database.pragma("page_size")
+    free = database.pragma("freelist_count") * page_size
+    return {
+        "rows": _TranslationCache.select().count(),
+        "params": _TranslationParams.select().count(),
+        "bytes": database.pragma("page_count") * page_size - free,
+        "free_bytes": free,
+    }
+
+
+def prune(
+    max_rows: int = 0,
+    max_bytes: int = 0,
+    max_age: float = 0,
+    batch_size: int = 10000,
+    params_age: float = 86400,
+) -> dict:
+    """
+    Remove rows older than ``max_age`` seconds, then the least recently used
+    rows until at most 90% of ``max_rows`` and ``max_bytes`` is used, then the
+    params combinations older than ``params_age`` seconds that no row uses any
+    more. A limit of 0 is no limit.
+
+    Rows are deleted ``batch_size`` at a time, each batch in its own
+    transaction, so that other processes can keep using the cache.
+
+    Returns:
+        The number of expired and evicted rows and of removed params.
+    """
+    key = _TranslationCache.select(_TranslationCache.key)
+    expired = evicted = 0
+    if max_age:
+        cutoff = int(time.time() - max_age)
+        expired = _delete_rows(
+            key.where(_TranslationCache.last_access < cutoff), 1 << 62, batch_size
+        )
+    if max_rows or max_bytes:
+        stats = database_stats()
+        # Evict down to 90% of the limits, so that this does not run again
+        # after every few new rows
+        excess = 0
+        if max_rows and stats["rows"] > max_rows:
+            excess = stats["rows"] - int(max_rows * 0.9)
+        if max_bytes and stats["bytes"] > max_bytes:
+            share = 1 - max_bytes * 0.9 / stats["bytes"]
+            excess = max(excess, int(stats["rows"] * share) + 1)
+        if excess:
+            evicted = _delete_rows(
+                key.order_by(_TranslationCache.last_access), excess, batch_size
+            )
+    # New combinations are kept, their translators have not written any row
+    # yet. A translator idle for longer than params_age keeps using the id of
+    # its removed combination. The next process adds the combination again
+    # with a new id, as ids are not reused, and the rows written with the old
+    # id are evicted as least recently used.
+    params = (
+        _TranslationParams.delete()
+        .where(
+            (_TranslationParams.created <= int(time.time() - params_age))
+            & ~fn.EXISTS(
+                _TranslationCache.select(SQL("1")).where(
+                    _TranslationCache.params_id == _TranslationParams.id
                 )
-            ON CONFLICT REPLACE
-            """
             )
+        )
+        .execute()
+    )
+    return {"expired": expired, "evicted": evicted, "params": params}
+
+
+def vacuum(pages: int = 0, step: int = 1024) -> int:
+    """
+    Return free pages to the file system, all of them if ``pages`` is 0.
+
+    The pages are freed ``step`` at a time, so that other connections can use
+    the database in between. This needs ``auto_vacuum`` to be incremental,
+    which it is for databases created by this version.
+
+    Returns:
+        The number of pages freed.
+    """
+    database = _TranslationCache._meta.database
+    if database.pragma("auto_vacuum") != 2:
+        raise RuntimeError(
+            "The cache database does not support incremental vacuum, "
+            "run pdf2zh-cache vacuum --full once to enable it"
+        )
+    freed = 0
+    while not pages or freed < pages:
+        free = database.pragma("freelist_count")
+        count = min(step, free, pages - freed if pages else step)
+        if count <= 0:
+            break
+        database.execute_sql(f"PRAGMA incremental_vacuum({count})").fetchall()
+        left = database.pragma("freelist_count")
+        if left >= free:
+            break
+        freed += free - left
+    return freed
+
+
+class CacheWriter:
+    """
+    Write translations to the database from a background thread.
+
+    Translation threads only queue their rows, the writer thread inserts them
+    in batches, one transaction per batch, and is the only thread waiting on
+    the database lock. Rows are dropped when the queue is full. The writer
+    also records which rows were looked up, prunes the database every
+    ``prune_interval`` seconds if ``limits`` are given, and copies the older
+    database ``migration`` one batch at a time while nothing is queued.
+
+    Args:
+        max_queue: Largest number of rows waiting to be written.
+        batch_size: Largest number of rows written in one transaction.
+        interval: Seconds to wait for more rows before writing a batch.
+        busy_timeout: Milliseconds the writer waits for the database lock.
+        limits: Keyword arguments of ``prune``.
+        prune_interval: Seconds between two runs of ``prune``.
+        idle_interval: Seconds between writes of lookups when nothing is
+            queued.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 10000,
+        batch_size: int = 1000,
+        interval: float = 0.5,
+        busy_timeout: int = 30000,
+        limits: Optional[dict] = None,
+        prune_interval: float = 600,
+        idle_interval: float = 5,
+    ):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self.busy_timeout = busy_timeout
+        self.limits = limits
+        self.prune_interval = prune_interval
+        self.idle_interval = idle_interval
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        # Path of a version 1 database still to be copied, see migrate_v1
+        self.migration: Optional[str] = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue: "queue.Queue[Row]" = None
+        self._thread: Optional[threading.Thread] = None
+        self._touched: set = set()
+        self._pruned = 0.0
+
+    def _start(self) -> None:
+        with self._lock:
+            # Threads do not survive a fork, a forked child starts its own
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue(self.max_queue)
+                self._touched = set()
+                self._pruned = time.monotonic()
+                self._thread = threading.Thread(
+                    target=self._run, name="pdf2zh-cache-writer", daemon=True
+                )
+                self._thread.start()
+
+    def put(self, row: Row) -> bool:
+        """Queue a row, returns False if it was dropped."""
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def touch(self, key: int) -> None:
+        """Record a lookup of the row ``key``."""
+        if self._pid != os.getpid():
+            self._start()
+        with self._lock:
+            self._touched.add(key)
+
+    def flush(self) -> None:
+        """Wait until all queued rows and lookups are written."""
+        if self._pid == os.getpid():
+            self._queue.put(None)  # write the current batch without waiting
+            self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._pid == os.getpid() else 0,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+    def _next_batch(self, timeout: float) -> List[Optional[Row]]:
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.interval
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        migrating = False
+        while True:
+            # Copy batches one after the other until a row is queued
+            batch = self._next_batch(0 if migrating else self.idle_interval)
+            rows = [row for row in batch if row is not None]
+            with self._lock:
+                touched, self._touched = list(self._touched), set()
+            try:
+                if rows or touched:
+                    database = _TranslationCache._meta.database
+                    database.execute_sql(f"PRAGMA busy_timeout = {self.busy_timeout}")
+                    with database.atomic():
+                        write_rows(rows)
+                        touch_rows(touched)
+                    with self._lock:
+                        self.written += len(rows)
+            except Exception as e:
+                logger.debug(f"Error writing cache: {e}")
+                with self._lock:
+                    self.failed += len(rows)
+            try:
+                if (
+                    (rows or touched)
+                    and self.limits
+                    and time.monotonic() - self._pruned > self.prune_interval
+                ):
+                    self._pruned = time.monotonic()
+                    self._prune()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            migrating = not rows and self._migrate()
+
+    def _migrate(self) -> bool:
+        """Copy a batch of ``migration``, returns False if none was copied."""
+        path = self.migration
+        if path is None:
+            return False
+        try:
+            database = _TranslationCache._meta.database
+            database.execute_sql(f"PRAGMA busy_timeout = {self.busy_timeout}")
+            if migrate_v1(path, max_batches=1):
+                return True
+            logger.info(f"Migrated the translation cache, {path} can be removed")
+            self.migration = None
+        except OperationalError as e:  # locked, tried again later
+            logger.debug(f"Error migrating cache: {e}")
+        except Exception as e:
+            logger.warning(f"Could not migrate the translation cache: {e}")
+            self.migration = None
+        return False
+
+    def _prune(self) -> None:
+        try:
+            result = prune(**self.limits)
+            if any(result.values()):
+                logger.info(f"Pruned translation cache: {result}")
+                if _TranslationCache._meta.database.pragma("auto_vacuum") == 2:
+                    vacuum()
+        except Exception as e:
+            logger.warning(f"Error pruning cache: {e}")
+
+
+# In MB, 0 for no limit. The database is kept at about 2 GB by default.
+max_size = ConfigManager.get("CACHE_MAX_SIZE")
+writer = CacheWriter(
+    int(ConfigManager.get("CACHE_WRITE_QUEUE_SIZE") or 10000),
+    limits={
+        "max_rows": int(ConfigManager.get("CACHE_MAX_ROWS") or 0),
+        "max_bytes": int(2048 if max_size is None else max_size) << 20,
+        # In days
+        "max_age": float(ConfigManager.get("CACHE_MAX_AGE") or 0) * 86400,
+    },
+)
+atexit.register(writer.flush)
+
+
+class CacheBackend:
+    """
+    Storage of translations behind the in-process cache.
+
+    Translations are stored by engine, params (the sorted JSON of
+    ``TranslationCache``) and original text. Subclasses implement
+    ``get_many`` and ``set_many``, and may implement the others more
+    efficiently.
+    """
+
+    def get(
+        self, translate_engine: str, translate_engine_params: str, original_text: str
+    ) -> Optional[str]:
+        return self.get_many(
+            translate_engine, translate_engine_params, [original_text]
+        ).get(original_text)
+
+    def set(
+        self,
+        translate_engine: str,
+        translate_engine_params: str,
+        original_text: str,
+        translation: str,
+    ) -> None:
+        self.set_many(
+            translate_engine, translate_engine_params, {original_text: translation}
+        )
+
+    def get_many(
+        self,
+        translate_engine: str,
+        translate_engine_params: str,
+        original_texts: List[str],
+    ) -> Dict[str, str]:
+        """Return the translations found, by original text."""
+        raise NotImplementedError
+
+    def set_many(
+        self,
+        translate_engine: str,
+        translate_engine_params: str,
+        translations: Dict[str, str],
+    ) -> None:
+        raise NotImplementedError
+
+    def touch(
+        self,
+        translate_engine: str,
+        translate_engine_params: str,
+        original_texts: Iterable[str],
+    ) -> None:
+        """Record that translations were served from memory."""
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    The local SQLite database, shared by the processes of one host.
+
+    Single translations are written in the background by ``writer``, and
+    lookups are recorded for ``prune``. Lookups only read, so that under WAL
+    they never wait for the writer's lock. Params combinations are added on
+    their first write.
+    """
+
+    def __init__(self):
+        self._params_ids: Dict[Tuple[str, str], int] = {}
+
+    def params_id(
+        self, translate_engine: str, translate_engine_params: str, add: bool = False
+    ) -> Optional[int]:
+        """
+        Return the id of a params combination. If it was never stored, add it
+        if ``add`` is True, else return None.
+        """
+        key = (translate_engine, translate_engine_params)
+        params_id = self._params_ids.get(key)
+        if params_id is None:
+            params_id = get_params_id(*key) if add else find_params_id(*key)
+            if params_id is not None:
+                self._params_ids[key] = params_id
+        return params_id
+
+    def get(self, translate_engine, translate_engine_params, original_text):
+        try:
+            params_id = self.params_id(translate_engine, translate_engine_params)
+            if params_id is None:
+                return None
+            key = text_key(params_id, original_text)
+            result = _TranslationCache.get_or_none(_TranslationCache.key == key)
+        except OperationalError as e:  # a locked or broken database is a miss
+            logger.warning(f"Error reading cache: {e}")
+            return None
+        # A different text or params with the same digest is a miss
+        if (
+            result is None
+            or result.params_id != params_id
+            or result.original_text != original_text
+        ):
+            return None
+        writer.touch(key)
+        return result.translation
+
+    def set(
+        self, translate_engine, translate_engine_params, original_text, translation
+    ):
+        params_id = self.params_id(translate_engine, translate_engine_params, True)
+        key = text_key(params_id, original_text)
+        writer.put((key, params_id, original_text, translation))
+
+    def get_many(self, translate_engine, translate_engine_params, original_texts):
+        try:
+            params_id = self.params_id(translate_engine, translate_engine_params)
+            if params_id is None:
+                return {}
+            texts = {text_key(params_id, text): text for text in original_texts}
+            keys = list(texts)
+            found = {}
+            for i in range(0, len(keys), MAX_VARIABLES):
+                query = _TranslationCache.select(
+                    _TranslationCache.key,
+                    _TranslationCache.params_id,
+                    _TranslationCache.original_text,
+                    _TranslationCache.translation,
+                ).where(_TranslationCache.key.in_(keys[i : i + MAX_VARIABLES]))
+                for key, row_params_id, text, translation in query.tuples():
+                    if row_params_id != params_id or text != texts[key]:
+                        continue
+                    found[text] = translation
+                    writer.touch(key)
+        except OperationalError as e:  # a locked or broken database is a miss
+            logger.warning(f"Error reading cache: {e}")
+            return {}
+        return found
+
+    def set_many(self, translate_engine, translate_engine_params, translations):
+        params_id = self.params_id(translate_engine, translate_engine_params, True)
+        rows = [
+            (text_key(params_id, text), params_id, text, translation)
+            for text, translation in translations.items()
         ]
+        with _TranslationCache._meta.database.atomic():
+            write_rows(rows)
+
+    def touch(self, translate_engine, translate_engine_params, original_texts):
+        params_id = self.params_id(translate_engine, translate_engine_params)
+        if params_id is None:
+            return
+        for text in original_texts:
+            writer.touch(text_key(params_id, text))
+
+
+class RedisBackend(CacheBackend):
+    """
+    A Redis server shared by several hosts, such as the Celery broker.
+
+    Translations are stored as strings under a digest of the engine, params
+    and text. Batches are sent in one pipeline. The size of the cache is left
+    to the server's ``maxmemory-policy``, for example ``allkeys-lru``.
+
+    Args:
+        client: A ``redis.Redis`` client that decodes responses.
+        prefix: Prefix of the keys.
+        ttl: Seconds after which translations expire unless they are used,
+            never if 0.
+    """
+
+    def __init__(self, client, prefix: str = "pdf2zh:translation:", ttl: int = 0):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisBackend":
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(
+                "The redis cache backend needs the redis package, "
+                "install it with: pip install pdf2zh[backend]"
+            ) from e
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def key(
+        self, translate_engine: str, translate_engine_params: str, original_text: str
+    ) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (translate_engine, translate_engine_params, original_text):
+            digest.update(part.encode("utf-8", "surrogatepass"))
+            digest.update(b"\0")
+        return self.prefix + digest.hexdigest()
+
+    def get_many(self, translate_engine, translate_engine_params, original_texts):
+        pipeline = self.client.pipeline(transaction=False)
+        for text in original_texts:
+            key = self.key(translate_engine, translate_engine_params, text)
+            if self.ttl:
+                pipeline.getex(key, ex=self.ttl)
+            else:
+                pipeline.get(key)
+        try:
+            values = pipeline.execute()
+        except Exception as e:  # a cache that is down is a miss
+            logger.warning(f"Error reading cache: {e}")
+            return {}
+        return {
+            text: value
+            for text, value in zip(original_texts, values)
+            if value is not None
+        }
+
+    def set_many(self, translate_engine, translate_engine_params, translations):
+        pipeline = self.client.pipeline(transaction=False)
+        for text, translation in translations.items():
+            key = self.key(translate_engine, translate_engine_params, text)
+            pipeline.set(key, translation, ex=self.ttl or None)
+        pipeline.execute()
 
 
 class TranslationCache:
@@ -73,65 +768,225 @@ class TranslationCache:
         self.params[k] = v
         self.replace_params(self.params)
 
-    # Since peewee and the underlying sqlite are thread-safe,
+    def _key(self, original_text: str) -> tuple:
+        return self.translate_engine, self.translate_engine_params, original_text
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Hit and miss counts of the in-process cache and counts of the
+        background writer, shared by all instances.
+        """
+        return {**memory_cache.stats(), **writer.stats()}
+
+    # Since the backends (peewee and sqlite, redis-py) are thread-safe,
     # get and set operations don't need locks.
     def get(self, original_text: str) -> Optional[str]:
-        result = _TranslationCache.get_or_none(
-            translate_engine=self.translate_engine,
-            translate_engine_params=self.translate_engine_params,
-            original_text=original_text,
+        translation = memory_cache.get(self._key(original_text))
+        if translation is not None:
+            backend.touch(
+                self.translate_engine, self.translate_engine_params, [original_text]
+            )
+            return translation
+        translation = backend.get(
+            self.translate_engine, self.translate_engine_params, original_text
         )
-        return result.translation if result else None
+        if translation is not None:
+            memory_cache.set(self._key(original_text), translation)
+        return translation
 
     def set(self, original_text: str, translation: str):
+        memory_cache.set(self._key(original_text), translation)
         try:
-            _TranslationCache.create(
-                translate_engine=self.translate_engine,
-                translate_engine_params=self.translate_engine_params,
-                original_text=original_text,
-                translation=translation,
+            backend.set(
+                self.translate_engine,
+                self.translate_engine_params,
+                original_text,
+                translation,
             )
         except Exception as e:
             logger.debug(f"Error setting cache: {e}")
 
+    def get_many(self, original_texts: Iterable[str]) -> Dict[str, str]:
+        """
+        Look up many texts at once, with one query to the backend for all the
+        texts missing from memory.
+
+        Returns:
+            The translations found, by original text.
+        """
+        found = {}
+        missing = []
+        for text in dict.fromkeys(original_texts):
+            translation = memory_cache.get(self._key(text))
+            if translation is None:
+                missing.append(text)
+            else:
+                found[text] = translation
+        if found:
+            backend.touch(self.translate_engine, self.translate_engine_params, found)
+        if missing:
+            stored = backend.get_many(
+                self.translate_engine, self.translate_engine_params, missing
+            )
+            for text, translation in stored.items():
+                memory_cache.set(self._key(text), translation)
+            found.update(stored)
+        return found
+
+    def set_many(self, translations: Dict[str, str]):
+        """Store many translations at once, in a single transaction in SQLite."""
+        if not translations:
+            return
+        for text, translation in translations.items():
+            memory_cache.set(self._key(text), translation)
+        try:
+            backend.set_many(
+                self.translate_engine, self.translate_engine_params, translations
+            )
+        except Exception as e:
+            logger.debug(f"Error setting cache: {e}")
+
+
+def migrate_v1(v1_path: str, batch_size: int = 10000, max_batches: int = 0) -> int:
+    """
+    Copy the translations of a version 1 cache database into the current one,
+    ``batch_size`` rows per transaction, at most ``max_batches`` batches if it
+    is not 0. The progress is stored in the database, so that any process can
+    continue the copy, and user_version is set once all rows are copied.
+
+    Copied rows keep their order for ``prune``: their last access times are
+    spread over the day before the copy started by version 1 id, so that the
+    oldest are removed first. Rows already written in the current database
+    are kept.
+
+    Returns:
+        The number of translations copied, 0 when the copy is complete.
+    """
+    database = _TranslationCache._meta.database
+    params_ids = {}
+    count = 0
+    batches = 0
+    source = sqlite3.connect(f"file:{v1_path}?mode=ro", uri=True)
+    try:
+        while not max_batches or batches < max_batches:
+            with database.atomic("IMMEDIATE"):
+                if database.pragma("user_version") == SCHEMA_VERSION:
+                    break  # completed by another process
+                state = _Migration.get_or_none()
+                if state is None:
+                    (max_id,) = source.execute(
+                        "SELECT COALESCE(MAX(id), 0) FROM _translationcache"
+                    ).fetchone()
+                    state = _Migration.create(
+                        last_id=0, max_id=max_id, started=int(time.time())
+                    )
+                batch = source.execute(
+                    "SELECT id, translate_engine, translate_engine_params, "
+                    "original_text, translation FROM _translationcache "
+                    "WHERE id > ? ORDER BY id LIMIT ?",
+                    (state.last_id, batch_size),
+                ).fetchall()
+                if not batch:
+                    _Migration.delete().execute()
+                    database.pragma("user_version", SCHEMA_VERSION)
+                    break
+                rows = []
+                for v1_id, engine, params, text, translation in batch:
+                    params_id = params_ids.get((engine, params))
+                    if params_id is None:
+                        params_id = params_ids[engine, params] = get_params_id(
+                            engine, params
+                        )
+                    last_access = state.started - 86400
+                    last_access += (
+                        86400 * min(v1_id, state.max_id) // (state.max_id + 1)
+                    )
+                    rows.append(
+                        (
+                            text_key(params_id, text),
+                            params_id,
+                            text,
+                            translation,
+                            last_access,
+                        )
+                    )
+                size = MAX_VARIABLES // len(ROW_FIELDS)
+                for i in range(0, len(rows), size):
+                    _TranslationCache.insert_many(
+                        rows[i : i + size], fields=ROW_FIELDS
+                    ).on_conflict_ignore().execute()
+                _Migration.update(last_id=batch[-1][0]).execute()
+            count += len(batch)
+            batches += 1
+    finally:
+        source.close()
+    return count
+
 
 def init_db(remove_exists=False):
     cache_folder = os.path.join(os.path.expanduser("~"), ".cache", "pdf2zh")
     os.makedirs(cache_folder, exist_ok=True)
-    # The current version does not support database migration, so add the version number to the file name.
-    cache_db_path = os.path.join(cache_folder, "cache.v1.db")
+    # The version number is part of the file name, older files are migrated once
+    cache_db_path = os.path.join(cache_folder, f"cache.v{SCHEMA_VERSION}.db")
     if remove_exists and os.path.exists(cache_db_path):
         os.remove(cache_db_path)
     db.init(
         cache_db_path,
         pragmas={
+            # Only takes effect on a new file, before the tables are created
+            "auto_vacuum": "incremental",
             "journal_mode": "wal",
             "busy_timeout": 1000,
         },
     )
-    db.create_tables([_TranslationCache], safe=True)
+    db.create_tables([_TranslationParams, _TranslationCache, _Migration], safe=True)
+    memory_cache.clear()
+    # user_version is set once the older file is copied, by the writer thread
+    # in the background or by "pdf2zh-cache migrate"
+    if db.pragma("user_version") != SCHEMA_VERSION:
+        v1_path = os.path.join(cache_folder, "cache.v1.db")
+        if os.path.exists(v1_path):
+            writer.migration = v1_path
+        else:
+            try:
+                db.pragma("user_version", SCHEMA_VERSION)
+            except OperationalError as e:
+                logger.debug(f"Error setting the cache version: {e}")
 
 
 def init_test_db():
     import tempfile
 
+    global backend
+    writer.flush()
+    writer.migration = None
+    backend = SQLiteBackend()
     cache_db_path = tempfile.mktemp(suffix=".db")
     test_db = SqliteDatabase(
         cache_db_path,
         pragmas={
+            "auto_vacuum": "incremental",
             "journal_mode": "wal",
             "busy_timeout": 1000,
         },
     )
-    test_db.bind([_TranslationCache], bind_refs=False, bind_backrefs=False)
+    test_db.bind(
+        [_TranslationParams, _TranslationCache, _Migration],
+        bind_refs=False,
+        bind_backrefs=False,
+    )
     test_db.connect()
-    test_db.create_tables([_TranslationCache], safe=True)
+    test_db.create_tables([_TranslationParams, _TranslationCache, _Migration])
+    memory_cache.clear()
     return test_db
 
 
 def clean_test_db(test_db):
-    test_db.drop_tables([_TranslationCache])
+    writer.flush()
+    test_db.drop_tables([_TranslationParams, _TranslationCache, _Migration])
     test_db.close()
+    memory_cache.clear()
     db_path = test_db.database
     if os.path.exists(db_path):
         os.remove(test_db.database)
@@ -143,4 +998,115 @@ def clean_test_db(test_db):
         os.remove(shm_path)
 
 
-init_db()
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Maintain the translation cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show the size of the cache.")
+    migrate_parser = commands.add_parser(
+        "migrate",
+        help="Copy the translations of an older cache file.",
+        description="Otherwise they are copied in the background while translating.",
+    )
+    migrate_parser.add_argument(
+        "--batch-size", type=int, default=10000, help="Rows copied per transaction."
+    )
+    prune_parser = commands.add_parser(
+        "prune",
+        help="Remove old and least recently used translations.",
+        description="Limits default to the configuration, 0 is no limit.",
+    )
+    prune_parser.add_argument("--max-rows", type=int, help="Largest number of rows.")
+    prune_parser.add_argument("--max-size", type=int, help="Largest size in MB.")
+    prune_parser.add_argument("--max-age", type=float, help="Largest age in days.")
+    vacuum_parser = commands.add_parser(
+        "vacuum", help="Return free space to the file system."
+    )
+    vacuum_parser.add_argument(
+        "--pages", type=int, default=0, help="Pages to free, all if 0."
+    )
+    vacuum_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild the database, which enables incremental vacuum on "
+        "databases that do not support it. Other processes have to wait.",
+    )
+    return parser
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parsed_args = create_parser().parse_args(args)
+    if db.deferred:
+        init_db()  # not opened by the redis backend
+    if parsed_args.command == "migrate":
+        if writer.migration is None:
+            logger.info("Nothing to migrate")
+        else:
+            count = migrate_v1(writer.migration, parsed_args.batch_size)
+            logger.info(
+                f"Migrated {count} translations, {writer.migration} can be removed"
+            )
+            writer.migration = None
+    elif parsed_args.command == "prune":
+        limits = dict(writer.limits)
+        if parsed_args.max_rows is not None:
+            limits["max_rows"] = parsed_args.max_rows
+        if parsed_args.max_size is not None:
+            limits["max_bytes"] = parsed_args.max_size << 20
+        if parsed_args.max_age is not None:
+            limits["max_age"] = parsed_args.max_age * 86400
+        logger.info(f"Pruned {prune(**limits)}")
+    elif parsed_args.command == "vacuum":
+        if parsed_args.full:
+            db.pragma("auto_vacuum", "incremental")
+            db.execute_sql("VACUUM")
+        else:
+            try:
+                freed = vacuum(parsed_args.pages)
+            except RuntimeError as e:
+                logger.error(e)
+                return 1
+            logger.info(f"Freed {freed} pages")
+    stats = database_stats()
+    logger.info(
+        f"{stats['rows']} translations, {stats['params']} params, "
+        f"{stats['bytes'] / 1e6:.1f} MB used, {stats['free_bytes'] / 1e6:.1f} MB free"
+    )
+    return 0
+
+
+def init_backend() -> CacheBackend:
+    """
+    Return the backend set by ``CACHE_BACKEND``, "sqlite" or "redis".
+
+    The local database is only opened for SQLite, which is also used when the
+    redis package is missing or no Redis server is configured.
+    """
+    name = (ConfigManager.get("CACHE_BACKEND") or "sqlite").lower()
+    if name == "redis":
+        try:
+            return RedisBackend.from_url(redis_url(), ttl=int(writer.limits["max_age"]))
+        except (ImportError, ValueError) as e:
+            logger.warning(f"Could not use the redis cache backend, using sqlite: {e}")
+    elif name != "sqlite":
+        raise ValueError(f"Unknown cache backend {name!r}")
+    init_db()
+    return SQLiteBackend()
+
+
+def redis_url() -> str:
+    """Return ``CACHE_REDIS_URL``, or else the Celery broker if it is Redis."""
+    url = ConfigManager.get("CACHE_REDIS_URL")
+    if url:
+        return url
+    # The Celery broker by default, so that all workers share the cache
+    broker = ConfigManager.get("CELERY_BROKER") or "redis://127.0.0.1:6379/0"
+    if urlsplit(broker).scheme not in ("redis", "rediss", "unix"):
+        raise ValueError("the Celery broker is not Redis, set CACHE_REDIS_URL")
+    return broker
+
+
+backend = init_backend()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Fast tokenizer for decompressed content streams.
+
+``ContentParser`` yields the same ``(pos, obj)`` pairs as pdfminer's
+``PDFContentParser.nextobject`` but scans the buffer with a single compiled
+regular expression. It only handles the common token forms found in content
+streams. Anything unusual (escaped or nested literal strings, names with
+``#xx`` escapes, inline images, procedures, stray delimiters) is handed to
+pdfminer, which takes over from the start of the enclosing top-level object
+and gives control back after the next operator.
+"""
+
+import binascii
+import re
+from typing import Iterator, List, Optional, Tuple
+
+from pdfminer.pdfinterp import PDFContentParser
+from pdfminer.pdftypes import PDFStream
+from pdfminer.psexceptions import PSEOF
+from pdfminer.psparser import KWD, LIT, PSKeyword, PSLiteral, literal_name
+
+TOKEN = re.compile(
+    rb"[\s\x00]*(?:"
+    rb"(?P<real>[+-]?(?:\d+\.\d*|\.\d+))"
+    rb"|(?P<int>[+-]?\d+)"
+    rb"|(?P<kw>[A-Za-z][^#/%\[\]()<>{}\s]*|['\"])"
+    rb"|/(?P<name>[^#/%\[\]()<>{}\s]*)(?=[/%\[\]()<>{}\s]|$)"
+    rb"|\((?P<str>[^()\\]*)\)"
+    rb"|<(?P<hex>[0-9A-Fa-f\s]*)>(?!>)"
+    rb"|(?P<open>\[|<<)"
+    rb"|(?P<close>\]|>>)"
+    rb"|%[^\r\n]*"
+    rb")"
+)
+SPACE = re.compile(rb"[\s\x00]*")
+WHITESPACE = b" \t\n\r\f\v"
+# Distance from the start of a token to its named group
+OFFSET = {"name": 1, "str": 1, "hex": 1}
+
+# Operators whose operands are parsed by pdfminer itself
+SPECIAL_KEYWORDS = {b"BI", b"ID", b"EI"}
+KEYWORD_EI = KWD(b"EI")
+
+
+class ContentParser:
+    """Parse operands and operators from a content stream buffer."""
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.objects = self._objects()
+
+    def nextobject(self) -> Tuple[int, object]:
+        try:
+            return next(self.objects)
+        except StopIteration:
+            raise PSEOF("Unexpected EOF") from None
+
+    def __iter__(self) -> Iterator[Tuple[int, object]]:
+        return self.objects
+
+    def _objects(self) -> Iterator[Tuple[int, object]]:
+        pos = 0
+        while pos is not None:
+            objs: List[Tuple[int, object]] = []
+            pos = self._scan(pos, objs)
+            yield from objs
+            if pos is not None:
+                pos = yield from self._fallback(pos)
+
+    def _scan(self, i: int, out: List[Tuple[int, object]]) -> Optional[int]:
+        """Tokenize from ``i`` until the end of data or an unusual token.
+
+        Top-level objects are appended to ``out``. Returns None at the end of
+        data, otherwise the offset where pdfminer has to take over.
+        """
+        data = self.data
+        stack: List[Tuple[int, bytes, list]] = []  # enclosing arrays and dicts
+        start, ctype, items = 0, b"", None  # innermost open array or dict
+        restart = i
+        for m in TOKEN.finditer(data, i):
+            restart = i
+            if m.start() != i:
+                break
+            i = m.end()
+            kind = m.lastgroup
+            if kind is None:  # comment
+                continue
+            token = m.group(kind)
+            if kind == "int":
+                obj = int(token)
+            elif kind == "real":
+                obj = float(token)
+            elif kind == "kw":
+                if token == b"true":
+                    obj = True
+                elif token == b"false":
+                    obj = False
+                elif items is not None or token in SPECIAL_KEYWORDS:
+                    break
+                else:
+                    obj = KWD(token)
+            elif kind == "name":
+                try:
+                    obj = LIT(str(token, "utf-8"))
+                except UnicodeDecodeError:
+                    obj = LIT(token)
+            elif kind == "str":
+                obj = token
+            elif kind == "hex":
+                try:
+                    obj = binascii.unhexlify(token.translate(None, WHITESPACE))
+                except binascii.Error:  # odd number of digits
+                    break
+            elif kind == "open":
+                if items is not None:
+                    stack.append((start, ctype, items))
+                start, ctype, items = m.start(kind), token, []
+                continue
+            else:  # close
+                if items is None or (ctype == b"[") != (token == b"]"):
+                    break
+                if ctype == b"[":
+                    obj = items
+                elif len(items) % 2 == 0 and all(
+                    isinstance(k, PSLiteral) for k in items[::2]
+                ):
+                    obj = {
+                        literal_name(k): v
+                        for k, v in zip(items[::2], items[1::2])
+                        if v is not None
+                    }
+                else:
+                    break
+                if stack:
+                    start, ctype, items = stack.pop()
+                    items.append(obj)
+                else:
+                    out.append((start, obj))
+                    items = None
+                continue
+            if items is not None:
+                items.append(obj)
+            else:
+                out.append((m.start(kind) - OFFSET.get(kind, 0), obj))
+        else:
+            if items is None:
+                return None if SPACE.match(data, i).end() == len(data) else i
+        # Restart at the outermost open array or dict, or at the unusual token
+        if stack:
+            return stack[0][0]
+        if items is not None:
+            return start
+        return restart
+
+    def _fallback(self, pos: int):
+        """Let pdfminer parse from ``pos`` up to and including an operator.
+
+        Returns the offset after that operator, or None at the end of data.
+        """
+        parser = PDFContentParser([PDFStream({}, self.data)])
+        parser.seek(pos)
+        while True:
+            try:
+                pos, obj = parser.nextobject()
+            except PSEOF:
+                return None
+            yield pos, obj
+            if isinstance(obj, PSKeyword):
+                if obj is KEYWORD_EI:  # pdfminer stops right after the image data
+                    return parser.bufpos + parser.charpos
+                return pos + len(obj.name)
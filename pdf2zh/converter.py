@@ -1,20 +1,25 @@
+import binascii
 import concurrent.futures
+import hashlib
 import logging
+import math
 import re
+import struct
+import threading
 import unicodedata
 from enum import Enum
 from string import Template
-from typing import Dict
+from typing import Dict, Optional
 
 import numpy as np
 from pdfminer.converter import PDFConverter
 from pdfminer.layout import LTChar, LTFigure, LTLine, LTPage
-from pdfminer.pdffont import PDFCIDFont, PDFUnicodeNotDefined
+from pdfminer.pdffont import PDFCIDFont, PDFFont, PDFUnicodeNotDefined
 from pdfminer.pdfinterp import PDFGraphicState, PDFResourceManager
 from pdfminer.utils import apply_matrix_pt, mult_matrix
 from pymupdf import Font
-from tenacity import retry, wait_fixed
 
+from pdf2zh.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
 from pdf2zh.translator import (
     AnythingLLMTranslator,
     ArgosTranslator,
@@ -44,6 +49,101 @@ from pdf2zh.translator import (
 
 log = logging.getLogger(__name__)
 
+# 重排时字号最多缩小到原字号的比例
+REFLOW_MIN_SCALE = 0.7
+
+# 匹配 {vn} 公式标记
+PLACEHOLDER_PATTERN = re.compile(r"\{\s*v([\d\s]+)\}", re.IGNORECASE)
+
+
+def split_placeholders(text: str) -> list[tuple[Optional[str], Optional[int]]]:
+    """Split a translation into text runs and ``{vN}`` formula placeholders.
+
+    Returns ``(run, None)`` for text and ``(None, vid)`` for placeholders, in
+    order. Placeholders whose id cannot be parsed are dropped.
+    """
+    tokens = []
+    pos = 0
+    for m in PLACEHOLDER_PATTERN.finditer(text):
+        if m.start() > pos:
+            tokens.append((text[pos : m.start()], None))
+        pos = m.end()
+        try:
+            tokens.append((None, int(m.group(1).replace(" ", ""))))
+        except ValueError:
+            pass
+    if pos < len(text):
+        tokens.append((text[pos:], None))
+    return tokens
+
+
+def fit_line_height(
+    line_height: float,
+    lines: int,
+    size: float,
+    height: float,
+    step: float = 0.05,
+    floor: float = 1.0,
+) -> float:
+    """Shrink ``line_height`` in ``step`` decrements until ``lines`` lines fit.
+
+    Closed form of decrementing until ``lines * size * line_height <= height``.
+    The result never drops below ``floor``, and a ``line_height`` already
+    below ``floor`` is returned unchanged.
+    """
+    if lines * size * line_height <= height or line_height <= floor:
+        return line_height
+    fit = math.ceil((line_height - height / (lines * size)) / step - 1e-9)
+    limit = math.floor((line_height - floor) / step + 1e-9)
+    return line_height - min(fit, limit) * step
+
+
+def format_number(x: float) -> bytes:
+    """Format a PDF real number with at most 4 decimals and no trailing zeros."""
+    s = b"%.4f" % x
+    s = s.rstrip(b"0").rstrip(b".")
+    if s == b"-0":
+        return b"0"
+    return s
+
+
+def name_bytes(name) -> bytes:
+    # pdfminer 会把能 utf-8 解码的名字转成 str，其余保留 bytes
+    if isinstance(name, bytes):
+        return name
+    return str(name).encode("utf-8")
+
+
+class ContentStreamWriter:
+    """Builds a PDF content stream directly into a ``bytearray``."""
+
+    def __init__(self) -> None:
+        self.buf = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.buf += data
+
+    def text(self, font, size: float, x: float, y: float, rtxt: bytes) -> None:
+        self.buf += b"/%b %b Tf 1 0 0 1 %b %b Tm [<%b>] TJ " % (
+            name_bytes(font),
+            format_number(size),
+            format_number(x),
+            format_number(y),
+            rtxt,
+        )
+
+    def line(self, x: float, y: float, xlen: float, ylen: float, linewidth: float):
+        self.buf += b"ET q 1 0 0 1 %b %b cm [] 0 d 0 J %b w 0 0 m %b %b l S Q BT " % (
+            format_number(x),
+            format_number(y),
+            format_number(linewidth),
+            format_number(xlen),
+            format_number(ylen),
+        )
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buf)
+
 
 class PDFConverterEx(PDFConverter):
     def __init__(
@@ -51,6 +151,8 @@ class PDFConverterEx(PDFConverter):
         rsrcmgr: PDFResourceManager,
     ) -> None:
         PDFConverter.__init__(self, rsrcmgr, None, "utf-8", 1, None)
+        self.fontmap: Dict[object, PDFFont] = {}
+        self.fontid: Dict[PDFFont, object] = {}
 
     def begin_page(self, page, ctm) -> None:
         # 重载替换 cropbox
@@ -127,6 +229,104 @@ class Paragraph:
         self.brk: bool = brk  # 换行标记
 
 
+class FontMetrics:
+    """Lazily built coverage, glyph id and advance tables of one font.
+
+    Tables are keyed by character and shared across pages and jobs through
+    :meth:`get`, so typesetting does dict lookups instead of font FFI calls.
+    Each caller gets its own instance, which fills missing entries from the
+    caller's font object. Advances are stored for font size 1 and scaled by
+    the caller.
+    """
+
+    _registry: Dict[tuple, tuple] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, font, tables: tuple = None) -> None:
+        self.font = font
+        tables = tables or ({}, {}, {})
+        self.cover: Dict[str, bool] = tables[0]  # 字符是否被字体覆盖
+        self.glyph: Dict[str, int] = tables[1]  # 字符对应的字形编号
+        self.advance: Dict[str, float] = tables[2]  # 字符的单位步进宽度
+
+    @classmethod
+    def get(cls, key: tuple, font) -> "FontMetrics":
+        tables = cls._registry.get(key)
+        if tables is None:
+            with cls._lock:
+                tables = cls._registry.setdefault(key, ({}, {}, {}))
+        return cls(font, tables)
+
+    @classmethod
+    def of_pdffont(cls, font: PDFFont) -> "FontMetrics":
+        return PDFFontMetrics.get(
+            (PDFFontMetrics, type(font).__name__, font.fontname), font
+        )
+
+    @classmethod
+    def of_noto(cls, font: Font) -> "FontMetrics":
+        # 按字体文件内容区分，同名的不同字体文件字形编号不同
+        digest = hashlib.blake2b(font.buffer, digest_size=16).digest()
+        return NotoFontMetrics.get((NotoFontMetrics, digest), font)
+
+    def has(self, ch: str) -> bool:
+        try:
+            return self.cover[ch]
+        except KeyError:
+            self.cover[ch] = cover = self._has(ch)
+            return cover
+
+    def gid(self, ch: str) -> int:
+        try:
+            return self.glyph[ch]
+        except KeyError:
+            self.glyph[ch] = gid = self._gid(ch)
+            return gid
+
+    def width(self, ch: str) -> float:
+        try:
+            return self.advance[ch]
+        except KeyError:
+            self.advance[ch] = adv = self._width(ch)
+            return adv
+
+    def _has(self, ch: str) -> bool:
+        raise NotImplementedError
+
+    def _gid(self, ch: str) -> int:
+        raise NotImplementedError
+
+    def _width(self, ch: str) -> float:
+        raise NotImplementedError
+
+
+class PDFFontMetrics(FontMetrics):
+    # pdfminer 字体，按 unicode 反查编码判断覆盖
+    def _has(self, ch):
+        try:
+            return self.font.to_unichr(ord(ch)) == ch
+        except Exception:
+            return False
+
+    def _gid(self, ch):
+        return ord(ch)
+
+    def _width(self, ch):
+        return self.font.char_width(ord(ch))
+
+
+class NotoFontMetrics(FontMetrics):
+    # pymupdf 字体，字形编号为 0 表示缺字
+    def _has(self, ch):
+        return self.gid(ch) != 0
+
+    def _gid(self, ch):
+        return self.font.has_glyph(ord(ch))
+
+    def _width(self, ch):
+        return self.font.glyph_advance(ord(ch))
+
+
 # fmt: off
 class TranslateConverter(PDFConverterEx):
     def __init__(
@@ -144,14 +344,17 @@ class TranslateConverter(PDFConverterEx):
         envs: Dict = None,
         prompt: Template = None,
         ignore_cache: bool = False,
+        reflow: bool = False,
     ) -> None:
         super().__init__(rsrcmgr)
+        self.reflow = reflow
         self.vfont = vfont
         self.vchar = vchar
         self.thread = thread
         self.layout = layout
         self.noto_name = noto_name
         self.noto = noto
+        self.noto_metrics = FontMetrics.of_noto(noto) if noto else None  # 每个文档只计算一次字体摘要
         self.translator: BaseTranslator = None
         # e.g. "ollama:gemma2:9b" -> ["ollama", "gemma2:9b"]
         param = service.split(":", 1)
@@ -165,6 +368,11 @@ class TranslateConverter(PDFConverterEx):
                 self.translator = translator(lang_in, lang_out, service_model, envs=envs, prompt=prompt, ignore_cache=ignore_cache)
         if not self.translator:
             raise ValueError("Unsupported translation service")
+        self.retry_policy = RetryPolicy.from_config()
+        # One breaker per service, model and endpoint, so that a failing model
+        # or self-hosted server does not stop the jobs using another one
+        endpoint = next((v for k, v in self.translator.envs.items() if k.endswith(("_URL", "_HOST", "_ENDPOINT"))), None)
+        self.breaker = CircuitBreaker.get(":".join(str(p) for p in (service_name, self.translator.model, endpoint) if p))
 
     def receive_layout(self, ltpage: LTPage):
         # 段落
@@ -185,7 +393,7 @@ class TranslateConverter(PDFConverterEx):
         xt: LTChar = None               # 上一个字符
         xt_cls: int = -1                # 上一个字符所属段落，保证无论第一个字符属于哪个类别都可以触发新段落
         vmax: float = ltpage.width / 4  # 行内公式最大宽度
-        ops: str = ""                   # 渲染结果
+        ops = ContentStreamWriter()     # 渲染结果
 
         def vflag(font: str, char: str):    # 匹配公式（和角标）字体
             if isinstance(font, bytes):     # 不一定能 decode，直接转 str
@@ -344,33 +552,56 @@ class TranslateConverter(PDFConverterEx):
         # B. 段落翻译
         log.debug("\n==========[SSTACK]==========\n")
 
-        @retry(wait=wait_fixed(1))
+        try:
+            cached = self.translator.get_cached(sstk)  # 一次查询取出本页已缓存的译文
+        except Exception as e:  # 缓存出错时当作未命中，照常翻译本页
+            log.warning(f"Error reading cache, translating the page: {e}")
+            cached = {}
+
+        failures: list[Exception] = []  # 翻译失败的段落
+
         def worker(s: str):  # 多线程翻译
             if not s.strip() or re.match(r"^\{v\d+\}$", s):  # 空白和公式不翻译
                 return s
+            if s in cached:  # 缓存命中不经过重试和熔断
+                return cached[s]
             try:
-                new = self.translator.translate(s)
+                # 缓存已预取，不再逐段查询
+                new = self.retry_policy.call(self.breaker, self.translator.translate, s, ignore_cache=True)
                 return new
-            except BaseException as e:
+            except Exception as e:  # 重试耗尽或不可重试时保留原文，页末统一处理
                 if log.isEnabledFor(logging.DEBUG):
                     log.exception(e)
                 else:
                     log.exception(e, exc_info=False)
-                raise e
+                failures.append(e)
+                return s
         with concurrent.futures.ThreadPoolExecutor(
             max_workers=self.thread
         ) as executor:
             news = list(executor.map(worker, sstk))
+        if failures:
+            for e in failures:
+                if isinstance(e, CircuitOpenError):  # 服务已熔断，后续页面同样无法翻译
+                    raise e
+            total = sum(1 for s in sstk if s.strip() and not re.match(r"^\{v\d+\}$", s))
+            if len(failures) == total:  # 整页都未翻译时不当作成功
+                raise RuntimeError(f"Page {ltpage.pageid}: none of the {total} paragraphs could be translated") from failures[-1]
+            log.error(f"Page {ltpage.pageid}: {len(failures)} of {total} paragraphs could not be translated, keeping the original text")
 
         ############################################################
         # C. 新文档排版
-        def raw_string(fcur: str, cstk: str):  # 编码字符串
+        noto_metrics = self.noto_metrics
+        tiro_metrics = FontMetrics.of_pdffont(self.fontmap["tiro"]) if "tiro" in self.fontmap else None
+
+        def raw_string(fcur: str, cstk: str) -> bytes:  # 编码字符串
             if fcur == self.noto_name:
-                return "".join(["%04x" % self.noto.has_glyph(ord(c)) for c in cstk])
+                gids = [noto_metrics.gid(c) for c in cstk]
+                return binascii.hexlify(struct.pack(f">{len(gids)}H", *gids))
             elif isinstance(self.fontmap[fcur], PDFCIDFont):  # 判断编码长度
-                return "".join(["%04x" % ord(c) for c in cstk])
+                return binascii.hexlify(cstk.encode("utf-16-be", "surrogatepass"))
             else:
-                return "".join(["%02x" % ord(c) for c in cstk])
+                return binascii.hexlify(cstk.encode("latin-1", "replace"))
 
         # 根据目标语言获取默认行距
         LANG_LINEHEIGHT_MAP = {
@@ -379,124 +610,102 @@ class TranslateConverter(PDFConverterEx):
         }
         default_line_height = LANG_LINEHEIGHT_MAP.get(self.translator.lang_out.lower(), 1.1) # 小语种默认1.1
         _x, _y = 0, 0
-        ops_list = []
-
-        def gen_op_txt(font, size, x, y, rtxt):
-            return f"/{font} {size:f} Tf 1 0 0 1 {x:f} {y:f} Tm [<{rtxt}>] TJ "
-
-        def gen_op_line(x, y, xlen, ylen, linewidth):
-            return f"ET q 1 0 0 1 {x:f} {y:f} cm [] 0 d 0 J {linewidth:f} w 0 0 m {xlen:f} {ylen:f} l S Q BT "
-
-        for id, new in enumerate(news):
-            x: float = pstk[id].x                       # 段落初始横坐标
-            y: float = pstk[id].y                       # 段落初始纵坐标
-            x0: float = pstk[id].x0                     # 段落左边界
-            x1: float = pstk[id].x1                     # 段落右边界
-            height: float = pstk[id].y1 - pstk[id].y0   # 段落高度
-            size: float = pstk[id].size                 # 段落字体大小
-            brk: bool = pstk[id].brk                    # 段落换行标记
+        ops.write(b"BT ")
+
+        def typeset(para: Paragraph, new: str, size: float):  # 按给定字号排版段落，返回指令与换行次数
+            nonlocal _x, _y
+            x: float = para.x                           # 段落初始横坐标
+            y: float = para.y                           # 段落初始纵坐标
+            x0: float = para.x0                         # 段落左边界
+            x1: float = para.x1                         # 段落右边界
+            brk: bool = para.brk                        # 段落换行标记
             cstk: str = ""                              # 当前文字栈
             fcur: str = None                            # 当前字体 ID
             lidx = 0                                    # 记录换行次数
             tx = x
             fcur_ = fcur
-            ptr = 0
-            log.debug(f"< {y} {x} {x0} {x1} {size} {brk} > {sstk[id]} | {new}")
 
             ops_vals: list[dict] = []
 
-            while ptr < len(new):
-                vy_regex = re.match(
-                    r"\{\s*v([\d\s]+)\}", new[ptr:], re.IGNORECASE
-                )  # 匹配 {vn} 公式标记
-                mod = 0  # 文字修饰符
-                if vy_regex:  # 加载公式
-                    ptr += len(vy_regex.group(0))
-                    try:
-                        vid = int(vy_regex.group(1).replace(" ", ""))
+            for run, vid in split_placeholders(new):
+                for ch in run or (None,):
+                    mod = 0  # 文字修饰符
+                    if vid is not None:  # 加载公式
+                        if vid >= len(vlen):
+                            continue  # 翻译器可能会自动补个越界的公式标记
                         adv = vlen[vid]
-                    except Exception:
-                        continue  # 翻译器可能会自动补个越界的公式标记
-                    if var[vid][-1].get_text() and unicodedata.category(var[vid][-1].get_text()[0]) in ["Lm", "Mn", "Sk"]:  # 文字修饰符
-                        mod = var[vid][-1].width
-                else:  # 加载文字
-                    ch = new[ptr]
-                    fcur_ = None
-                    try:
-                        if fcur_ is None and self.fontmap["tiro"].to_unichr(ord(ch)) == ch:
+                        if var[vid][-1].get_text() and unicodedata.category(var[vid][-1].get_text()[0]) in ["Lm", "Mn", "Sk"]:  # 文字修饰符
+                            mod = var[vid][-1].width
+                    else:  # 加载文字
+                        if tiro_metrics is not None and tiro_metrics.has(ch):
                             fcur_ = "tiro"  # 默认拉丁字体
-                    except Exception:
-                        pass
-                    if fcur_ is None:
-                        fcur_ = self.noto_name  # 默认非拉丁字体
-                    if fcur_ == self.noto_name: # FIXME: change to CONST
-                        adv = self.noto.char_lengths(ch, size)[0]
-                    else:
-                        adv = self.fontmap[fcur_].char_width(ord(ch)) * size
-                    ptr += 1
-                if (                                # 输出文字缓冲区
-                    fcur_ != fcur                   # 1. 字体更新
-                    or vy_regex                     # 2. 插入公式
-                    or x + adv > x1 + 0.1 * size    # 3. 到达右边界（可能一整行都被符号化，这里需要考虑浮点误差）
-                ):
-                    if cstk:
-                        ops_vals.append({
-                            "type": OpType.TEXT,
-                            "font": fcur,
-                            "size": size,
-                            "x": tx,
-                            "dy": 0,
-                            "rtxt": raw_string(fcur, cstk),
-                            "lidx": lidx
-                        })
-                        cstk = ""
-                if brk and x + adv > x1 + 0.1 * size:  # 到达右边界且原文段落存在换行
-                    x = x0
-                    lidx += 1
-                if vy_regex:  # 插入公式
-                    fix = 0
-                    if fcur is not None:  # 段落内公式修正纵向偏移
-                        fix = varf[vid]
-                    for vch in var[vid]:  # 排版公式字符
-                        vc = chr(vch.cid)
-                        ops_vals.append({
-                            "type": OpType.TEXT,
-                            "font": self.fontid[vch.font],
-                            "size": vch.size,
-                            "x": x + vch.x0 - var[vid][0].x0,
-                            "dy": fix + vch.y0 - var[vid][0].y0,
-                            "rtxt": raw_string(self.fontid[vch.font], vc),
-                            "lidx": lidx
-                        })
-                        if log.isEnabledFor(logging.DEBUG):
-                            lstk.append(LTLine(0.1, (_x, _y), (x + vch.x0 - var[vid][0].x0, fix + y + vch.y0 - var[vid][0].y0)))
-                            _x, _y = x + vch.x0 - var[vid][0].x0, fix + y + vch.y0 - var[vid][0].y0
-                    for l in varl[vid]:  # 排版公式线条
-                        if l.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
+                            adv = tiro_metrics.width(ch) * size
+                        else:
+                            fcur_ = self.noto_name  # 默认非拉丁字体
+                            adv = noto_metrics.width(ch) * size
+                    if (                                # 输出文字缓冲区
+                        fcur_ != fcur                   # 1. 字体更新
+                        or vid is not None              # 2. 插入公式
+                        or x + adv > x1 + 0.1 * size    # 3. 到达右边界（可能一整行都被符号化，这里需要考虑浮点误差）
+                    ):
+                        if cstk:
+                            ops_vals.append({
+                                "type": OpType.TEXT,
+                                "font": fcur,
+                                "size": size,
+                                "x": tx,
+                                "dy": 0,
+                                "rtxt": raw_string(fcur, cstk),
+                                "lidx": lidx
+                            })
+                            cstk = ""
+                    if brk and x + adv > x1 + 0.1 * size:  # 到达右边界且原文段落存在换行
+                        x = x0
+                        lidx += 1
+                    if vid is not None:  # 插入公式
+                        fix = 0
+                        if fcur is not None:  # 段落内公式修正纵向偏移
+                            fix = varf[vid]
+                        for vch in var[vid]:  # 排版公式字符
+                            vc = chr(vch.cid)
                             ops_vals.append({
-                                "type": OpType.LINE,
-                                "x": l.pts[0][0] + x - var[vid][0].x0,
-                                "dy": l.pts[0][1] + fix - var[vid][0].y0,
-                                "linewidth": l.linewidth,
-                                "xlen": l.pts[1][0] - l.pts[0][0],
-                                "ylen": l.pts[1][1] - l.pts[0][1],
+                                "type": OpType.TEXT,
+                                "font": self.fontid[vch.font],
+                                "size": vch.size,
+                                "x": x + vch.x0 - var[vid][0].x0,
+                                "dy": fix + vch.y0 - var[vid][0].y0,
+                                "rtxt": raw_string(self.fontid[vch.font], vc),
                                 "lidx": lidx
                             })
-                else:  # 插入文字缓冲区
-                    if not cstk:  # 单行开头
-                        tx = x
-                        if x == x0 and ch == " ":  # 消除段落换行空格
-                            adv = 0
+                            if log.isEnabledFor(logging.DEBUG):
+                                lstk.append(LTLine(0.1, (_x, _y), (x + vch.x0 - var[vid][0].x0, fix + y + vch.y0 - var[vid][0].y0)))
+                                _x, _y = x + vch.x0 - var[vid][0].x0, fix + y + vch.y0 - var[vid][0].y0
+                        for l in varl[vid]:  # 排版公式线条
+                            if l.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
+                                ops_vals.append({
+                                    "type": OpType.LINE,
+                                    "x": l.pts[0][0] + x - var[vid][0].x0,
+                                    "dy": l.pts[0][1] + fix - var[vid][0].y0,
+                                    "linewidth": l.linewidth,
+                                    "xlen": l.pts[1][0] - l.pts[0][0],
+                                    "ylen": l.pts[1][1] - l.pts[0][1],
+                                    "lidx": lidx
+                                })
+                    else:  # 插入文字缓冲区
+                        if not cstk:  # 单行开头
+                            tx = x
+                            if x == x0 and ch == " ":  # 消除段落换行空格
+                                adv = 0
+                            else:
+                                cstk += ch
                         else:
                             cstk += ch
-                    else:
-                        cstk += ch
-                adv -= mod # 文字修饰符
-                fcur = fcur_
-                x += adv
-                if log.isEnabledFor(logging.DEBUG):
-                    lstk.append(LTLine(0.1, (_x, _y), (x, y)))
-                    _x, _y = x, y
+                    adv -= mod # 文字修饰符
+                    fcur = fcur_
+                    x += adv
+                    if log.isEnabledFor(logging.DEBUG):
+                        lstk.append(LTLine(0.1, (_x, _y), (x, y)))
+                        _x, _y = x, y
             # 处理结尾
             if cstk:
                 ops_vals.append({
@@ -508,24 +717,36 @@ class TranslateConverter(PDFConverterEx):
                     "rtxt": raw_string(fcur, cstk),
                     "lidx": lidx
                 })
+            return ops_vals, lidx
 
-            line_height = default_line_height
-
-            while (lidx + 1) * size * line_height > height and line_height >= 1:
-                line_height -= 0.05
+        for id, new in enumerate(news):
+            y: float = pstk[id].y                       # 段落初始纵坐标
+            height: float = pstk[id].y1 - pstk[id].y0   # 段落高度
+            size: float = pstk[id].size                 # 段落字体大小
+            log.debug(f"< {y} {pstk[id].x} {pstk[id].x0} {pstk[id].x1} {size} {pstk[id].brk} > {sstk[id]} | {new}")
+
+            ops_vals, lidx = typeset(pstk[id], new, size)
+            line_height = fit_line_height(default_line_height, lidx + 1, size, height)
+            if self.reflow:  # 压缩行距仍放不下时，缩小字号重新排版
+                min_size = pstk[id].size * REFLOW_MIN_SCALE
+                while (lidx + 1) * size * line_height > height and size > min_size:
+                    scale = math.sqrt(height / ((lidx + 1) * size * line_height))
+                    size = max(min_size, size * min(scale, 0.95))
+                    ops_vals, lidx = typeset(pstk[id], new, size)
+                    line_height = fit_line_height(default_line_height, lidx + 1, size, height)
 
             for vals in ops_vals:
                 if vals["type"] == OpType.TEXT:
-                    ops_list.append(gen_op_txt(vals["font"], vals["size"], vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["rtxt"]))
+                    ops.text(vals["font"], vals["size"], vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["rtxt"])
                 elif vals["type"] == OpType.LINE:
-                    ops_list.append(gen_op_line(vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["xlen"], vals["ylen"], vals["linewidth"]))
+                    ops.line(vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["xlen"], vals["ylen"], vals["linewidth"])
 
         for l in lstk:  # 排版全局线条
             if l.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
-                ops_list.append(gen_op_line(l.pts[0][0], l.pts[0][1], l.pts[1][0] - l.pts[0][0], l.pts[1][1] - l.pts[0][1], l.linewidth))
+                ops.line(l.pts[0][0], l.pts[0][1], l.pts[1][0] - l.pts[0][0], l.pts[1][1] - l.pts[0][1], l.linewidth)
 
-        ops = f"BT {''.join(ops_list)}ET "
-        return ops
+        ops.write(b"ET ")
+        return ops.getvalue()
 
 
 class OpType(Enum):
@@ -1,5 +1,8 @@
 import abc
+import hashlib
+import logging
 import os.path
+import threading
 
 import cv2
 import numpy as np
@@ -7,7 +10,6 @@ import ast
 from babeldoc.assets.assets import get_doclayout_onnx_model_path
 
 try:
-    import onnx
     import onnxruntime
 except ImportError as e:
     if "DLL load failed" in str(e):
@@ -21,16 +23,126 @@ from huggingface_hub import hf_hub_download
 
 from pdf2zh.config import ConfigManager
 
+logger = logging.getLogger(__name__)
+
+GRAPH_OPTIMIZATION = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODE = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+# Session settings and the configuration keys they fall back to
+SESSION_CONFIG = {
+    "intra_op_threads": ("ONNX_INTRA_OP_THREADS", int),
+    "inter_op_threads": ("ONNX_INTER_OP_THREADS", int),
+    "execution_mode": ("ONNX_EXECUTION_MODE", str),
+    "graph_optimization": ("ONNX_GRAPH_OPTIMIZATION", str),
+    "optimized_model_path": ("ONNX_OPTIMIZED_MODEL_PATH", str),
+    "thread_affinities": ("ONNX_THREAD_AFFINITIES", str),
+    "allow_spinning": ("ONNX_ALLOW_SPINNING", lambda v: str(int(v))),
+}
+
+
+def quantized_model_path(model_path: str) -> str:
+    """Path of the INT8 model created by ``pdf2zh-quantize`` for a model."""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext}"
+
+
+def optimized_model_path(cache_path: str, model_path: str, level) -> str:
+    """
+    File the graph of ``model_path`` optimized at ``level`` is kept in, for the
+    ``cache_path`` setting. The name records the model file and its size and
+    modification time, so that each model has its own optimized graph.
+    """
+    stat = os.stat(model_path)
+    source = f"{os.path.abspath(model_path)}|{stat.st_size}|{stat.st_mtime_ns}|{level}"
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    root, ext = os.path.splitext(cache_path)
+    return f"{root}.{digest}{ext or '.onnx'}"
+
+
+def session_options(**settings) -> onnxruntime.SessionOptions:
+    """
+    Build ONNX Runtime session options.
+
+    Settings that are not given (or None) are read from the configuration file
+    or the environment, see ``SESSION_CONFIG``. Unset settings keep the ONNX
+    Runtime defaults.
+
+    Args:
+        intra_op_threads: Threads used inside an operator, 0 for one per core.
+        inter_op_threads: Threads used across operators in parallel mode.
+        execution_mode: "sequential" or "parallel".
+        graph_optimization: "disable", "basic", "extended" or "all".
+        optimized_model_path: Where to keep optimized graphs, one file per
+            model next to this path.
+        thread_affinities: Intra-op thread affinities, e.g. "1,2;3,4;5,6".
+        allow_spinning: Whether idle intra-op threads busy-wait, 0 or 1.
+    """
+    unknown = set(settings) - set(SESSION_CONFIG)
+    if unknown:
+        raise TypeError(f"Unknown ONNX session settings: {sorted(unknown)}")
+    values = {}
+    for name, (key, cast) in SESSION_CONFIG.items():
+        value = settings.get(name)
+        if value is None:
+            value = ConfigManager.get(key)
+        if value is not None and value != "":
+            values[name] = cast(value)
+
+    options = onnxruntime.SessionOptions()
+    if "intra_op_threads" in values:
+        options.intra_op_num_threads = values["intra_op_threads"]
+    if "inter_op_threads" in values:
+        options.inter_op_num_threads = values["inter_op_threads"]
+    if "execution_mode" in values:
+        try:
+            options.execution_mode = EXECUTION_MODE[values["execution_mode"].lower()]
+        except KeyError:
+            raise ValueError(
+                f"Unknown ONNX execution mode {values['execution_mode']!r}, "
+                f"expected one of {list(EXECUTION_MODE)}"
+            ) from None
+    if "graph_optimization" in values:
+        try:
+            options.graph_optimization_level = GRAPH_OPTIMIZATION[
+                values["graph_optimization"].lower()
+            ]
+        except KeyError:
+            raise ValueError(
+                f"Unknown ONNX graph optimization level "
+                f"{values['graph_optimization']!r}, "
+                f"expected one of {list(GRAPH_OPTIMIZATION)}"
+            ) from None
+    if "optimized_model_path" in values:
+        options.optimized_model_filepath = values["optimized_model_path"]
+    if "thread_affinities" in values:
+        options.add_session_config_entry(
+            "session.intra_op_thread_affinities", values["thread_affinities"]
+        )
+    if "allow_spinning" in values:
+        options.add_session_config_entry(
+            "session.intra_op.allow_spinning", values["allow_spinning"]
+        )
+    return options
+
 
 class DocLayoutModel(abc.ABC):
     @staticmethod
-    def load_onnx():
-        model = OnnxModel.from_pretrained()
+    def load_onnx(**settings):
+        model = OnnxModel.from_pretrained(**settings)
         return model
 
     @staticmethod
-    def load_available():
-        return DocLayoutModel.load_onnx()
+    def load_available(**settings):
+        return DocLayoutModel.load_onnx(**settings)
 
     @property
     @abc.abstractmethod
@@ -39,26 +151,78 @@ class DocLayoutModel(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def predict(self, image, imgsz=1024, **kwargs) -> list:
+    def predict(self, image, imgsz=1024, rgb=False, **kwargs) -> list:
         """
         Predict the layout of a document page.
 
         Args:
-            image: The image of the document page.
+            image: The image of the document page, in BGR order.
             imgsz: Resize the image to this size. Must be a multiple of the stride.
+            rgb: The image is in RGB order instead.
             **kwargs: Additional arguments.
         """
         pass
 
 
 class YoloResult:
-    """Helper class to store detection results from ONNX model."""
+    """
+    Boxes detected on a page, sorted by descending confidence.
+
+    ``xyxy``, ``conf`` and ``cls`` are arrays over the boxes. ``boxes`` wraps
+    each row in a ``YoloBox`` for callers that iterate over single boxes.
+    """
 
     def __init__(self, boxes, names):
-        self.boxes = [YoloBox(data=d) for d in boxes]
-        self.boxes.sort(key=lambda x: x.conf, reverse=True)
+        data = np.asarray(boxes, dtype=np.float32)
+        if data.ndim != 2:
+            data = data.reshape(-1, 6)
+        self.data = data[np.argsort(-data[:, -2], kind="stable")]
+        self.xyxy = self.data[:, :4]
+        self.conf = self.data[:, -2]
+        self.cls = self.data[:, -1].astype(int)
         self.names = names
 
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def boxes(self):
+        return [YoloBox(data=d) for d in self.data]
+
+    def is_class(self, names) -> np.ndarray:
+        """Mask of the boxes whose class name is in ``names``."""
+        items = self.names.items() if isinstance(self.names, dict) else None
+        ids = [i for i, name in items or enumerate(self.names) if name in names]
+        return np.isin(self.cls, ids)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of two (n, 4) and (m, 4) arrays of xyxy boxes."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def nms(xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, iou: float):
+    """
+    Class-aware non-maximum suppression.
+
+    Returns:
+        Indices of the kept boxes, by descending confidence.
+    """
+    order = np.argsort(-conf, kind="stable")
+    overlap = box_iou(xyxy[order], xyxy[order])
+    # Boxes of different classes never suppress each other
+    suppress = (overlap > iou) & (cls[order][:, None] == cls[order][None, :])
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1 :] &= ~suppress[i, i + 1 :]
+    return order[keep]
+
 
 class YoloBox:
     """Helper class to store detection results from ONNX model."""
@@ -70,25 +234,71 @@ class YoloBox:
 
 
 class OnnxModel(DocLayoutModel):
-    def __init__(self, model_path: str):
-        self.model_path = model_path
+    def __init__(self, model_path: str, io_binding: bool = None, **settings):
+        """
+        Load a DocLayout-YOLO ONNX model.
 
-        model = onnx.load(model_path)
-        metadata = {d.key: d.value for d in model.metadata_props}
+        Args:
+            model_path: Path of the ONNX model.
+            io_binding: Bind the reused input and output buffers to the session
+                instead of passing them on every run. Read from
+                ``ONNX_IO_BINDING`` if None.
+            **settings: ONNX Runtime session settings, see ``session_options``.
+        """
+        self.model_path = model_path
+        if io_binding is None:
+            io_binding = str(ConfigManager.get("ONNX_IO_BINDING")).lower() in (
+                "1",
+                "true",
+            )
+        self.io_binding = io_binding
+        # Preprocessing buffers of each thread, see ``_buffers``
+        self._local = threading.local()
+
+        options = session_options(**settings)
+        cache = options.optimized_model_filepath
+        if cache:
+            cache = optimized_model_path(
+                cache, model_path, options.graph_optimization_level
+            )
+        if cache and os.path.exists(cache):
+            # The graph was already optimized by a previous run
+            options.optimized_model_filepath = ""
+            options.graph_optimization_level = GRAPH_OPTIMIZATION["disable"]
+            self.model = onnxruntime.InferenceSession(cache, sess_options=options)
+        else:
+            options.optimized_model_filepath = cache
+            self.model = onnxruntime.InferenceSession(model_path, sess_options=options)
+
+        # The session keeps the model metadata, no need to parse the graph again
+        metadata = self.model.get_modelmeta().custom_metadata_map
         self._stride = ast.literal_eval(metadata["stride"])
         self._names = ast.literal_eval(metadata["names"])
 
-        self.model = onnxruntime.InferenceSession(model.SerializeToString())
-
     @staticmethod
-    def from_pretrained():
+    def from_pretrained(**settings):
         pth = get_doclayout_onnx_model_path()
-        return OnnxModel(pth)
+        precision = ConfigManager.get("ONNX_MODEL_PRECISION") or "fp32"
+        if precision.lower() == "int8":
+            if os.path.exists(quantized_model_path(pth)):
+                pth = quantized_model_path(pth)
+            else:
+                logger.warning(
+                    "INT8 layout model not found, run pdf2zh-quantize to create it. "
+                    "Using the fp32 model."
+                )
+        elif precision.lower() != "fp32":
+            raise ValueError(f"Unknown ONNX model precision {precision!r}")
+        return OnnxModel(pth, **settings)
 
     @property
     def stride(self):
         return self._stride
 
+    @property
+    def names(self):
+        return self._names
+
     def resize_and_pad_image(self, image, new_shape):
         """
         Resize and pad the image to the specified size, ensuring dimensions are multiples of stride.
@@ -155,25 +365,214 @@ class OnnxModel(DocLayoutModel):
         boxes[..., :4] = (boxes[..., :4] - [pad_x, pad_y, pad_x, pad_y]) / gain
         return boxes
 
-    def predict(self, image, imgsz=1024, **kwargs):
-        # Preprocess input image
-        orig_h, orig_w = image.shape[:2]
-        pix = self.resize_and_pad_image(image, new_shape=imgsz)
-        pix = np.transpose(pix, (2, 0, 1))  # CHW
-        pix = np.expand_dims(pix, axis=0)  # BCHW
-        pix = pix.astype(np.float32) / 255.0  # Normalize to [0, 1]
-        new_h, new_w = pix.shape[2:]
+    def letterbox(self, h, w, imgsz):
+        """
+        Geometry of ``resize_and_pad_image`` for an image of ``h`` x ``w``.
+
+        Returns:
+            The resized size (height, width), the top and left padding and the
+            padded size (height, width).
+        """
+        new_h, new_w = (imgsz, imgsz) if isinstance(imgsz, int) else imgsz
+        r = min(new_h / h, new_w / w)
+        resized_h, resized_w = int(round(h * r)), int(round(w * r))
+        pad_h = (new_h - resized_h) % self.stride
+        pad_w = (new_w - resized_w) % self.stride
+        return (
+            (resized_h, resized_w),
+            (pad_h // 2, pad_w // 2),
+            (resized_h + pad_h, resized_w + pad_w),
+        )
+
+    def preprocess(self, image, imgsz=1024, rgb=False, buffers=None):
+        """
+        Turn an HWC page image into the normalized BCHW model input.
+
+        The image is resized straight into a padded uint8 canvas, and each
+        channel is converted into the float32 input tensor, so no full-page
+        temporaries are created.
+
+        Args:
+            image: Page image in BGR order, or RGB if ``rgb`` is set. A 2D
+                grayscale image is copied into all three channels.
+            imgsz: Target size, see ``resize_and_pad_image``.
+            rgb: The image is in RGB order, such as pymupdf pixmap samples.
+            buffers: ``(canvas, tensor)`` to write into, from ``_buffers``.
+                New arrays are allocated if None.
+        """
+        (resized_h, resized_w), (top, left), shape = self.letterbox(
+            *image.shape[:2], imgsz
+        )
+        canvas, tensor = buffers or self._allocate(shape, ndim=image.ndim)
+        cv2.resize(
+            image,
+            (resized_w, resized_h),
+            dst=canvas[top : top + resized_h, left : left + resized_w],
+            interpolation=cv2.INTER_LINEAR,
+        )
+        for c in range(3):
+            np.divide(
+                canvas if image.ndim == 2 else canvas[:, :, 2 - c if rgb else c],
+                np.float32(255.0),  # Normalize to [0, 1]
+                out=tensor[0, c],
+                dtype=np.float32,
+            )
+        return tensor
+
+    @staticmethod
+    def _allocate(shape, batch=1, ndim=3):
+        # Canvas with the padding color, 2D for grayscale images
+        canvas = np.full(shape if ndim == 2 else (*shape, 3), 114, dtype=np.uint8)
+        tensor = np.empty((batch, 3, *shape), dtype=np.float32)  # BCHW
+        return canvas, tensor
+
+    def _buffers(self, geometry, batch=1, ndim=3):
+        """
+        Input buffers of the current thread for a ``letterbox`` geometry.
+
+        Pages of the same size reuse the same canvas and input tensor (and IO
+        binding), so only a change of page size allocates new ones.
+        """
+        local = self._local
+        if getattr(local, "geometry", None) != (geometry, batch, ndim):
+            local.geometry = (geometry, batch, ndim)
+            local.buffers = self._allocate(geometry[2], batch, ndim)
+            local.binding = None
+            local.output = None
+            if self.io_binding:
+                local.binding = self.model.io_binding()
+                local.binding.bind_cpu_input("images", local.buffers[1])
+        return local
+
+    def _run(self, local):
+        if local.binding is None:
+            return self.model.run(None, {"images": local.buffers[1]})[0]
+        output = self.model.get_outputs()[0]
+        if local.output is not None:
+            # Same input size as the previous run, reuse its output buffer
+            self.model.run_with_iobinding(local.binding)
+            return local.output
+        local.binding.bind_output(output.name, "cpu")
+        self.model.run_with_iobinding(local.binding)
+        preds = local.binding.copy_outputs_to_cpu()[0]
+        if all(isinstance(d, int) for d in output.shape):
+            local.output = np.empty_like(preds)
+            local.binding.bind_output(
+                output.name,
+                "cpu",
+                0,
+                np.float32,
+                local.output.shape,
+                local.output.ctypes.data,
+            )
+        return preds
+
+    @property
+    def max_batch(self):
+        """Pages per run, None if the model accepts any batch size."""
+        batch = self.model.get_inputs()[0].shape[0]
+        return batch if isinstance(batch, int) else None
+
+    def postprocess(self, preds, shape, orig_shape, conf=0.25, iou=None):
+        """
+        Turn the raw predictions of one page into a ``YoloResult``.
+
+        Args:
+            preds: (n, 6) array of xyxy, confidence and class rows.
+            shape: Size of the model input (height, width).
+            orig_shape: Size of the page image (height, width).
+            conf: Confidence threshold.
+            iou: Overlap above which a box of the same class is dropped in
+                favor of a more confident one. The model does not need NMS,
+                so it is disabled if None.
+        """
+        preds = preds[preds[:, 4] > conf]
+        preds[:, :4] = self.scale_boxes(shape, preds[:, :4], orig_shape)
+        if iou is not None:
+            preds = preds[nms(preds[:, :4], preds[:, 4], preds[:, 5], iou)]
+        return YoloResult(boxes=preds, names=self._names)
+
+    def predict_batch(self, images, imgsz=1024, rgb=False, **kwargs):
+        """
+        Predict the layout of pages of the same size in as few runs as the
+        model allows.
+
+        Args:
+            **kwargs: ``conf`` and ``iou`` of ``postprocess``.
+
+        Returns:
+            One ``YoloResult`` per image.
+        """
+        if self.max_batch is not None and len(images) > self.max_batch:
+            return [
+                result
+                for i in range(0, len(images), self.max_batch)
+                for result in self.predict_batch(
+                    images[i : i + self.max_batch], imgsz, rgb, **kwargs
+                )
+            ]
+        # Preprocess input images
+        orig_shape = images[0].shape[:2]
+        geometry = self.letterbox(*orig_shape, imgsz)
+        local = self._buffers(geometry, len(images), images[0].ndim)
+        canvas, tensor = local.buffers
+        for i, image in enumerate(images):
+            self.preprocess(image, imgsz, rgb=rgb, buffers=(canvas, tensor[i : i + 1]))
 
         # Run inference
-        preds = self.model.run(None, {"images": pix})[0]
+        preds = self._run(local)
 
         # Postprocess predictions
-        preds = preds[preds[..., 4] > 0.25]
-        preds[..., :4] = self.scale_boxes(
-            (new_h, new_w), preds[..., :4], (orig_h, orig_w)
-        )
-        return [YoloResult(boxes=preds, names=self._names)]
+        return [self.postprocess(p, geometry[2], orig_shape, **kwargs) for p in preds]
+
+    def predict(self, image, imgsz=1024, rgb=False, **kwargs):
+        return self.predict_batch([image], imgsz, rgb, **kwargs)
 
 
 class ModelInstance:
+    """
+    Layout model shared by the process.
+
+    The model is loaded on the first ``get``, so processes that never analyze
+    a layout do not pay for it. When ``LAYOUT_SERVER`` is set, pages are sent
+    to the layout server at that address instead. ``value`` can still be
+    assigned directly.
+    """
+
     value: OnnxModel = None
+    model_path: str = None
+    settings: dict = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, model_path: str = None, **settings):
+        """
+        Set the model loaded by ``get``, dropping the current one.
+
+        Args:
+            model_path: Path of the ONNX model, the default model if None.
+            **settings: Arguments of ``OnnxModel``.
+        """
+        with cls._lock:
+            cls.model_path = model_path
+            cls.settings = settings
+            cls.value = None
+
+    @classmethod
+    def get(cls) -> OnnxModel:
+        """Return the shared model, loading it on first use."""
+        if cls.value is None:
+            with cls._lock:
+                if cls.value is None:
+                    address = ConfigManager.get("LAYOUT_SERVER")
+                    if address:
+                        from pdf2zh.layout_server import LayoutClient
+
+                        cls.value = LayoutClient(address)
+                        return cls.value
+                    logger.info("Loading the layout model")
+                    if cls.model_path:
+                        cls.value = OnnxModel(cls.model_path, **cls.settings)
+                    else:
+                        cls.value = OnnxModel.load_available(**cls.settings)
+        return cls.value
@@ -15,7 +15,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
 from pdf2zh import translate_stream
-from pdf2zh.doclayout import OnnxModel, ModelInstance
+from pdf2zh.doclayout import ModelInstance
 
 # Configure logging
 logging.basicConfig(
@@ -24,14 +24,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize ONNX model for document layout detection
-logger.info("Initializing ONNX model for document layout detection...")
-try:
-    ModelInstance.value = OnnxModel.load_available()
-    logger.info("ONNX model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load ONNX model: {e}")
-    ModelInstance.value = None
+# The ONNX model for document layout detection is loaded by the first
+# translation request, see ModelInstance.get()
 
 
 # Helper function to create RFC 5987 encoded filename
@@ -199,7 +193,7 @@ async def translate_mono(
             'lang_out': lang_out,
             'service': service,
             'thread': thread,
-            'model': ModelInstance.value,  # Pass ONNX model for document layout detection
+            'model': ModelInstance.get(),  # Pass ONNX model for document layout detection
         }
 
         # Translate
@@ -277,7 +271,7 @@ async def translate_dual(
             'lang_out': lang_out,
             'service': service,
             'thread': thread,
-            'model': ModelInstance.value,  # Pass ONNX model for document layout detection
+            'model': ModelInstance.get(),  # Pass ONNX model for document layout detection
         }
 
         # Translate
@@ -355,7 +349,7 @@ async def translate_both(
             'lang_out': lang_out,
             'service': service,
             'thread': thread,
-            'model': ModelInstance.value,  # Pass ONNX model for document layout detection
+            'model': ModelInstance.get(),  # Pass ONNX model for document layout detection
         }
 
         # Translate
@@ -327,7 +327,7 @@ def translate_file(
         "skip_subset_fonts": skip_subset_fonts,
         "ignore_cache": ignore_cache,
         "vfont": vfont,  # 添加自定义公式字体正则表达式
-        "model": ModelInstance.value,
+        "model": ModelInstance.get(),
     }
 
     try:
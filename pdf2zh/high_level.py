@@ -25,6 +25,7 @@ from pymupdf import Document, Font
 from pdf2zh.converter import TranslateConverter
 from pdf2zh.doclayout import OnnxModel
 from pdf2zh.pdfinterp import PDFPageInterpreterEx
+from pdf2zh.raster import PageRasterizer
 
 from pdf2zh.config import ConfigManager
 from babeldoc.assets.assets import get_font_and_metadata
@@ -56,6 +57,89 @@ noto_list = [
 ]
 
 
+# 文字显示指令 Tj/TJ/'/"，误判只会让页面走完整流程
+TEXT_SHOWING = re.compile(rb"\bT[jJ]\b|['\"]")
+
+
+def page_has_text(doc: Document, pageno: int) -> bool:
+    """Cheaply tell whether a page may contain text to translate.
+
+    Pages without fonts in their resources, or whose content streams and
+    Form XObjects never show text, are pure figures, scans or blank pages.
+    """
+    page = doc[pageno]
+    if not page.get_fonts():
+        return False
+    xrefs = page.get_contents() + [xref for xref, *_ in page.get_xobjects()]
+    return any(TEXT_SHOWING.search(doc.xref_stream(xref) or b"") for xref in xrefs)
+
+
+def resource_xrefs(doc: Document, pageno: int) -> set[int]:
+    """Return the xrefs of a page and of the resources it uses, recursively.
+
+    Resources inherited from the page tree count as the page's own, as the
+    node holding them is changed along with the page.
+    """
+    xref = doc.page_xref(pageno)
+    found = {xref}
+    res = doc.xref_get_key(xref, "Resources")
+    while res[0] == "null":
+        parent = doc.xref_get_key(xref, "Parent")
+        if parent[0] != "xref":
+            break
+        xref = int(parent[1].split()[0])
+        found.add(xref)
+        res = doc.xref_get_key(xref, "Resources")
+    todo = [res[1]]
+    while todo:
+        for ref in re.findall(r"(\d+) 0 R", todo.pop()):
+            ref = int(ref)
+            if ref not in found:
+                found.add(ref)
+                todo.append(doc.xref_object(ref))
+    return found
+
+
+def insert_fonts(doc: Document, font_list: list, text_pages: set[int]) -> None:
+    """Add the fonts of the translation to the resources of the text pages."""
+    font_id = {}
+    for page in doc:
+        if page.number not in text_pages:
+            continue
+        for font in font_list:
+            font_id[font[0]] = page.insert_font(font[0], font[1])
+    # 只改动有文字的页面及其资源，其他页面（与它们共用的资源除外）保持不变
+    text_xrefs = set()
+    for pageno in text_pages:
+        text_xrefs |= resource_xrefs(doc, pageno)
+    xreflen = doc.xref_length()
+    for xref in range(1, xreflen):
+        if xref not in text_xrefs:
+            continue
+        for label in ["Resources/", ""]:  # 可能是基于 xobj 的 res
+            try:  # xref 读写可能出错
+                font_res = doc.xref_get_key(xref, f"{label}Font")
+                target_key_prefix = f"{label}Font/"
+                if font_res[0] == "xref":
+                    resource_xref_id = re.search("(\\d+) 0 R", font_res[1]).group(1)
+                    xref = int(resource_xref_id)
+                    font_res = ("dict", doc.xref_object(xref))
+                    target_key_prefix = ""
+
+                if font_res[0] == "dict":
+                    for font in font_list:
+                        target_key = f"{target_key_prefix}{font[0]}"
+                        font_exist = doc.xref_get_key(xref, target_key)
+                        if font_exist[0] == "null":
+                            doc.xref_set_key(
+                                xref,
+                                target_key,
+                                f"{font_id[font[0]]} 0 R",
+                            )
+            except Exception:
+                pass
+
+
 def check_files(files: List[str]) -> List[str]:
     files = [
         f for f in files if not f.startswith("http://")
@@ -85,6 +169,8 @@ def translate_patch(
     envs: Dict = None,
     prompt: Template = None,
     ignore_cache: bool = False,
+    reflow: bool = False,
+    text_pages: Optional[set[int]] = None,
     **kwarg: Any,
 ) -> None:
     rsrcmgr = PDFResourceManager()
@@ -103,6 +189,7 @@ def translate_patch(
         envs,
         prompt,
         ignore_cache,
+        reflow=reflow,
     )
 
     assert device is not None
@@ -113,9 +200,34 @@ def translate_patch(
     else:
         total_pages = doc_zh.page_count
 
+    # 版面分析的渲染参数，未配置时按 72 dpi 渲染，超过约 1M 像素的页面缩小
+    pixel_budget = int(ConfigManager.get("LAYOUT_PIXEL_BUDGET") or 1024 * 1024)
+    max_scale = float(ConfigManager.get("LAYOUT_MAX_SCALE") or 1.0)
+    gray = str(ConfigManager.get("LAYOUT_GRAYSCALE")).lower() in ("1", "true")
+    # 在子进程中提前渲染后续页面，与版面分析和解析并行
+    workers = int(ConfigManager.get("LAYOUT_RENDER_WORKERS") or 0)
+    render_pages = [
+        pageno
+        for pageno in range(doc_zh.page_count)
+        if (not pages or pageno in pages)
+        and (text_pages is None or pageno in text_pages)
+    ]
+
     parser = PDFParser(inf)
     doc = PDFDocument(parser)
-    with tqdm.tqdm(total=total_pages) as progress:
+    with (
+        PageRasterizer(
+            doc_zh,
+            render_pages,
+            workers,
+            stream=inf.getvalue() if workers else None,
+            pixel_budget=pixel_budget,
+            max_scale=max_scale,
+            gray=gray,
+        ) as rasterizer,
+        tqdm.tqdm(total=total_pages) as progress,
+    ):
+        rendered = iter(rasterizer)
         for pageno, page in enumerate(PDFPage.create_pages(doc)):
             if cancellation_event and cancellation_event.is_set():
                 raise CancelledError("task cancelled")
@@ -124,36 +236,35 @@ def translate_patch(
             progress.update()
             if callback:
                 callback(progress)
+            if text_pages is not None and pageno not in text_pages:
+                continue  # 没有文字的页面保留原始指令流，跳过渲染和版面分析
             page.pageno = pageno
-            pix = doc_zh[page.pageno].get_pixmap()
-            image = np.frombuffer(pix.samples, np.uint8).reshape(
-                pix.height, pix.width, 3
-            )[:, :, ::-1]
-            page_layout = model.predict(image, imgsz=int(pix.height / 32) * 32)[0]
+            # 大幅面页面按像素预算缩小渲染，版面框再换算回 PDF 坐标
+            rendered_pageno, image, scale = next(rendered)
+            if rendered_pageno != page.pageno:
+                raise RuntimeError(
+                    f"Rendered page {rendered_pageno} for page {page.pageno}"
+                )
+            # 直接传入 RGB 像素，由预处理在写入输入张量时交换通道
+            page_layout = model.predict(
+                image, imgsz=int(image.shape[0] / 32) * 32, rgb=True
+            )[0]
             # kdtree 是不可能 kdtree 的，不如直接渲染成图片，用空间换时间
-            box = np.ones((pix.height, pix.width))
+            rect = doc_zh[page.pageno].rect.irect
+            box = np.ones((rect.height, rect.width))
             h, w = box.shape
             vcls = ["abandon", "figure", "table", "isolate_formula", "formula_caption"]
-            for i, d in enumerate(page_layout.boxes):
-                if page_layout.names[int(d.cls)] not in vcls:
-                    x0, y0, x1, y1 = d.xyxy.squeeze()
-                    x0, y0, x1, y1 = (
-                        np.clip(int(x0 - 1), 0, w - 1),
-                        np.clip(int(h - y1 - 1), 0, h - 1),
-                        np.clip(int(x1 + 1), 0, w - 1),
-                        np.clip(int(h - y0 + 1), 0, h - 1),
-                    )
-                    box[y0:y1, x0:x1] = i + 2
-            for i, d in enumerate(page_layout.boxes):
-                if page_layout.names[int(d.cls)] in vcls:
-                    x0, y0, x1, y1 = d.xyxy.squeeze()
-                    x0, y0, x1, y1 = (
-                        np.clip(int(x0 - 1), 0, w - 1),
-                        np.clip(int(h - y1 - 1), 0, h - 1),
-                        np.clip(int(x1 + 1), 0, w - 1),
-                        np.clip(int(h - y0 + 1), 0, h - 1),
-                    )
-                    box[y0:y1, x0:x1] = 0
+            # 一次算出所有框在图片坐标系下的范围，按置信度顺序依次绘制
+            x0, y0, x1, y1 = (page_layout.xyxy / scale).T
+            rects = np.stack([x0 - 1, h - y1 - 1, x1 + 1, h - y0 + 1], axis=1)
+            rects = np.clip(rects.astype(int), 0, [w - 1, h - 1, w - 1, h - 1])
+            skip = page_layout.is_class(vcls)
+            for i in np.flatnonzero(~skip):
+                x0, y0, x1, y1 = rects[i]
+                box[y0:y1, x0:x1] = i + 2
+            for i in np.flatnonzero(skip):
+                x0, y0, x1, y1 = rects[i]
+                box[y0:y1, x0:x1] = 0
             layout[page.pageno] = box
             # 新建一个 xref 存放新指令流
             page.page_xref = doc_zh.get_new_xref()  # hack 插入页面的新 xref
@@ -182,6 +293,7 @@ def translate_stream(
     prompt: Template = None,
     skip_subset_fonts: bool = False,
     ignore_cache: bool = False,
+    reflow: bool = False,
     **kwarg: Any,
 ):
     font_list = [("tiro", None)]
@@ -197,34 +309,8 @@ def translate_stream(
     doc_zh = Document(stream=stream)
     page_count = doc_zh.page_count
     # font_list = [("GoNotoKurrent-Regular.ttf", font_path), ("tiro", None)]
-    font_id = {}
-    for page in doc_zh:
-        for font in font_list:
-            font_id[font[0]] = page.insert_font(font[0], font[1])
-    xreflen = doc_zh.xref_length()
-    for xref in range(1, xreflen):
-        for label in ["Resources/", ""]:  # 可能是基于 xobj 的 res
-            try:  # xref 读写可能出错
-                font_res = doc_zh.xref_get_key(xref, f"{label}Font")
-                target_key_prefix = f"{label}Font/"
-                if font_res[0] == "xref":
-                    resource_xref_id = re.search("(\\d+) 0 R", font_res[1]).group(1)
-                    xref = int(resource_xref_id)
-                    font_res = ("dict", doc_zh.xref_object(xref))
-                    target_key_prefix = ""
-
-                if font_res[0] == "dict":
-                    for font in font_list:
-                        target_key = f"{target_key_prefix}{font[0]}"
-                        font_exist = doc_zh.xref_get_key(xref, target_key)
-                        if font_exist[0] == "null":
-                            doc_zh.xref_set_key(
-                                xref,
-                                target_key,
-                                f"{font_id[font[0]]} 0 R",
-                            )
-            except Exception:
-                pass
+    text_pages = {i for i in range(page_count) if page_has_text(doc_zh, i)}
+    insert_fonts(doc_zh, font_list, text_pages)
 
     fp = io.BytesIO()
 
@@ -235,15 +321,9 @@ def translate_stream(
         # ops_old=doc_en.xref_stream(obj_id)
         # print(obj_id)
         # print(ops_old)
-        # print(ops_new.encode())
-        # Use latin-1 encoding for PDF streams as per PDF specification
-        # Use 'replace' to handle characters outside latin-1 range
-        try:
-            doc_zh.update_stream(obj_id, ops_new.encode('latin-1'))
-        except UnicodeEncodeError:
-            # Fallback: encode as UTF-8 then decode as latin-1 (lossy but safe)
-            logger.warning(f"Found non-latin-1 characters in PDF stream {obj_id}, using fallback encoding")
-            doc_zh.update_stream(obj_id, ops_new.encode('utf-8', errors='replace'))
+        # print(ops_new)
+        # The interpreter already emits content streams as bytes
+        doc_zh.update_stream(obj_id, ops_new)
 
     doc_en.insert_file(doc_zh)
     for id in range(page_count):
@@ -324,6 +404,7 @@ def translate(
     prompt: Template = None,
     skip_subset_fonts: bool = False,
     ignore_cache: bool = False,
+    reflow: bool = False,
     **kwarg: Any,
 ):
     if not files:
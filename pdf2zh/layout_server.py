@@ -0,0 +1,366 @@
+"""Share one layout model between processes on the same host.
+
+``LayoutServer`` owns the ONNX Runtime session and listens on a Unix socket,
+so it is not available on Windows. Pages sent by ``LayoutClient`` are queued,
+and pages of the same size that arrive within ``max_wait`` seconds of each
+other are predicted in one batch. Workers then need neither their own copy of the
+model nor their own inference thread pool.
+
+Start the server once::
+
+    pdf2zh-layout-server
+
+and point the workers at the address it logs with ``LAYOUT_SERVER``.
+
+The socket is only accessible to the user running the server, and clients
+authenticate with ``LAYOUT_SERVER_KEY``, or a random key kept in the user's
+cache folder when it is not set. Messages are a JSON header followed by the
+raw array bytes, nothing is unpickled.
+"""
+
+import argparse
+import ast
+import json
+import logging
+import os
+import queue
+import secrets
+import stat
+import sys
+import threading
+import time
+from collections import defaultdict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import List, Optional
+
+import numpy as np
+
+from pdf2zh.config import ConfigManager
+from pdf2zh.doclayout import DocLayoutModel, OnnxModel, YoloResult
+
+logger = logging.getLogger(__name__)
+
+CACHE_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "pdf2zh")
+KEY_PATH = os.path.join(CACHE_FOLDER, "layout-server.key")
+# Keyword arguments of ``predict`` passed on to the server
+PREDICT_ARGS = {"conf", "iou"}
+
+
+def default_address() -> str:
+    """Socket path in the user's runtime directory, or else its cache folder."""
+    folder = os.environ.get("XDG_RUNTIME_DIR") or CACHE_FOLDER
+    return os.path.join(folder, "pdf2zh-layout.sock")
+
+
+def get_authkey() -> bytes:
+    """
+    Return ``LAYOUT_SERVER_KEY``, or else the key in ``KEY_PATH``, which is
+    created with a random key, readable only by the user, if it is missing.
+    """
+    key = ConfigManager.get("LAYOUT_SERVER_KEY")
+    if key:
+        return str(key).encode()
+    if not os.path.exists(KEY_PATH):
+        os.makedirs(os.path.dirname(KEY_PATH), exist_ok=True)
+        # Written in full before it appears under its name, and the first
+        # process to link it wins
+        tmp_path = f"{KEY_PATH}.{os.getpid()}"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_hex(32).encode())
+        try:
+            os.link(tmp_path, KEY_PATH)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+    with open(KEY_PATH, "rb") as f:
+        return f.read()
+
+
+class Request:
+    """A page waiting for its layout."""
+
+    def __init__(self, image: np.ndarray, imgsz: int, rgb: bool, kwargs: dict):
+        self.image = image
+        self.imgsz = imgsz
+        self.rgb = rgb
+        # conf and iou of the prediction
+        self.kwargs = kwargs
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+    @property
+    def key(self) -> tuple:
+        # Only pages with the same input tensor shape and thresholds can share
+        # a batch
+        return (
+            self.image.shape,
+            self.imgsz,
+            self.rgb,
+            tuple(sorted(self.kwargs.items())),
+        )
+
+
+class LayoutServer:
+    """
+    Serve layout predictions of one model to many client processes.
+
+    Args:
+        model: The layout model.
+        address: Path of the Unix socket to listen on.
+        max_batch: Largest number of pages predicted in one run.
+        max_wait: Seconds to wait for more pages before running a batch.
+        workers: Threads running batches on the shared session.
+        authkey: Key clients authenticate with, ``get_authkey()`` if None.
+    """
+
+    def __init__(
+        self,
+        model: OnnxModel,
+        address: str,
+        max_batch: int = 8,
+        max_wait: float = 0.01,
+        workers: int = 1,
+        authkey: Optional[bytes] = None,
+    ):
+        self.model = model
+        self.address = address
+        self.authkey = get_authkey() if authkey is None else authkey
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.workers = workers
+        self.requests: "queue.Queue[Request]" = queue.Queue()
+        self.listener: Optional[Listener] = None
+        self.closing = threading.Event()
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.address):
+            self._remove_stale_socket()
+        # Only the user running the server can connect to the socket
+        umask = os.umask(0o177)
+        try:
+            self.listener = Listener(self.address, authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        for _ in range(self.workers):
+            threading.Thread(target=self._run_batches, daemon=True).start()
+        logger.info(f"Layout server listening on {self.address}")
+        with self.listener:
+            while True:
+                try:
+                    conn = self.listener.accept()
+                except (AuthenticationError, EOFError, ConnectionError) as e:
+                    if self.closing.is_set():
+                        return
+                    logger.warning(f"Rejected a layout client: {e!r}")
+                    continue
+                if self.closing.is_set():
+                    conn.close()
+                    return
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def shutdown(self) -> None:
+        """Stop accepting connections and return from ``serve_forever``."""
+        self.closing.set()
+        Client(self.address, authkey=self.authkey).close()  # wake up accept()
+
+    def _remove_stale_socket(self) -> None:
+        """Remove the socket of a server that was killed, if nothing listens on it."""
+        if not stat.S_ISSOCK(os.stat(self.address).st_mode):
+            raise RuntimeError(f"{self.address} exists and is not a socket")
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self.address)
+            return
+        except AuthenticationError:
+            pass  # a server with another key
+        raise RuntimeError(f"A layout server is already listening on {self.address}")
+
+    def _serve(self, conn: Connection) -> None:
+        """Answer the requests of one client connection in order."""
+        with conn:
+            try:
+                send_header(
+                    conn,
+                    {"stride": self.model.stride, "names": repr(self.model.names)},
+                )
+            except OSError:
+                return  # closed right away, such as by _remove_stale_socket
+            while True:
+                try:
+                    header = recv_header(conn)
+                    image = np.frombuffer(conn.recv_bytes(), np.uint8)
+                    image = image.reshape(header["shape"])
+                    kwargs = header.get("kwargs", {})
+                    if set(kwargs) - PREDICT_ARGS or not all(
+                        v is None or isinstance(v, (int, float))
+                        for v in kwargs.values()
+                    ):
+                        raise ValueError(f"Bad prediction arguments {kwargs!r}")
+                except (EOFError, OSError, ValueError):
+                    return  # closed by the client, or not a client of ours
+                request = Request(image, header["imgsz"], header["rgb"], kwargs)
+                self.requests.put(request)
+                request.done.wait()
+                try:
+                    if request.error is not None:
+                        send_header(conn, {"error": repr(request.error)})
+                    else:
+                        send_header(conn, {"shape": request.result.shape})
+                        conn.send_bytes(memoryview(request.result).cast("B"))
+                except OSError:
+                    return
+
+    def _next_batch(self) -> List[Request]:
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batches(self) -> None:
+        while True:
+            groups = defaultdict(list)
+            for request in self._next_batch():
+                groups[request.key].append(request)
+            for (_, imgsz, rgb, kwargs), requests in groups.items():
+                try:
+                    results = self.model.predict_batch(
+                        [r.image for r in requests], imgsz, rgb, **dict(kwargs)
+                    )
+                    for request, result in zip(requests, results):
+                        request.result = np.ascontiguousarray(result.data)
+                except Exception as e:
+                    logger.exception("Layout prediction failed")
+                    for request in requests:
+                        request.error = e
+                for request in requests:
+                    request.done.set()
+
+
+class LayoutClient(DocLayoutModel):
+    """
+    Layout model served by a ``LayoutServer``.
+
+    Each thread opens its own connection on first use.
+
+    Args:
+        address: Path of the server's Unix socket.
+        authkey: Key to authenticate with, ``get_authkey()`` if None.
+    """
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None):
+        self.address = address
+        self.authkey = get_authkey() if authkey is None else authkey
+        self._local = threading.local()
+        self._stride = None
+        self._names = None
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, authkey=self.authkey)
+            header = recv_header(conn)
+            self._stride = header["stride"]
+            self._names = ast.literal_eval(header["names"])
+        return conn
+
+    @property
+    def stride(self) -> int:
+        if self._stride is None:
+            self._connection()
+        return self._stride
+
+    def predict(self, image, imgsz=1024, rgb=False, **kwargs):
+        unknown = set(kwargs) - PREDICT_ARGS
+        if unknown:
+            raise TypeError(f"Unknown layout prediction arguments: {sorted(unknown)}")
+        conn = self._connection()
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        header = {"shape": image.shape, "imgsz": imgsz, "rgb": rgb, "kwargs": kwargs}
+        try:
+            send_header(conn, header)
+            conn.send_bytes(memoryview(image).cast("B"))
+            header = recv_header(conn)
+            if "error" in header:
+                raise RuntimeError(f"Layout server error: {header['error']}")
+            boxes = np.frombuffer(conn.recv_bytes(), np.float32)
+        except (EOFError, OSError):
+            # Reconnect on the next page, the server may have been restarted
+            self._local.conn = None
+            conn.close()
+            raise
+        return [YoloResult(boxes=boxes.reshape(header["shape"]), names=self._names)]
+
+
+def send_header(conn: Connection, header: dict) -> None:
+    conn.send_bytes(json.dumps(header).encode())
+
+
+def recv_header(conn: Connection) -> dict:
+    return json.loads(conn.recv_bytes())
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--address",
+        type=str,
+        default=default_address(),
+        help="Unix socket to listen on, in the user's runtime directory by default.",
+    )
+    parser.add_argument(
+        "--onnx", type=str, help="Custom ONNX model path, the default model if omitted."
+    )
+    parser.add_argument(
+        "--max-batch", type=int, default=8, help="Largest batch of pages."
+    )
+    parser.add_argument(
+        "--max-wait",
+        type=float,
+        default=0.01,
+        help="Seconds to wait for more pages before running a batch.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Threads running batches."
+    )
+    parser.add_argument(
+        "--onnx-threads", type=int, help="Threads used inside an operator."
+    )
+    return parser
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parsed_args = create_parser().parse_args(args)
+    settings = {"intra_op_threads": parsed_args.onnx_threads}
+    if parsed_args.onnx:
+        model = OnnxModel(parsed_args.onnx, **settings)
+    else:
+        model = OnnxModel.load_available(**settings)
+    server = LayoutServer(
+        model,
+        parsed_args.address,
+        max_batch=parsed_args.max_batch,
+        max_wait=parsed_args.max_wait,
+        workers=parsed_args.workers,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -36,7 +36,7 @@ def create_mcp_app() -> FastMCP:
                 lang_in=lang_in,
                 lang_out=lang_out,
                 service="google",
-                model=ModelInstance.value,
+                model=ModelInstance.get(),
                 thread=4,
             )
         await ctx.log(level="info", message="translate complete")
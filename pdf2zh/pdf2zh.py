@@ -13,7 +13,7 @@ from typing import List, Optional
 
 from pdf2zh import __version__, log
 from pdf2zh.high_level import translate, download_remote_fonts
-from pdf2zh.doclayout import OnnxModel, ModelInstance
+from pdf2zh.doclayout import ModelInstance
 import os
 
 from pdf2zh.config import ConfigManager
@@ -152,6 +152,38 @@ def create_parser() -> argparse.ArgumentParser:
         help="custom onnx model path.",
     )
 
+    parse_params.add_argument(
+        "--onnx-threads",
+        type=int,
+        help="Number of threads used by the layout model inside an operator.",
+    )
+
+    parse_params.add_argument(
+        "--onnx-inter-threads",
+        type=int,
+        help="Number of threads used by the layout model across operators.",
+    )
+
+    parse_params.add_argument(
+        "--onnx-execution-mode",
+        type=str,
+        choices=["sequential", "parallel"],
+        help="ONNX Runtime execution mode of the layout model.",
+    )
+
+    parse_params.add_argument(
+        "--onnx-optimization",
+        type=str,
+        choices=["disable", "basic", "extended", "all"],
+        help="ONNX Runtime graph optimization level of the layout model.",
+    )
+
+    parse_params.add_argument(
+        "--onnx-cache",
+        type=str,
+        help="File to keep the optimized layout model in for the next start.",
+    )
+
     parse_params.add_argument(
         "--serverport",
         type=int,
@@ -191,6 +223,13 @@ def create_parser() -> argparse.ArgumentParser:
         help="Ignore cache and force retranslation.",
     )
 
+    parse_params.add_argument(
+        "--reflow",
+        action="store_true",
+        help="Shrink the font size of paragraphs that overflow their box "
+        "and lay them out again.",
+    )
+
     parse_params.add_argument(
         "--mcp", action="store_true", help="Launch pdf2zh MCP server in STDIO mode"
     )
@@ -279,10 +318,14 @@ def main(args: Optional[List[str]] = None) -> int:
     if parsed_args.debug:
         log.setLevel(logging.DEBUG)
 
-    if parsed_args.onnx:
-        ModelInstance.value = OnnxModel(parsed_args.onnx)
-    else:
-        ModelInstance.value = OnnxModel.load_available()
+    onnx_settings = {
+        "intra_op_threads": parsed_args.onnx_threads,
+        "inter_op_threads": parsed_args.onnx_inter_threads,
+        "execution_mode": parsed_args.onnx_execution_mode,
+        "graph_optimization": parsed_args.onnx_optimization,
+        "optimized_model_path": parsed_args.onnx_cache,
+    }
+    ModelInstance.configure(parsed_args.onnx, **onnx_settings)
 
     if parsed_args.interactive:
         from pdf2zh.gui import setup_gui
@@ -350,10 +393,10 @@ def main(args: Optional[List[str]] = None) -> int:
     if parsed_args.dir:
         untranlate_file = find_all_files_in_directory(parsed_args.files[0])
         parsed_args.files = untranlate_file
-        translate(model=ModelInstance.value, **vars(parsed_args))
+        translate(model=ModelInstance.get(), **vars(parsed_args))
         return 0
 
-    translate(model=ModelInstance.value, **vars(parsed_args))
+    translate(model=ModelInstance.get(), **vars(parsed_args))
     return 0
 
 
@@ -1,5 +1,15 @@
 import logging
-from typing import Any, Dict, Optional, Sequence, Tuple, cast
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
 import numpy as np
 
 from pdfminer import settings
@@ -8,7 +18,6 @@ from pdfminer.pdfdevice import PDFDevice
 from pdfminer.pdfinterp import (
     PDFPageInterpreter,
     PDFResourceManager,
-    PDFContentParser,
     PDFInterpreterError,
     Color,
     PDFStackT,
@@ -24,8 +33,8 @@ from pdfminer.pdftypes import (
     resolve1,
     stream_value,
 )
-from pdfminer.psexceptions import PSEOF
 from pdfminer.psparser import (
+    KWD,
     PSKeyword,
     keyword_name,
     literal_name,
@@ -38,6 +47,8 @@ from pdfminer.utils import (
     apply_matrix_pt,
 )
 
+from pdf2zh.contentparser import ContentParser
+
 log = logging.getLogger(__name__)
 
 
@@ -48,6 +59,34 @@ def safe_float(o: Any) -> Optional[float]:
         return None
 
 
+def encode_ops(ops: str) -> bytes:
+    # PDF 指令流按 latin-1 编码，无法编码时退回 utf-8
+    try:
+        return ops.encode("latin-1")
+    except UnicodeEncodeError:
+        log.warning(
+            "Found non-latin-1 characters in PDF stream, using fallback encoding"
+        )
+        return ops.encode("utf-8", errors="replace")
+
+
+def iter_objects(data: bytes) -> Iterator[Tuple[int, object]]:
+    # 逐个解析指令流中的操作数和操作符，遇到少见的写法时由 pdfminer 接管
+    return iter(ContentParser(data))
+
+
+def encode_op(name: str, args: Sequence[object]) -> bytes:
+    # 重新序列化操作数和操作符，浮点数输出 6 位小数，去掉 PSLiteral 的引号
+    p = " ".join(
+        [(f"{x:f}" if isinstance(x, float) else str(x).replace("'", "")) for x in args]
+    )
+    return encode_ops(f"{p} {name} ")
+
+
+# 指令输出方式：丢弃、原样复制原始字节、按处理函数返回值重新序列化
+EMIT_DROP, EMIT_RAW, EMIT_REWRITE = 0, 1, 2
+
+
 class PDFPageInterpreterEx(PDFPageInterpreter):
     """Processor for the content of a PDF page
 
@@ -60,9 +99,54 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
         self.rsrcmgr = rsrcmgr
         self.device = device
         self.obj_patch = obj_patch
+        # 文档级的 Form XObject 缓存：objid -> 解析后的指令序列，(objid, CTM) -> 渲染结果
+        self.form_objects: Dict[int, Tuple[bytes, list]] = {}
+        self.form_patches: Dict[
+            Tuple[int, Matrix], Tuple[Optional[bytes], Any, Any]
+        ] = {}
 
     def dup(self) -> "PDFPageInterpreterEx":
-        return self.__class__(self.rsrcmgr, self.device, self.obj_patch)
+        interpreter = self.__class__(self.rsrcmgr, self.device, self.obj_patch)
+        interpreter.form_objects = self.form_objects
+        interpreter.form_patches = self.form_patches
+        return interpreter
+
+    # 处理函数返回值需要替换原指令的指令，其余保留的指令直接复制原始字节
+    rewrite_operators = {"S"}
+
+    # 每个类只构建一次的指令分派表：关键字 -> (指令名, 处理函数, 参数个数, 输出方式)
+    _dispatch_tables: Dict[type, Dict[PSKeyword, Tuple[str, Callable, int, int]]] = {}
+
+    @classmethod
+    def dispatch_table(cls) -> Dict[PSKeyword, Tuple[str, Callable, int, int]]:
+        table = PDFPageInterpreterEx._dispatch_tables.get(cls)
+        if table is not None:
+            return table
+        table = {}
+        for method in dir(cls):
+            if not method.startswith("do_"):
+                continue
+            func = getattr(cls, method)
+            if not callable(func):
+                continue
+            name = method[3:].replace("_a", "*").replace("_w", '"').replace("_q", "'")
+            nargs = func.__code__.co_argcount - 1
+            if nargs:
+                # 过滤 T 系列文字指令，因为 EI 的参数是 obj 所以也需要过滤（只在少数文档中画横线时使用），过滤 marked 系列指令
+                emit = not (
+                    name[0] == "T" or name in ['"', "'", "EI", "MP", "DP", "BMC", "BDC"]
+                )
+            else:
+                emit = not (name[0] == "T" or name in ["BI", "ID", "EMC"])
+            if not emit:
+                emit = EMIT_DROP
+            elif name in cls.rewrite_operators:
+                emit = EMIT_REWRITE
+            else:
+                emit = EMIT_RAW
+            table[KWD(name.encode("latin-1"))] = (name, func, nargs, emit)
+        PDFPageInterpreterEx._dispatch_tables[cls] = table
+        return table
 
     def init_resources(self, resources: Dict[object, object]) -> None:
         # 重载设置 fontid 和 descent
@@ -217,15 +301,30 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
                 resources = dict_value(xobjres)
             else:
                 resources = self.resources.copy()
-            self.device.begin_figure(xobjid, bbox, matrix)
             ctm = mult_matrix(matrix, self.ctm)
-            ops_base = interpreter.render_contents(
-                resources,
-                [xobj],
-                ctm=ctm,
-            )
+            objid = self.xobjmap[xobjid].objid
+            # 同一文档内同一个 Form 在相同 CTM 下的结果不变，直接复用
+            key = (objid, tuple(round(v, 3) for v in ctm))
+            cacheable = objid is not None
+            if cacheable and xobjres and key in self.form_patches:
+                patch, self.ncs, self.scs = self.form_patches[key]
+                if patch is not None:
+                    self.obj_patch[objid] = patch
+                return
+            # CTM 不同时复用解析好的指令序列，只重新执行和排版
+            parsed = self.form_objects.get(objid) if cacheable else None
+            if parsed is None:
+                data = xobj.get_data()
+                parsed = (data, list(iter_objects(data)))
+                if cacheable:
+                    self.form_objects[objid] = parsed
+            self.device.begin_figure(xobjid, bbox, matrix)
+            interpreter.init_resources(resources)
+            interpreter.init_state(ctm)
+            ops_base = interpreter.execute_objects(*parsed)
             self.ncs = interpreter.ncs
             self.scs = interpreter.scs
+            patch = None
             try:  # 有的时候 form 字体加不上这里会烂掉
                 self.device.fontid = interpreter.fontid
                 self.device.fontmap = interpreter.fontmap
@@ -238,11 +337,17 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
                     pos_inv = -np.mat(ctm[4:]) * ctm_inv
                 a, b, c, d = ctm_inv.reshape(4).tolist()
                 e, f = pos_inv.tolist()[0]
-                self.obj_patch[self.xobjmap[xobjid].objid] = (
-                    f"q {ops_base}Q {a} {b} {c} {d} {e} {f} cm {ops_new}"
+                patch = b"q %bQ %b cm %b" % (
+                    ops_base,
+                    f"{a} {b} {c} {d} {e} {f}".encode(),
+                    ops_new,
                 )
+                self.obj_patch[objid] = patch
             except Exception:
                 pass
+            # 沿用页面资源的旧式 Form 结果取决于调用位置，不缓存
+            if cacheable and xobjres:
+                self.form_patches[key] = (patch, self.ncs, self.scs)
         elif subtype is LITERAL_IMAGE and "Width" in xobj and "Height" in xobj:
             self.device.begin_figure(xobjid, (0, 0, 1, 1), MATRIX_IDENTITY)
             self.device.render_image(xobjid, xobj)
@@ -272,17 +377,18 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
         ops_new = self.device.end_page(page)
         # 上面渲染的时候会根据 cropbox 减掉页面偏移得到真实坐标，这里输出的时候需要用 cm 把页面偏移加回来
         self.obj_patch[page.page_xref] = (
-            f"q {ops_base}Q 1 0 0 1 {x0} {y0} cm {ops_new}"  # ops_base 里可能有图，需要让 ops_new 里的文字覆盖在上面，使用 q/Q 重置位置矩阵
+            b"q %bQ 1 0 0 1 %b %b cm %b"  # ops_base 里可能有图，需要让 ops_new 里的文字覆盖在上面，使用 q/Q 重置位置矩阵
+            % (ops_base, str(x0).encode(), str(y0).encode(), ops_new)
         )
         for obj in page.contents:
-            self.obj_patch[obj.objid] = ""
+            self.obj_patch[obj.objid] = b""
 
     def render_contents(
         self,
         resources: Dict[object, object],
         streams: Sequence[object],
         ctm: Matrix = MATRIX_IDENTITY,
-    ) -> None:
+    ) -> bytes:
         # 重载返回指令流
         """Render the content streams.
 
@@ -298,69 +404,48 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
         self.init_state(ctm)
         return self.execute(list_value(streams))
 
-    def execute(self, streams: Sequence[object]) -> None:
-        # 重载返回指令流
-        ops = ""
-        try:
-            parser = PDFContentParser(streams)
-        except PSEOF:
-            # empty page
-            return
-        while True:
-            try:
-                (_, obj) = parser.nextobject()
-            except PSEOF:
-                break
+    def execute(self, streams: Sequence[object]) -> bytes:
+        # 重载返回指令流：保留的指令直接复制原始字节，只有需要改写的指令才重新序列化
+        # 多个内容流以空白分隔拼接成一个缓冲区，这样解析出的位置都是全局偏移
+        data = b"\n".join(stream_value(strm).get_data() for strm in streams)
+        return self.execute_objects(data, iter_objects(data))
+
+    def execute_objects(self, data: bytes, objs: Iterable[Tuple[int, object]]) -> bytes:
+        # 执行解析好的 (位置, 对象) 序列，位置是 data 中的偏移
+        ops = bytearray()
+        view = memoryview(data)
+        table = self.dispatch_table()
+        starts = []  # 与参数栈平行，记录每个参数的起始位置
+        for pos, obj in objs:
             if isinstance(obj, PSKeyword):
-                name = keyword_name(obj)
-                method = "do_%s" % name.replace("*", "_a").replace('"', "_w").replace(
-                    "'",
-                    "_q",
-                )
-                if hasattr(self, method):
-                    func = getattr(self, method)
-                    nargs = func.__code__.co_argcount - 1
-                    if nargs:
-                        args = self.pop(nargs)
-                        # log.debug("exec: %s %r", name, args)
-                        if len(args) == nargs:
-                            func(*args)
-                            if not (
-                                name[0] == "T"
-                                or name in ['"', "'", "EI", "MP", "DP", "BMC", "BDC"]
-                            ):  # 过滤 T 系列文字指令，因为 EI 的参数是 obj 所以也需要过滤（只在少数文档中画横线时使用），过滤 marked 系列指令
-                                p = " ".join(
-                                    [
-                                        (
-                                            f"{x:f}"
-                                            if isinstance(x, float)
-                                            else str(x).replace("'", "")
-                                        )
-                                        for x in args
-                                    ]
-                                )
-                                ops += f"{p} {name} "
-                    else:
-                        # log.debug("exec: %s", name)
-                        targs = func()
-                        if targs is None:
-                            targs = []
-                        if not (name[0] == "T" or name in ["BI", "ID", "EMC"]):
-                            p = " ".join(
-                                [
-                                    (
-                                        f"{x:f}"
-                                        if isinstance(x, float)
-                                        else str(x).replace("'", "")
-                                    )
-                                    for x in targs
-                                ]
-                            )
-                            ops += f"{p} {name} "
-                elif settings.STRICT:
-                    error_msg = "Unknown operator: %r" % name
-                    raise PDFInterpreterError(error_msg)
+                entry = table.get(obj)
+                if entry is None:
+                    if settings.STRICT:
+                        error_msg = "Unknown operator: %r" % keyword_name(obj)
+                        raise PDFInterpreterError(error_msg)
+                    continue
+                name, func, nargs, emit = entry
+                if nargs:
+                    args = self.pop(nargs)
+                    # log.debug("exec: %s %r", name, args)
+                    if len(args) != nargs:
+                        del starts[len(self.argstack) :]
+                        continue
+                    targs = func(self, *args)
+                else:
+                    # log.debug("exec: %s", name)
+                    targs = func(self)
+                # 指令的原始字节从被弹出的第一个参数开始，到关键字结束
+                depth = len(self.argstack)
+                start = starts[depth] if depth < len(starts) else pos
+                del starts[depth:]
+                if emit == EMIT_RAW or (emit == EMIT_REWRITE and targs is None):
+                    ops += view[start : pos + len(obj.name)]
+                    ops += b" "
+                elif emit == EMIT_REWRITE:
+                    ops += encode_op(name, targs)
             else:
                 self.push(obj)
+                starts.append(pos)
         # print('REV DATA',ops)
-        return ops
+        return bytes(ops)
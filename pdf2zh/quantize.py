@@ -0,0 +1,229 @@
+"""Convert the layout model to INT8 and check it against the fp32 model.
+
+Usage::
+
+    pdf2zh-quantize sample1.pdf sample2.pdf [--mode static] [-o model.int8.onnx]
+
+The quantized model is written next to the fp32 model by default, where it is
+picked up when ``ONNX_MODEL_PRECISION`` is set to ``int8``. Sample pages are
+used to calibrate activation ranges (static mode) and to compare the boxes
+detected by both models. The command fails when too few fp32 boxes are found
+again by the INT8 model.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+import pymupdf
+from babeldoc.assets.assets import get_doclayout_onnx_model_path
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+
+from pdf2zh.config import ConfigManager
+from pdf2zh.doclayout import OnnxModel, box_iou, quantized_model_path
+from pdf2zh.raster import render_page
+
+logger = logging.getLogger(__name__)
+
+
+def sample_pages(
+    files: Iterable[str],
+    pages: int,
+    pixel_budget: int = 1024 * 1024,
+    max_scale: float = 1.0,
+    gray: bool = False,
+) -> Iterator[np.ndarray]:
+    """
+    Render up to ``pages`` pages of each file with ``render_page``, as RGB or
+    gray images like the ones translate_patch passes to the model.
+    """
+    for file in files:
+        with pymupdf.open(file) as doc:
+            for page in list(doc)[:pages]:
+                yield render_page(page, pixel_budget, max_scale, gray)[0]
+
+
+def page_size(image: np.ndarray) -> int:
+    return int(image.shape[0] / 32) * 32
+
+
+def load_model(model_path: str) -> OnnxModel:
+    """
+    Load a model without the optimized graph cache of
+    ``ONNX_OPTIMIZED_MODEL_PATH``, so that each model runs its own graph and
+    none is left in the cache.
+    """
+    return OnnxModel(model_path, optimized_model_path="")
+
+
+class PageReader(CalibrationDataReader):
+    """Feed preprocessed sample pages to the static quantization calibrator."""
+
+    def __init__(self, model: OnnxModel, images: List[np.ndarray]):
+        self.inputs = iter(
+            {"images": model.preprocess(image, page_size(image), rgb=True)}
+            for image in images
+        )
+
+    def get_next(self) -> Optional[dict]:
+        return next(self.inputs, None)
+
+
+def quantize(
+    model_path: str,
+    output_path: str,
+    images: List[np.ndarray],
+    mode: str = "static",
+) -> None:
+    """
+    Quantize a DocLayout-YOLO model to INT8.
+
+    Args:
+        model_path: Path of the fp32 model.
+        output_path: Path to write the INT8 model to.
+        images: Sample pages used to calibrate activations in static mode.
+        mode: "static" (QDQ, calibrated on ``images``) or "dynamic".
+    """
+    if mode == "dynamic":
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+    elif mode == "static":
+        quantize_static(
+            model_path,
+            output_path,
+            PageReader(load_model(model_path), images),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    else:
+        raise ValueError(f"Unknown quantization mode {mode!r}")
+
+
+def compare(
+    reference: OnnxModel,
+    candidate: OnnxModel,
+    images: Iterable[np.ndarray],
+    iou: float = 0.5,
+) -> dict:
+    """
+    Compare the boxes found by two models on the same pages.
+
+    A reference box is matched by the best overlapping candidate box of the
+    same class with at least ``iou`` overlap, each candidate box matching once.
+
+    Returns:
+        Number of reference and candidate boxes, the share of reference boxes
+        matched (recall), the share of candidate boxes matched (precision) and
+        the mean IoU of the matched pairs.
+    """
+    matched, ious = 0, []
+    n_ref = n_cand = 0
+    for image in images:
+        imgsz = page_size(image)
+        ref = reference.predict(image, imgsz=imgsz, rgb=True)[0]
+        cand = candidate.predict(image, imgsz=imgsz, rgb=True)[0]
+        n_ref += len(ref)
+        n_cand += len(cand)
+        if not len(ref) or not len(cand):
+            continue
+        overlap = box_iou(ref.xyxy.astype(np.float64), cand.xyxy.astype(np.float64))
+        overlap[ref.cls[:, None] != cand.cls[None, :]] = 0
+        for i in range(len(ref)):  # boxes are sorted by confidence
+            j = int(np.argmax(overlap[i]))
+            if overlap[i, j] >= iou:
+                matched += 1
+                ious.append(overlap[i, j])
+                overlap[:, j] = 0
+    return {
+        "reference_boxes": n_ref,
+        "candidate_boxes": n_cand,
+        "recall": matched / n_ref if n_ref else 1.0,
+        "precision": matched / n_cand if n_cand else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+    }
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("samples", nargs="+", help="Sample PDF files.")
+    parser.add_argument(
+        "--model", type=str, help="fp32 model path, the default model if omitted."
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        help="INT8 model path, next to the model if omitted.",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["static", "dynamic"],
+        default="static",
+        help="Static quantization is calibrated on the samples and runs faster.",
+    )
+    parser.add_argument(
+        "--pages", type=int, default=5, help="Pages used from each sample file."
+    )
+    parser.add_argument(
+        "--min-recall",
+        type=float,
+        default=0.9,
+        help="Share of fp32 boxes the INT8 model has to find again.",
+    )
+    return parser
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parsed_args = create_parser().parse_args(args)
+
+    model_path = parsed_args.model or get_doclayout_onnx_model_path()
+    output_path = parsed_args.output or quantized_model_path(model_path)
+    # Rendered with the settings of translate_patch, see LAYOUT_PIXEL_BUDGET
+    images = list(
+        sample_pages(
+            parsed_args.samples,
+            parsed_args.pages,
+            int(ConfigManager.get("LAYOUT_PIXEL_BUDGET") or 1024 * 1024),
+            float(ConfigManager.get("LAYOUT_MAX_SCALE") or 1.0),
+            str(ConfigManager.get("LAYOUT_GRAYSCALE")).lower() in ("1", "true"),
+        )
+    )
+    if not images:
+        logger.error("No sample pages found")
+        return 1
+
+    logger.info(f"Quantizing {model_path} ({parsed_args.mode})")
+    quantize(model_path, output_path, images, mode=parsed_args.mode)
+    logger.info(
+        f"Wrote {output_path}: {os.path.getsize(model_path) / 1e6:.1f} MB -> "
+        f"{os.path.getsize(output_path) / 1e6:.1f} MB"
+    )
+
+    stats = compare(load_model(model_path), load_model(output_path), images)
+    logger.info(
+        f"{len(images)} pages, {stats['reference_boxes']} fp32 boxes, "
+        f"{stats['candidate_boxes']} int8 boxes, recall {stats['recall']:.3f}, "
+        f"precision {stats['precision']:.3f}, mean IoU {stats['mean_iou']:.3f}"
+    )
+    if stats["recall"] < parsed_args.min_recall:
+        logger.error(
+            f"INT8 model found {stats['recall']:.1%} of the fp32 boxes, "
+            f"below {parsed_args.min_recall:.0%}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
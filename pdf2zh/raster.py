@@ -0,0 +1,184 @@
+"""Render pages for layout analysis, inline or in worker processes.
+
+``PageRasterizer`` shares the document with a pool of worker processes, each
+of which opens it read-only and renders pages ahead of the caller into shared
+memory. The caller gets NumPy views of the shared buffers, so the pixels are
+not copied again on their way to the layout model. The pool is kept for the
+next document.
+"""
+
+import concurrent.futures
+import itertools
+import multiprocessing
+import threading
+from collections import deque
+from multiprocessing.shared_memory import SharedMemory
+from typing import Deque, Iterator, List, Optional, Tuple
+
+import numpy as np
+from pymupdf import Document, Matrix, Page, csGRAY, csRGB
+
+
+def render_page(
+    page: Page, pixel_budget: int, max_scale: float = 1.0, gray: bool = False
+) -> Tuple[np.ndarray, float]:
+    """Render a page for layout analysis.
+
+    The page is rendered at 72 dpi, or smaller if that would take more than
+    ``pixel_budget`` pixels, and at most at ``max_scale`` times 72 dpi.
+
+    Returns:
+        The RGB image (or single channel if ``gray``), and its scale to PDF
+        points.
+    """
+    rect = page.rect
+    scale = min(max_scale, (pixel_budget / max(rect.width * rect.height, 1)) ** 0.5)
+    pix = page.get_pixmap(
+        matrix=Matrix(scale, scale), colorspace=csGRAY if gray else csRGB
+    )
+    image = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width, -1)
+    return (image[:, :, 0] if gray else image), scale
+
+
+# Document last opened by a worker process, with the name of its buffer
+_document: Tuple[Optional[str], Optional[Document]] = (None, None)
+
+# Worker processes are kept between documents, they take a while to start
+_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _render(stream: str, size: int, pageno: int, *args) -> Tuple[str, tuple, float]:
+    """Render a page into a new shared memory block and return its name."""
+    global _document
+    if _document[0] != stream:
+        shm = SharedMemory(stream)
+        _document = (stream, Document(stream=bytes(shm.buf[:size])))
+        shm.close()
+    image, scale = render_page(_document[1][pageno], *args)
+    shm = SharedMemory(create=True, size=max(image.nbytes, 1))
+    np.ndarray(image.shape, np.uint8, shm.buf)[:] = image
+    shm.close()
+    return shm.name, image.shape, scale
+
+
+def get_executor(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """Return the shared pool of ``workers`` rendering processes."""
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor._max_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                workers,
+                # Forking a process that runs ONNX Runtime threads is not safe
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+class PageRasterizer:
+    """
+    Render pages of a document in page order.
+
+    Args:
+        document: The document, rendered directly if there are no workers.
+        pages: Page numbers to render, in the order they are read.
+        workers: Worker processes, pages are rendered inline if 0.
+        stream: ``document`` as PDF bytes for the workers, saved from it if
+            None.
+        pixel_budget, max_scale, gray: See ``render_page``.
+        prefetch: Pages rendered ahead of the one being read, per worker.
+    """
+
+    def __init__(
+        self,
+        document: Document,
+        pages: List[int],
+        workers: int = 0,
+        stream: Optional[bytes] = None,
+        pixel_budget: int = 1024 * 1024,
+        max_scale: float = 1.0,
+        gray: bool = False,
+        prefetch: int = 2,
+    ):
+        self.document = document
+        self.pages = pages
+        self.workers = workers
+        self.stream = stream
+        self.args = (pixel_budget, max_scale, gray)
+        self.prefetch = prefetch
+        self.executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        # The document, shared with the workers
+        self.shm: Optional[SharedMemory] = None
+        # Pages submitted to the workers and not read yet
+        self.pending: Deque[Tuple[int, concurrent.futures.Future]] = deque()
+        self.iterator: Optional[Iterator[Tuple[int, np.ndarray, float]]] = None
+
+    def __enter__(self) -> "PageRasterizer":
+        if self.workers > 0:
+            if self.stream is None:
+                self.stream = self.document.tobytes()
+            self.executor = get_executor(self.workers)
+            self.shm = SharedMemory(create=True, size=max(len(self.stream), 1))
+            self.shm.buf[: len(self.stream)] = self.stream
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.iterator is not None:
+            self.iterator.close()  # releases the pages handed out
+        if self.executor is None:
+            return
+        for _, future in self.pending:
+            future.cancel()
+        for _, future in self.pending:  # rendered but never read
+            if not future.cancelled() and future.exception() is None:
+                _release(SharedMemory(future.result()[0]))
+        self.pending.clear()
+        _release(self.shm)
+
+    def _submit(self, pages: Iterator[int], count: int) -> None:
+        for pageno in itertools.islice(pages, count):
+            future = self.executor.submit(
+                _render, self.shm.name, len(self.stream), pageno, *self.args
+            )
+            self.pending.append((pageno, future))
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray, float]]:
+        """
+        Yield the page number, image and scale of each page.
+
+        With workers, the image is a view of shared memory. It stays valid
+        until the page after the next one is requested.
+        """
+        self.iterator = self._render_pages()
+        return self.iterator
+
+    def _render_pages(self) -> Iterator[Tuple[int, np.ndarray, float]]:
+        if self.executor is None:
+            for pageno in self.pages:
+                yield (pageno, *render_page(self.document[pageno], *self.args))
+            return
+        pages = iter(self.pages)
+        self._submit(pages, self.workers * self.prefetch)
+        held: List[SharedMemory] = []  # pages handed out and maybe still in use
+        try:
+            while self.pending:
+                pageno, future = self.pending.popleft()
+                name, shape, scale = future.result()
+                held.append(SharedMemory(name))
+                self._submit(pages, 1)  # keep the workers busy
+                yield pageno, np.ndarray(shape, np.uint8, held[-1].buf), scale
+                while len(held) > 1:  # the caller has moved on to a later page
+                    _release(held.pop(0))
+        finally:
+            for shm in held:
+                _release(shm)
+
+
+def _release(shm: SharedMemory) -> None:
+    try:
+        shm.close()
+    except BufferError:  # still referenced, unmapped when the view is freed
+        pass
+    shm.unlink()
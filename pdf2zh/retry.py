@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from tenacity import (
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_random_exponential,
+)
+
+from pdf2zh.config import ConfigManager
+
+logger = logging.getLogger(__name__)
+
+# Status codes that are worth retrying, everything else below 500 is fatal
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+# Errors raised by our own code for bad configuration or bad responses
+FATAL_EXCEPTIONS = (
+    ValueError,
+    TypeError,
+    KeyError,
+    AttributeError,
+    NotImplementedError,
+    ImportError,
+)
+
+
+def _config(key: str, default, cast):
+    # Read without a default so that unset keys are not written back to config.json
+    value = ConfigManager.get(key)
+    return default if value is None else cast(value)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+
+def get_status_code(e: BaseException) -> Optional[int]:
+    """Return the HTTP status code carried by an SDK or requests exception."""
+    for holder in (e, getattr(e, "response", None)):
+        for attr in ("status_code", "http_status_code", "status"):
+            code = getattr(holder, attr, None)
+            if isinstance(code, int):
+                return code
+    return None
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Classify an exception raised by a translator as transient or fatal.
+
+    Throttling, timeouts and 5xx responses are transient. Other 4xx responses
+    (bad request, authentication, permissions) and configuration errors are
+    fatal and would fail the same way on every attempt.
+    """
+    if not isinstance(e, Exception) or isinstance(e, CircuitOpenError):
+        return False
+    code = get_status_code(e)
+    if code is not None:
+        return code in RETRYABLE_STATUS or code >= 500
+    return not isinstance(e, FATAL_EXCEPTIONS)
+
+
+class CircuitBreaker:
+    """Per-service circuit breaker over a sliding window of call outcomes.
+
+    The circuit opens when at least ``min_calls`` of the last ``window`` calls
+    were made and the share of failures reaches ``failure_rate``. While open,
+    calls fail fast with :class:`CircuitOpenError`. After ``cooldown`` seconds
+    a single probe call is let through; its outcome closes or reopens the
+    circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    _registry: Dict[str, "CircuitBreaker"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        failure_rate: float = 0.5,
+        min_calls: int = 5,
+        cooldown: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.outcomes = deque(maxlen=window)  # True marks a failed call
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name: str) -> "CircuitBreaker":
+        """Return the breaker shared by all jobs calling ``name``."""
+        with cls._registry_lock:
+            breaker = cls._registry.get(name)
+            if breaker is None:
+                breaker = cls._registry[name] = cls(
+                    name,
+                    window=_config("BREAKER_WINDOW", 20, int),
+                    failure_rate=_config("BREAKER_FAILURE_RATE", 0.5, float),
+                    min_calls=_config("BREAKER_MIN_CALLS", 5, int),
+                    cooldown=_config("BREAKER_COOLDOWN", 30.0, float),
+                )
+            return breaker
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if (
+                self.state == self.OPEN
+                and self.clock() - self.opened_at >= self.cooldown
+            ):
+                self.state = self.HALF_OPEN  # let a single probe call through
+                return
+            raise CircuitOpenError(f"Circuit breaker for {self.name} is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self.outcomes.clear()
+            self.outcomes.append(False)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.outcomes.append(True)
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED
+                and len(self.outcomes) >= self.min_calls
+                and sum(self.outcomes) >= self.failure_rate * len(self.outcomes)
+            ):
+                if self.state == self.CLOSED:
+                    logger.warning(f"Circuit breaker for {self.name} opened")
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class RetryPolicy:
+    """Bounded retry with exponential backoff and full jitter."""
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        initial_wait: float = 1.0,
+        max_wait: float = 10.0,
+        max_delay: float = 60.0,
+    ):
+        self.max_attempts = max_attempts
+        self.initial_wait = initial_wait
+        self.max_wait = max_wait
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=_config("RETRY_MAX_ATTEMPTS", 5, int),
+            initial_wait=_config("RETRY_INITIAL_WAIT", 1.0, float),
+            max_wait=_config("RETRY_MAX_WAIT", 10.0, float),
+            max_delay=_config("RETRY_MAX_DELAY", 60.0, float),
+        )
+
+    def retrying(self) -> Retrying:
+        return Retrying(
+            retry=retry_if_exception(is_retryable),
+            stop=stop_after_attempt(self.max_attempts)
+            | stop_after_delay(self.max_delay),
+            wait=wait_random_exponential(
+                multiplier=self.initial_wait, max=self.max_wait
+            ),
+            before_sleep=lambda retry_state: logger.warning(
+                f"{retry_state.outcome.exception()!r}, retrying in "
+                f"{retry_state.next_action.sleep:.1f} seconds... "
+                f"(Attempt {retry_state.attempt_number}/{self.max_attempts})"
+            ),
+            reraise=True,
+        )
+
+    def call(self, breaker: Optional[CircuitBreaker], fn: Callable, *args, **kwargs):
+        """Call ``fn`` under this policy, reporting each attempt to ``breaker``.
+
+        Only transient errors count as failures of the service. A fatal error,
+        such as a rejected paragraph or a wrong API key, is an answer of a
+        healthy service to one bad request and counts as a success.
+        """
+
+        def attempt():
+            if breaker is None:
+                return fn(*args, **kwargs)
+            breaker.before_call()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                raise
+            breaker.record_success()
+            return result
+
+        return self.retrying()(attempt)
@@ -25,11 +25,6 @@ from pdf2zh.cache import TranslationCache
 from pdf2zh.config import ConfigManager
 
 
-from tenacity import retry, retry_if_exception_type
-from tenacity import stop_after_attempt
-from tenacity import wait_exponential
-
-
 logger = logging.getLogger(__name__)
 
 
@@ -102,6 +97,16 @@ class BaseTranslator:
         self.cache.set(text, translation)
         return translation
 
+    def get_cached(self, texts: list[str]) -> dict[str, str]:
+        """
+        Look up the cached translations of many texts at once.
+        :param texts: texts to translate
+        :return: cached translations by text, empty if the cache is ignored
+        """
+        if self.ignore_cache:
+            return {}
+        return self.cache.get_many(texts)
+
     def do_translate(self, text: str) -> str:
         """
         Actual translate text, override this method
@@ -433,15 +438,6 @@ class OpenAITranslator(BaseTranslator):
         self.add_cache_impact_parameters("think_filter_regex", think_filter_regex)
         self.think_filter_regex = re.compile(think_filter_regex, flags=re.DOTALL)
 
-    @retry(
-        retry=retry_if_exception_type(openai.RateLimitError),
-        stop=stop_after_attempt(100),
-        wait=wait_exponential(multiplier=1, min=1, max=15),
-        before_sleep=lambda retry_state: logger.warning(
-            f"RateLimitError, retrying in {retry_state.next_action.sleep} seconds... "
-            f"(Attempt {retry_state.attempt_number}/100)"
-        ),
-    )
     def do_translate(self, text) -> str:
         response = self.client.chat.completions.create(
             model=self.model,
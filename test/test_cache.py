@@ -1,4 +1,9 @@
+import os
+import sqlite3
+import tempfile
 import unittest
+from unittest import mock
+
 from pdf2zh import cache
 import threading
 import multiprocessing
@@ -6,6 +11,13 @@ import random
 import string
 
 
+def stored_params_id(cache_instance):
+    # The id the instance writes with, added as on its first write
+    return cache.backend.params_id(
+        cache_instance.translate_engine, cache_instance.translate_engine_params, True
+    )
+
+
 class TestCache(unittest.TestCase):
     def setUp(self):
         self.test_db = cache.init_test_db()
@@ -159,56 +171,532 @@ class TestCache(unittest.TestCase):
         cache_instance.set("hello2", "你好2")
         self.assertEqual(cache_instance.get("hello2"), "你好2")
 
-    # Sometimes the problem of "database is locked" occurs. Temporarily disable this test.
-    # def test_thread_safety(self):
-    #     """Test thread safety of cache operations"""
-    #     cache_instance = cache.TranslationCache("test_engine")
-    #     lock = threading.Lock()
-    #     results = []
-    #     num_threads = multiprocessing.cpu_count()
-    #     items_per_thread = 100
-
-    #     def generate_random_text(length=10):
-    #         return "".join(
-    #             random.choices(string.ascii_letters + string.digits, k=length)
-    #         )
-
-    #     def worker():
-    #         thread_results = []  # 线程本地存储结果
-    #         for _ in range(items_per_thread):
-    #             text = generate_random_text()
-    #             translation = f"翻译_{text}"
-
-    #             # Write operation
-    #             cache_instance.set(text, translation)
-
-    #             # Read operation - verify our own write
-    #             result = cache_instance.get(text)
-    #             thread_results.append((text, result))
-
-    #         # 所有操作完成后，一次性加锁并追加结果
-    #         with lock:
-    #             results.extend(thread_results)
-
-    #     # Create threads equal to CPU core count
-    #     threads = []
-    #     for _ in range(num_threads):
-    #         thread = threading.Thread(target=worker)
-    #         threads.append(thread)
-    #         thread.start()
-
-    #     # Wait for all threads to complete
-    #     for thread in threads:
-    #         thread.join()
-
-    #     # Verify all operations were successful
-    #     expected_total = num_threads * items_per_thread
-    #     self.assertEqual(len(results), expected_total)
-
-    #     # Verify each thread got its correct value
-    #     for text, result in results:
-    #         expected = f"翻译_{text}"
-    #         self.assertEqual(result, expected)
+    def test_memory_cache_shared(self):
+        """Test that translations are served from memory to other instances"""
+        cache1 = cache.TranslationCache("test_engine", {"a": 1})
+        cache2 = cache.TranslationCache("test_engine", {"a": 1})
+        cache1.set("hello", "你好")
+        cache.writer.flush()
+        cache._TranslationCache.delete().execute()  # only in memory now
+        self.assertEqual(cache2.get("hello"), "你好")
+        self.assertEqual(cache.TranslationCache.stats()["hits"], 1)
+
+        # Different params miss the memory cache
+        cache3 = cache.TranslationCache("test_engine", {"a": 2})
+        self.assertIsNone(cache3.get("hello"))
+        self.assertEqual(cache.TranslationCache.stats()["misses"], 1)
+
+    def test_memory_cache_filled_from_db(self):
+        """Test that database hits are kept in memory"""
+        cache_instance = cache.TranslationCache("test_engine")
+        cache_instance.set("hello", "你好")
+        cache.writer.flush()
+        cache.memory_cache.clear()
+        self.assertEqual(cache_instance.get("hello"), "你好")
+        self.assertEqual(cache.TranslationCache.stats()["misses"], 1)
+        self.assertEqual(cache_instance.get("hello"), "你好")
+        self.assertEqual(cache.TranslationCache.stats()["hits"], 1)
+
+    def test_get_many_set_many(self):
+        """Test batch lookups and writes"""
+        cache_instance = cache.TranslationCache("test_engine", {"a": 1})
+        translations = {f"text {i}": f"文本 {i}" for i in range(1200)}
+        cache_instance.set_many(translations)
+        cache.memory_cache.clear()
+
+        texts = list(translations) + ["missing", "text 0"]
+        self.assertEqual(cache_instance.get_many(texts), translations)
+        self.assertEqual(cache_instance.get("text 1199"), "文本 1199")
+        self.assertEqual(cache.TranslationCache.stats()["hits"], 1)
+
+        # Other params see none of them
+        other = cache.TranslationCache("test_engine", {"a": 2})
+        self.assertEqual(other.get_many(texts), {})
+
+    def test_set_many_overwrite(self):
+        """Test that batch writes replace existing translations"""
+        cache_instance = cache.TranslationCache("test_engine")
+        cache_instance.set("hello", "你好")
+        cache_instance.set_many({"hello": "您好", "world": "世界"})
+        cache.memory_cache.clear()
+        self.assertEqual(
+            cache_instance.get_many(["hello", "world"]),
+            {"hello": "您好", "world": "世界"},
+        )
+
+    def test_params_stored_once(self):
+        """Test that instances with the same params share one params row"""
+        cache1 = cache.TranslationCache("test_engine", {"b": 1, "a": 2})
+        cache2 = cache.TranslationCache("test_engine", {"a": 2, "b": 1})
+        cache3 = cache.TranslationCache("other_engine", {"a": 2, "b": 1})
+        self.assertEqual(stored_params_id(cache1), stored_params_id(cache2))
+        self.assertNotEqual(stored_params_id(cache1), stored_params_id(cache3))
+        self.assertEqual(cache._TranslationParams.select().count(), 2)
+
+        # Changing params switches to another row
+        params_id = stored_params_id(cache1)
+        cache1.add_params("c", 3)
+        self.assertNotEqual(stored_params_id(cache1), params_id)
+
+    def test_key_collision(self):
+        """Test that texts sharing a digest do not return each other's translation"""
+        cache_instance = cache.TranslationCache("test_engine")
+        with mock.patch("pdf2zh.cache.text_key", return_value=42):
+            cache_instance.set("hello", "你好")
+            cache.writer.flush()
+            cache.memory_cache.clear()
+            self.assertIsNone(cache_instance.get("world"))
+            self.assertEqual(cache_instance.get_many(["world"]), {})
+            self.assertEqual(cache_instance.get("hello"), "你好")
+
+    def make_v1_db(self):
+        fd, v1_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, v1_path)
+        with sqlite3.connect(v1_path) as v1:
+            v1.execute(
+                "CREATE TABLE _translationcache (id INTEGER PRIMARY KEY, "
+                "translate_engine VARCHAR(20), translate_engine_params TEXT, "
+                "original_text TEXT, translation TEXT)"
+            )
+            v1.executemany(
+                "INSERT INTO _translationcache (translate_engine, "
+                "translate_engine_params, original_text, translation) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    ("test_engine", '{"a": 1}', "hello", "你好"),
+                    ("test_engine", '{"a": 1}', "world", "世界"),
+                    ("test_engine", '{"a": 2}', "hello", "您好"),
+                ],
+            )
+        v1.close()
+        return v1_path
+
+    def test_migrate_v1(self):
+        """Test that version 1 databases are copied into the current schema"""
+        v1_path = self.make_v1_db()
+        self.assertEqual(cache.migrate_v1(v1_path, batch_size=2), 3)
+        cache1 = cache.TranslationCache("test_engine", {"a": 1})
+        cache2 = cache.TranslationCache("test_engine", {"a": 2})
+        self.assertEqual(
+            cache1.get_many(["hello", "world"]), {"hello": "你好", "world": "世界"}
+        )
+        self.assertEqual(cache2.get("hello"), "您好")
+        self.assertEqual(cache._TranslationParams.select().count(), 2)
+        self.assertEqual(self.test_db.pragma("user_version"), cache.SCHEMA_VERSION)
+        self.assertEqual(cache._Migration.select().count(), 0)
+        self.assertEqual(cache.migrate_v1(v1_path), 0)
+
+    def test_migrate_v1_keeps_order(self):
+        """Test that copied rows are older than new ones, in version 1 order"""
+        v1_path = self.make_v1_db()
+        cache.migrate_v1(v1_path)
+        query = cache._TranslationCache.select().order_by(
+            cache._TranslationCache.last_access
+        )
+        self.assertEqual([row.translation for row in query], ["你好", "世界", "您好"])
+        self.assertEqual(len({row.last_access for row in query}), 3)
+        cache.TranslationCache("test_engine").set_many({"new": "新"})
+        cache.prune(max_rows=3)  # to 90%, so 2 rows
+        self.assertEqual(
+            sorted(row.translation for row in cache._TranslationCache.select()),
+            sorted(["您好", "新"]),
+        )
+
+    def test_migrate_v1_in_background(self):
+        """Test that the writer continues a copy in batches, keeping new rows"""
+        v1_path = self.make_v1_db()
+        cache1 = cache.TranslationCache("test_engine", {"a": 1})
+        cache1.set_many({"world": "世界!"})
+        self.assertEqual(cache.migrate_v1(v1_path, batch_size=2, max_batches=1), 2)
+        self.assertNotEqual(self.test_db.pragma("user_version"), cache.SCHEMA_VERSION)
+
+        writer = cache.CacheWriter(idle_interval=0.01)
+        writer.migration = v1_path
+        writer.touch(0)
+        for _ in range(500):
+            if writer.migration is None:
+                break
+            threading.Event().wait(0.01)
+        self.assertIsNone(writer.migration)
+        self.assertEqual(self.test_db.pragma("user_version"), cache.SCHEMA_VERSION)
+        cache.memory_cache.clear()
+        self.assertEqual(
+            cache1.get_many(["hello", "world"]), {"hello": "你好", "world": "世界!"}
+        )
+        self.assertEqual(
+            cache.TranslationCache("test_engine", {"a": 2}).get("hello"), "您好"
+        )
+
+    def test_prune_expired(self):
+        """Test that rows not used for max_age are removed with their params"""
+        old = cache.TranslationCache("test_engine", {"a": 1})
+        new = cache.TranslationCache("test_engine", {"a": 2})
+        old.set_many({"hello": "你好", "world": "世界"})
+        new.set_many({"hello": "您好"})
+        cache._TranslationCache.update(last_access=1).where(
+            cache._TranslationCache.params_id == stored_params_id(old)
+        ).execute()
+
+        result = cache.prune(max_age=3600, params_age=0)
+        self.assertEqual(result, {"expired": 2, "evicted": 0, "params": 1})
+        self.assertEqual(
+            [p.id for p in cache._TranslationParams.select()], [stored_params_id(new)]
+        )
+        cache.memory_cache.clear()
+        self.assertEqual(new.get("hello"), "您好")
+
+    def test_lookups_only_read(self):
+        """Test that lookups add no params and do not wait for the write lock"""
+        cache_instance = cache.TranslationCache("test_engine", {"a": 1})
+        self.assertIsNone(cache_instance.get("hello"))
+        self.assertEqual(cache_instance.get_many(["hello"]), {})
+        self.assertEqual(cache._TranslationParams.select().count(), 0)
+
+        cache_instance.set_many({"hello": "你好"})
+        cache.backend = cache.SQLiteBackend()  # another process
+        cache.memory_cache.clear()
+        other = sqlite3.connect(self.test_db.database)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            self.assertEqual(cache_instance.get_many(["hello"]), {"hello": "你好"})
+            self.assertEqual(cache.TranslationCache("new_engine").get("hello"), None)
+        finally:
+            other.rollback()
+            other.close()
+
+    def test_database_error_is_miss(self):
+        """Test that lookups in a failing database are misses"""
+        cache_instance = cache.TranslationCache("test_engine")
+        cache_instance.set_many({"hello": "你好"})
+        cache.memory_cache.clear()
+        error = cache.OperationalError("database is locked")
+        with mock.patch.object(cache._TranslationCache, "select", side_effect=error):
+            with self.assertLogs("pdf2zh.cache", "WARNING"):
+                self.assertIsNone(cache_instance.get("hello"))
+                self.assertEqual(cache_instance.get_many(["hello"]), {})
+        self.assertEqual(cache_instance.get_many(["hello"]), {"hello": "你好"})
+
+    def test_pruned_params_id_not_reused(self):
+        """Test that params pruned while in use do not share rows with new params"""
+        first = cache.TranslationCache("google", {"lang": "zh"})
+        stored_params_id(first)  # added, no row written yet
+        # New params are kept until they are params_age old
+        self.assertEqual(cache.prune()["params"], 0)
+        self.assertEqual(cache.prune(params_age=0)["params"], 1)
+        first.set("Hello", "你好")
+        cache.writer.flush()
+        cache.memory_cache.clear()
+
+        cache.backend = cache.SQLiteBackend()  # another process
+        second = cache.TranslationCache("deepl", {"lang": "ja"})
+        self.assertNotEqual(stored_params_id(second), stored_params_id(first))
+        self.assertIsNone(second.get("Hello"))
+        self.assertEqual(second.get_many(["Hello"]), {})
+
+    def test_prune_least_recently_used(self):
+        """Test that the least recently used rows are evicted first"""
+        cache_instance = cache.TranslationCache("test_engine")
+        cache_instance.set_many({f"text {i}": str(i) for i in range(100)})
+        cache._TranslationCache.update(last_access=1).execute()
+        cache.memory_cache.clear()
+        self.assertEqual(cache_instance.get("text 7"), "7")
+        self.assertEqual(cache_instance.get_many(["text 8"]), {"text 8": "8"})
+        cache_instance.get("text 9")
+        cache.writer.flush()  # writes the lookups
+
+        result = cache.prune(max_rows=50, batch_size=20)
+        self.assertEqual(result["evicted"], 55)
+        self.assertEqual(cache._TranslationCache.select().count(), 45)
+        cache.memory_cache.clear()
+        self.assertEqual(
+            cache_instance.get_many(["text 7", "text 8", "text 9"]),
+            {"text 7": "7", "text 8": "8", "text 9": "9"},
+        )
+        # Below the limit nothing is evicted
+        self.assertEqual(cache.prune(max_rows=50)["evicted"], 0)
+
+    def test_prune_bytes_and_vacuum(self):
+        """Test that rows are evicted down to max_bytes and the space is freed"""
+        cache_instance = cache.TranslationCache("test_engine")
+        cache_instance.set_many({f"text {i}": "译" * 200 for i in range(2000)})
+        used = cache.database_stats()["bytes"]
+
+        result = cache.prune(max_bytes=used // 2)
+        self.assertGreater(result["evicted"], 0)
+        stats = cache.database_stats()
+        self.assertLess(stats["bytes"], used // 2)
+        self.assertGreater(stats["free_bytes"], 0)
+
+        self.assertGreater(cache.vacuum(pages=10, step=4), 0)
+        self.assertGreater(cache.vacuum(), 0)
+        self.assertEqual(cache.database_stats()["free_bytes"], 0)
+
+    def test_writer_prunes(self):
+        """Test that the writer prunes the database to its limits"""
+        writer = cache.CacheWriter(limits={"max_rows": 10}, prune_interval=0)
+        cache_instance = cache.TranslationCache("test_engine")
+        params_id = stored_params_id(cache_instance)
+        for i in range(30):
+            text = f"text {i}"
+            writer.put((cache.text_key(params_id, text), params_id, text, str(i)))
+        writer.flush()
+        self.assertLessEqual(cache._TranslationCache.select().count(), 10)
+
+    def test_lru_cache_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        lru = cache.LRUCache(2)
+        lru.set("a", "1")
+        lru.set("b", "2")
+        self.assertEqual(lru.get("a"), "1")
+        lru.set("c", "3")
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), "1")
+        self.assertEqual(lru.get("c"), "3")
+        self.assertEqual(lru.stats(), {"hits": 3, "misses": 1, "size": 2, "maxsize": 2})
+
+        disabled = cache.LRUCache(0)
+        disabled.set("a", "1")
+        self.assertIsNone(disabled.get("a"))
+
+    def test_thread_safety(self):
+        """Test thread safety of cache operations"""
+        cache_instance = cache.TranslationCache("test_engine")
+        lock = threading.Lock()
+        results = []
+        num_threads = multiprocessing.cpu_count()
+        items_per_thread = 100
+
+        def generate_random_text(length=10):
+            return "".join(
+                random.choices(string.ascii_letters + string.digits, k=length)
+            )
+
+        def worker():
+            thread_results = []  # 线程本地存储结果
+            for _ in range(items_per_thread):
+                text = generate_random_text()
+                translation = f"翻译_{text}"
+
+                # Write operation
+                cache_instance.set(text, translation)
+
+                # Read operation - verify our own write
+                result = cache_instance.get(text)
+                thread_results.append((text, result))
+
+            # 所有操作完成后，一次性加锁并追加结果
+            with lock:
+                results.extend(thread_results)
+
+        # Create threads equal to CPU core count
+        threads = []
+        for _ in range(num_threads):
+            thread = threading.Thread(target=worker)
+            threads.append(thread)
+            thread.start()
+
+        # Wait for all threads to complete
+        for thread in threads:
+            thread.join()
+
+        # Verify all operations were successful
+        expected_total = num_threads * items_per_thread
+        self.assertEqual(len(results), expected_total)
+
+        # Verify each thread got its correct value
+        for text, result in results:
+            expected = f"翻译_{text}"
+            self.assertEqual(result, expected)
+
+        # All writes reached the database through the background writer
+        cache.writer.flush()
+        cache.memory_cache.clear()
+        for text, _ in results:
+            self.assertEqual(cache_instance.get(text), f"翻译_{text}")
+        self.assertEqual(cache.TranslationCache.stats()["failed"], 0)
+
+    def test_writer_batches(self):
+        """Test that queued rows are written in batches"""
+        writer = cache.CacheWriter(batch_size=1000, interval=10)
+        cache_instance = cache.TranslationCache("test_engine")
+        params_id = stored_params_id(cache_instance)
+        with mock.patch("pdf2zh.cache.write_rows", wraps=cache.write_rows) as write:
+            for i in range(2500):
+                text = f"text {i}"
+                writer.put((cache.text_key(params_id, text), params_id, text, str(i)))
+            writer.flush()
+        self.assertEqual(
+            [len(c.args[0]) for c in write.call_args_list], [1000, 1000, 500]
+        )
+        self.assertEqual(
+            writer.stats(), {"queued": 0, "dropped": 0, "written": 2500, "failed": 0}
+        )
+        self.assertEqual(cache_instance.get("text 2499"), "2499")
+
+    def test_writer_drops_when_full(self):
+        """Test that rows are dropped and counted when the queue is full"""
+        writer = cache.CacheWriter(max_queue=2, batch_size=1, interval=0)
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocked_write(rows):
+            started.set()
+            release.wait()
+
+        row = (1, 1, "hello", "你好")
+        with mock.patch("pdf2zh.cache.write_rows", side_effect=blocked_write):
+            self.assertTrue(writer.put(row))
+            started.wait()  # the writer holds the first row
+            self.assertTrue(writer.put(row))
+            self.assertTrue(writer.put(row))
+            self.assertFalse(writer.put(row))
+            self.assertEqual(writer.stats()["queued"], 2)
+            self.assertEqual(writer.stats()["dropped"], 1)
+            release.set()
+            writer.flush()
+        self.assertEqual(writer.stats()["written"], 3)
+
+    def test_writer_failure(self):
+        """Test that failed writes are counted and do not stop the writer"""
+        writer = cache.CacheWriter()
+        with mock.patch("pdf2zh.cache.write_rows", side_effect=RuntimeError):
+            writer.put((1, 1, "hello", "你好"))
+            writer.flush()
+        writer.put((2, 1, "world", "世界"))
+        writer.flush()
+        self.assertEqual(writer.stats()["failed"], 1)
+        self.assertEqual(writer.stats()["written"], 1)
+
+
+class FakeRedis:
+    """The part of redis.Redis used by RedisBackend, in memory."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+        self.round_trips = 0
+        self.down = False
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append(lambda: self.client.data.get(key))
+
+    def getex(self, key, ex=None):
+        def command():
+            if key in self.client.data:
+                self.client.expiry[key] = ex
+            return self.client.data.get(key)
+
+        self.commands.append(command)
+
+    def set(self, key, value, ex=None):
+        def command():
+            self.client.data[key] = value
+            self.client.expiry[key] = ex
+            return True
+
+        self.commands.append(command)
+
+    def execute(self):
+        if self.client.down:
+            raise ConnectionError("Connection refused")
+        self.client.round_trips += 1
+        return [command() for command in self.commands]
+
+
+class TestRedisBackend(unittest.TestCase):
+    def setUp(self):
+        self.test_db = cache.init_test_db()
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(
+            cache, "backend", cache.RedisBackend(self.redis, ttl=3600)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clean_test_db(self.test_db)
+
+    def test_set_get(self):
+        """Test that translations are shared through Redis"""
+        cache1 = cache.TranslationCache("test_engine", {"a": 1})
+        cache1.set("hello", "你好")
+        cache.memory_cache.clear()
+        self.assertEqual(cache1.get("hello"), "你好")
+        self.assertIsNone(cache1.get("world"))
+        self.assertIsNone(cache.TranslationCache("test_engine", {"a": 2}).get("hello"))
+        self.assertIsNone(cache.TranslationCache("other_engine", {"a": 1}).get("hello"))
+        # Nothing was written to SQLite
+        cache.writer.flush()
+        self.assertEqual(cache._TranslationCache.select().count(), 0)
+
+    def test_batches_are_pipelined(self):
+        """Test that batch reads and writes take one round trip each"""
+        cache_instance = cache.TranslationCache("test_engine")
+        translations = {f"text {i}": f"文本 {i}" for i in range(100)}
+        cache_instance.set_many(translations)
+        self.assertEqual(self.redis.round_trips, 1)
+        self.assertEqual(set(self.redis.expiry.values()), {3600})
+
+        cache.memory_cache.clear()
+        found = cache_instance.get_many(list(translations) + ["missing"])
+        self.assertEqual(found, translations)
+        self.assertEqual(self.redis.round_trips, 2)
+        # Served from memory now
+        self.assertEqual(cache_instance.get_many(translations), translations)
+        self.assertEqual(self.redis.round_trips, 2)
+
+    def test_server_down(self):
+        """Test that an unreachable server is a miss and does not raise"""
+        cache_instance = cache.TranslationCache("test_engine")
+        self.redis.down = True
+        cache_instance.set("hello", "你好")
+        cache_instance.set_many({"world": "世界"})
+        cache.memory_cache.clear()
+        self.assertIsNone(cache_instance.get("hello"))
+        self.assertEqual(cache_instance.get_many(["hello", "world"]), {})
+
+    @mock.patch("pdf2zh.cache.init_db")
+    def test_init_backend(self, mock_init_db):
+        config = {"CACHE_BACKEND": "redis", "CELERY_BROKER": "redis://broker:6379/0"}
+        with (
+            mock.patch.object(cache.ConfigManager, "get", side_effect=config.get),
+            mock.patch.object(cache.RedisBackend, "from_url") as mock_from_url,
+        ):
+            self.assertIs(cache.init_backend(), mock_from_url.return_value)
+            self.assertEqual(mock_from_url.call_args.args, ("redis://broker:6379/0",))
+            config["CACHE_REDIS_URL"] = "redis://cache:6379/1"
+            cache.init_backend()
+            self.assertEqual(mock_from_url.call_args.args, ("redis://cache:6379/1",))
+        # The local database is not opened for Redis
+        mock_init_db.assert_not_called()
+
+    @mock.patch("pdf2zh.cache.init_db")
+    def test_init_backend_falls_back(self, mock_init_db):
+        config = {"CACHE_BACKEND": "redis", "CELERY_BROKER": "amqp://broker:5672//"}
+        with mock.patch.object(cache.ConfigManager, "get", side_effect=config.get):
+            with self.assertLogs("pdf2zh.cache", "WARNING"):
+                self.assertIsInstance(cache.init_backend(), cache.SQLiteBackend)
+            config["CELERY_BROKER"] = "redis://broker:6379/0"
+            with mock.patch.dict("sys.modules", {"redis": None}):
+                with self.assertLogs("pdf2zh.cache", "WARNING"):
+                    self.assertIsInstance(cache.init_backend(), cache.SQLiteBackend)
+        self.assertEqual(mock_init_db.call_count, 2)
+
+    def test_unknown_backend(self):
+        config = {"CACHE_BACKEND": "memcached"}
+        with mock.patch.object(cache.ConfigManager, "get", side_effect=config.get):
+            with self.assertRaises(ValueError):
+                cache.init_backend()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+import unittest
+from pdfminer.pdfinterp import PDFContentParser
+from pdfminer.pdftypes import PDFStream
+from pdfminer.psexceptions import PSEOF
+from pdfminer.psparser import KWD, LIT
+from pdf2zh.contentparser import ContentParser
+
+
+def pdfminer_objects(data):
+    parser = PDFContentParser([PDFStream({}, data)])
+    objs = []
+    while True:
+        try:
+            pos, obj = parser.nextobject()
+        except PSEOF:
+            return objs
+        if isinstance(obj, PDFStream):
+            obj = ("inline", obj.attrs, obj.rawdata)
+        objs.append((pos, obj))
+
+
+def fast_objects(data):
+    return [
+        (pos, ("inline", obj.attrs, obj.rawdata) if isinstance(obj, PDFStream) else obj)
+        for pos, obj in ContentParser(data)
+    ]
+
+
+class TestContentParser(unittest.TestCase):
+    def assertSameAsPdfminer(self, data):
+        self.assertEqual(fast_objects(data), pdfminer_objects(data))
+
+    def test_common_tokens(self):
+        data = b"q 1 0 0 1 5.5 -.5 cm /F1 12 Tf (Hi) Tj <4142> Tj [(a) -120 (b)] TJ Q"
+        objs = fast_objects(data)
+        self.assertEqual(objs[:3], [(0, KWD(b"q")), (2, 1), (4, 0)])
+        self.assertEqual(objs[7], (18, KWD(b"cm")))
+        self.assertEqual(objs[8], (21, LIT("F1")))
+        self.assertEqual(objs[11], (31, b"Hi"))
+        self.assertEqual(objs[13], (39, b"AB"))
+        self.assertEqual(objs[15], (49, [b"a", -120, b"b"]))
+        self.assertSameAsPdfminer(data)
+
+    def test_numbers_and_keywords(self):
+        self.assertSameAsPdfminer(b"1..2 -.5 +3 .5 1.2.3 0g g0 true false 12. f* ' \"")
+
+    def test_dicts_and_comments(self):
+        self.assertSameAsPdfminer(
+            b"/Span <</MCID 0 /K [1 <</A 2>>]>> BDC % comment\n EMC [1 [2 [3]]] d"
+        )
+
+    def test_unusual_tokens_fall_back(self):
+        self.assertSameAsPdfminer(b"/GS#20a gs (a\\)b) Tj ((nested)) Tj <414> Tj 1 2 m")
+        self.assertSameAsPdfminer(b"[1 2 R] Tj 1 2 ] 3 { 4 } m * /N\xe4 Do")
+        self.assertSameAsPdfminer(b"(unterminated")
+
+    def test_inline_image(self):
+        data = b"q BI /W 2 /H 1 /BPC 8 /CS /G ID \x00\x01 EI Q 1 2 m"
+        objs = fast_objects(data)
+        self.assertEqual(
+            objs[-4:], [(38, KWD(b"Q")), (40, 1), (42, 2), (44, KWD(b"m"))]
+        )
+        self.assertSameAsPdfminer(data)
+
+    def test_nextobject(self):
+        parser = ContentParser(b"  1 m ")
+        self.assertEqual(parser.nextobject(), (2, 1))
+        self.assertEqual(parser.nextobject(), (4, KWD(b"m")))
+        with self.assertRaises(PSEOF):
+            parser.nextobject()
+        self.assertEqual(list(ContentParser(b"")), [])
@@ -2,7 +2,16 @@ import unittest
 from unittest.mock import Mock, patch, MagicMock
 from pdfminer.layout import LTPage, LTChar, LTLine
 from pdfminer.pdfinterp import PDFResourceManager
-from pdf2zh.converter import PDFConverterEx, TranslateConverter
+from pdf2zh.retry import CircuitOpenError, RetryPolicy
+from pdf2zh.converter import (
+    ContentStreamWriter,
+    FontMetrics,
+    PDFConverterEx,
+    TranslateConverter,
+    fit_line_height,
+    format_number,
+    split_placeholders,
+)
 
 
 class TestPDFConverterEx(unittest.TestCase):
@@ -95,6 +104,122 @@ class TestTranslateConverter(unittest.TestCase):
         result = self.converter.receive_layout(ltpage)
         self.assertIsNotNone(result)
 
+    def test_cache_error_translates_page(self):
+        ltpage = LTPage(1, (0, 0, 500, 500))
+        ltpage.add(LTLine(0.1, (0, 0), (10, 20)))
+        mock_layout = MagicMock()
+        mock_layout.shape = (100, 100)
+        mock_layout.__getitem__.return_value = -1
+        self.converter.layout = [None, mock_layout]
+        self.converter.thread = 1
+        with (
+            patch.object(
+                self.converter.translator,
+                "get_cached",
+                side_effect=OSError("database is locked"),
+            ),
+            self.assertLogs("pdf2zh.converter", "WARNING"),
+        ):
+            self.assertIsNotNone(self.converter.receive_layout(ltpage))
+
+    def text_page(self, *texts):
+        # One paragraph per text, 100pt apart
+        ltpage = LTPage(1, (0, 0, 500, 500))
+        font = Mock()
+        font.fontname = "Times-Roman"
+        font.is_vertical.return_value = False
+        font.get_descent.return_value = 0
+        for row, text in enumerate(texts):
+            y = 100 + 100 * row
+            for i, char in enumerate(text):
+                ltpage.add(
+                    LTChar(
+                        (10, 0, 0, 10, 100 + 6 * i, y),
+                        font,
+                        10,
+                        1.0,
+                        0,
+                        char,
+                        0.6,
+                        (None, 0),
+                        None,
+                        Mock(),
+                    )
+                )
+        mock_layout = MagicMock()
+        mock_layout.shape = (500, 500)
+        mock_layout.__getitem__.side_effect = lambda index: 2 + index[0] // 100
+        self.converter.layout = [None, mock_layout]
+        self.converter.thread = 1
+        self.converter.retry_policy = RetryPolicy(max_attempts=1)
+        tiro = Mock()
+        tiro.fontname = "MockRoman-TestTranslateConverter"
+        tiro.to_unichr.side_effect = chr
+        tiro.char_width.return_value = 0.5
+        self.converter.fontmap["tiro"] = tiro
+        return ltpage
+
+    def test_failed_paragraphs_logged(self):
+        ltpage = self.text_page("Hello", "World")
+        translate = Mock(
+            side_effect=lambda s, **kwargs: "Earth" if s == "World" else 1 / 0
+        )
+        with (
+            patch.object(self.converter.translator, "translate", translate),
+            self.assertLogs("pdf2zh.converter", "ERROR") as logs,
+        ):
+            self.assertIsNotNone(self.converter.receive_layout(ltpage))
+        self.assertIn("Page 1: 1 of 2 paragraphs", logs.output[-1])
+
+    def test_untranslated_page_raises(self):
+        ltpage = self.text_page("Hello", "World")
+        translate = Mock(side_effect=ZeroDivisionError)
+        with (
+            patch.object(self.converter.translator, "translate", translate),
+            self.assertLogs("pdf2zh.converter", "ERROR"),
+            self.assertRaisesRegex(RuntimeError, "none of the 2 paragraphs"),
+        ):
+            self.converter.receive_layout(ltpage)
+
+    def test_open_circuit_raises(self):
+        ltpage = self.text_page("Hello", "World")
+
+        def call(breaker, f, s, **kwargs):
+            if s == "Hello":
+                raise CircuitOpenError("circuit open")
+            return "Earth"
+
+        with (
+            patch.object(self.converter.retry_policy, "call", side_effect=call),
+            self.assertLogs("pdf2zh.converter", "ERROR"),
+            self.assertRaises(CircuitOpenError),
+        ):
+            self.converter.receive_layout(ltpage)
+
+    def test_breaker_per_model_and_endpoint(self):
+        def breaker(service, envs=None):
+            return TranslateConverter(
+                self.rsrcmgr,
+                layout=self.layout,
+                lang_in="en",
+                lang_out="zh",
+                service=service,
+                envs=envs,
+            ).breaker
+
+        self.assertEqual(breaker("google").name, "google")
+        ollama = breaker("ollama:gemma2", {"OLLAMA_HOST": "http://gpu1:11434"})
+        self.assertEqual(ollama.name, "ollama:gemma2:http://gpu1:11434")
+        self.assertIsNot(
+            ollama, breaker("ollama:qwen2", {"OLLAMA_HOST": "http://gpu1:11434"})
+        )
+        self.assertIsNot(
+            ollama, breaker("ollama:gemma2", {"OLLAMA_HOST": "http://gpu2:11434"})
+        )
+        self.assertIs(
+            ollama, breaker("ollama:gemma2", {"OLLAMA_HOST": "http://gpu1:11434"})
+        )
+
     def test_invalid_translation_service(self):
         with self.assertRaises(ValueError):
             TranslateConverter(
@@ -106,5 +231,109 @@ class TestTranslateConverter(unittest.TestCase):
             )
 
 
+class TestFontMetrics(unittest.TestCase):
+    def test_pdffont_metrics_cached(self):
+        font = Mock()
+        font.fontname = "MockRoman-TestFontMetrics"
+        font.to_unichr.side_effect = lambda cid: chr(cid) if cid < 128 else "?"
+        font.char_width.return_value = 0.5
+        metrics = FontMetrics.of_pdffont(font)
+        self.assertTrue(metrics.has("A"))
+        self.assertFalse(metrics.has("中"))
+        self.assertEqual(metrics.width("A"), 0.5)
+        self.assertEqual(metrics.gid("A"), ord("A"))
+        metrics = FontMetrics.of_pdffont(font)
+        metrics.has("A")
+        metrics.width("A")
+        self.assertEqual(font.to_unichr.call_count, 2)
+        self.assertEqual(font.char_width.call_count, 1)
+
+    def noto_font(self, name, buffer):
+        font = Mock()
+        font.name = name
+        font.buffer = buffer
+        font.has_glyph.side_effect = lambda c: 0 if c < 128 else 42
+        font.glyph_advance.return_value = 1.0
+        return font
+
+    def test_noto_metrics_cached(self):
+        font = self.noto_font("MockNoto", b"TestFontMetrics.test_noto_metrics_cached")
+        metrics = FontMetrics.of_noto(font)
+        self.assertTrue(metrics.has("中"))
+        self.assertFalse(metrics.has("A"))
+        self.assertEqual(metrics.gid("中"), 42)
+        self.assertEqual(metrics.width("中"), 1.0)
+        metrics.width("中")
+        self.assertEqual(font.has_glyph.call_count, 2)
+        self.assertEqual(font.glyph_advance.call_count, 1)
+
+    def test_noto_metrics_by_font_file(self):
+        buffer = b"TestFontMetrics.test_noto_metrics_by_font_file"
+        font = self.noto_font("MockNoto", buffer)
+        FontMetrics.of_noto(font).width("中")
+        # Another job's font object of the same file shares the tables, but
+        # missing entries are filled from its own font
+        same_file = self.noto_font("MockNoto", buffer)
+        metrics = FontMetrics.of_noto(same_file)
+        self.assertIs(metrics.font, same_file)
+        self.assertEqual(metrics.width("中"), 1.0)
+        metrics.gid("中")
+        same_file.glyph_advance.assert_not_called()
+        self.assertEqual(same_file.has_glyph.call_count, 1)
+        self.assertEqual(font.has_glyph.call_count, 0)
+        # A different file of the same name has its own tables
+        other_file = self.noto_font("MockNoto", buffer + b" (other)")
+        other_file.has_glyph.side_effect = lambda c: 7
+        self.assertEqual(FontMetrics.of_noto(other_file).gid("中"), 7)
+
+
+class TestSplitPlaceholders(unittest.TestCase):
+    def test_text_and_placeholders(self):
+        self.assertEqual(
+            split_placeholders("a {v0} b{ V 1 2 }c"),
+            [("a ", None), (None, 0), (" b", None), (None, 12), ("c", None)],
+        )
+
+    def test_plain_text(self):
+        self.assertEqual(split_placeholders("hello"), [("hello", None)])
+        self.assertEqual(split_placeholders(""), [])
+
+    def test_adjacent_and_invalid_placeholders(self):
+        self.assertEqual(split_placeholders("{v1}{v2}"), [(None, 1), (None, 2)])
+        self.assertEqual(split_placeholders("x{v1\t2}y"), [("x", None), ("y", None)])
+
+
+class TestContentStreamWriter(unittest.TestCase):
+    def test_format_number(self):
+        self.assertEqual(format_number(11.0), b"11")
+        self.assertEqual(format_number(0.5), b"0.5")
+        self.assertEqual(format_number(-0.00001), b"0")
+        self.assertEqual(format_number(72.123456), b"72.1235")
+
+    def test_text_and_line(self):
+        ops = ContentStreamWriter()
+        ops.text("tiro", 10.0, 72.5, 700.0, b"0041")
+        ops.line(1.0, 2.0, 3.0, 0.0, 0.5)
+        self.assertEqual(
+            ops.getvalue(),
+            b"/tiro 10 Tf 1 0 0 1 72.5 700 Tm [<0041>] TJ "
+            b"ET q 1 0 0 1 1 2 cm [] 0 d 0 J 0.5 w 0 0 m 3 0 l S Q BT ",
+        )
+
+
+class TestFitLineHeight(unittest.TestCase):
+    def test_fits_without_shrinking(self):
+        self.assertEqual(fit_line_height(1.4, 2, 10, 30), 1.4)
+
+    def test_shrinks_in_steps(self):
+        # 3 lines of size 10 in a 36pt box need a line height of at most 1.2
+        self.assertAlmostEqual(fit_line_height(1.4, 3, 10, 36), 1.2)
+        self.assertAlmostEqual(fit_line_height(1.4, 3, 10, 35), 1.15)
+
+    def test_floor(self):
+        self.assertAlmostEqual(fit_line_height(1.4, 10, 10, 10), 1.0)
+        self.assertEqual(fit_line_height(0.8, 10, 10, 10), 0.8)
+
+
 if __name__ == "__main__":
     unittest.main()
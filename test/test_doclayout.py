@@ -1,24 +1,26 @@
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 import numpy as np
+import onnxruntime
 from pdf2zh.doclayout import (
+    ModelInstance,
     OnnxModel,
     YoloResult,
     YoloBox,
+    nms,
+    session_options,
 )
 
 
 class TestOnnxModel(unittest.TestCase):
-    @patch("onnx.load")
     @patch("onnxruntime.InferenceSession")
-    def setUp(self, mock_inference_session, mock_onnx_load):
+    def setUp(self, mock_inference_session):
         # Mock ONNX model metadata
-        mock_model = MagicMock()
-        mock_model.metadata_props = [
-            MagicMock(key="stride", value="32"),
-            MagicMock(key="names", value="['class1', 'class2']"),
-        ]
-        mock_onnx_load.return_value = mock_model
+        mock_inference_session.return_value.get_modelmeta.return_value = MagicMock(
+            custom_metadata_map={"stride": "32", "names": "['class1', 'class2']"}
+        )
 
         # Initialize OnnxModel with a fake path
         self.model_path = "fake_model_path.onnx"
@@ -70,6 +72,133 @@ class TestOnnxModel(unittest.TestCase):
         self.assertGreater(len(results[0].boxes), 0)
         self.assertIsInstance(results[0].boxes[0], YoloBox)
 
+    def test_predict_nms(self):
+        preds = np.array([[[10, 10, 50, 50, 0.9, 0], [12, 10, 52, 50, 0.8, 0]]])
+        self.model.model.run.return_value = [preds.astype(np.float32)]
+        image = np.ones((1024, 1024, 3), dtype=np.uint8)
+        self.assertEqual(len(self.model.predict(image)[0]), 2)
+        self.assertEqual(len(self.model.predict(image, iou=0.5)[0]), 1)
+        self.assertEqual(len(self.model.predict(image, conf=0.85)[0]), 1)
+
+    def test_preprocess(self):
+        image = np.random.randint(0, 256, (500, 300, 3), dtype=np.uint8)
+        expected = self.model.resize_and_pad_image(image, 1024)
+        expected = np.transpose(expected, (2, 0, 1))[None].astype(np.float32) / 255
+        np.testing.assert_array_equal(self.model.preprocess(image, 1024), expected)
+        rgb = np.ascontiguousarray(image[:, :, ::-1])
+        np.testing.assert_array_equal(
+            self.model.preprocess(rgb, 1024, rgb=True), expected
+        )
+
+    def test_preprocess_gray(self):
+        gray = np.random.randint(0, 256, (500, 300), dtype=np.uint8)
+        expected = self.model.preprocess(np.repeat(gray[:, :, None], 3, axis=2))
+        np.testing.assert_array_equal(self.model.preprocess(gray), expected)
+
+    def test_predict_reuses_buffers(self):
+        self.model.model.run.return_value = [np.random.random((1, 300, 6))]
+        image = np.ones((500, 300, 3), dtype=np.uint8)
+        self.model.predict(image)
+        tensor = self.model.model.run.call_args.args[1]["images"]
+        self.model.predict(image * 2)
+        self.assertIs(self.model.model.run.call_args.args[1]["images"], tensor)
+        self.assertEqual(tensor[0, 0, 512, 300], np.float32(2 / 255))
+        self.model.predict(np.ones((600, 300, 3), dtype=np.uint8))
+        self.assertIsNot(self.model.model.run.call_args.args[1]["images"], tensor)
+
+    def test_predict_io_binding(self):
+        self.model.io_binding = True
+        session = self.model.model
+        session.get_outputs.return_value = [MagicMock(shape=[1, 300, 6])]
+        binding = session.io_binding.return_value
+        binding.copy_outputs_to_cpu.return_value = [np.random.random((1, 300, 6))]
+        image = np.ones((500, 300, 3), dtype=np.uint8)
+        first = self.model.predict(image)[0]
+        self.model.predict(image)
+        binding.bind_cpu_input.assert_called_once()
+        self.assertEqual(session.run_with_iobinding.call_count, 2)
+        self.assertEqual(binding.bind_output.call_count, 2)  # ORT, then our buffer
+        session.run.assert_not_called()
+        self.assertGreater(len(first.boxes), 0)
+
+
+class TestSessionOptions(unittest.TestCase):
+    @patch("pdf2zh.doclayout.ConfigManager.get", return_value=None)
+    def test_defaults(self, mock_get):
+        options = session_options()
+        self.assertEqual(options.intra_op_num_threads, 0)
+        self.assertEqual(
+            options.graph_optimization_level,
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        )
+
+    @patch("pdf2zh.doclayout.ConfigManager.get")
+    def test_config_and_arguments(self, mock_get):
+        config = {"ONNX_INTRA_OP_THREADS": "2", "ONNX_EXECUTION_MODE": "parallel"}
+        mock_get.side_effect = config.get
+        options = session_options(intra_op_threads=4, graph_optimization="basic")
+        self.assertEqual(options.intra_op_num_threads, 4)
+        self.assertEqual(options.execution_mode, onnxruntime.ExecutionMode.ORT_PARALLEL)
+        self.assertEqual(
+            options.graph_optimization_level,
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        )
+
+    @patch("pdf2zh.doclayout.ConfigManager.get", return_value=None)
+    def test_invalid_values(self, mock_get):
+        with self.assertRaises(ValueError):
+            session_options(graph_optimization="fast")
+        with self.assertRaises(TypeError):
+            session_options(threads=4)
+
+    @patch("pdf2zh.doclayout.ConfigManager.get", return_value=None)
+    @patch("onnxruntime.InferenceSession")
+    def test_model_uses_options(self, mock_session, mock_get):
+        mock_session.return_value.get_modelmeta.return_value = MagicMock(
+            custom_metadata_map={"stride": "32", "names": "['class1']"}
+        )
+        OnnxModel("fake_model_path.onnx", intra_op_threads=3)
+        self.assertEqual(mock_session.call_args.args[0], "fake_model_path.onnx")
+        options = mock_session.call_args.kwargs["sess_options"]
+        self.assertEqual(options.intra_op_num_threads, 3)
+
+
+class TestModelInstance(unittest.TestCase):
+    def tearDown(self):
+        ModelInstance.configure()
+
+    @patch("pdf2zh.doclayout.OnnxModel.load_available")
+    def test_lazy(self, mock_load):
+        ModelInstance.configure(intra_op_threads=2)
+        mock_load.assert_not_called()
+        self.assertIs(ModelInstance.get(), mock_load.return_value)
+        self.assertIs(ModelInstance.get(), mock_load.return_value)
+        mock_load.assert_called_once_with(intra_op_threads=2)
+
+    @patch("pdf2zh.doclayout.OnnxModel")
+    def test_model_path(self, mock_model):
+        ModelInstance.configure("custom.onnx", io_binding=True)
+        self.assertIs(ModelInstance.get(), mock_model.return_value)
+        mock_model.assert_called_once_with("custom.onnx", io_binding=True)
+
+    @patch("pdf2zh.doclayout.OnnxModel.load_available")
+    @patch("pdf2zh.doclayout.ConfigManager.get", return_value="/tmp/layout.sock")
+    def test_layout_server(self, mock_get, mock_load):
+        from pdf2zh.layout_server import LayoutClient
+
+        model = ModelInstance.get()
+        self.assertIsInstance(model, LayoutClient)
+        self.assertEqual(model.address, "/tmp/layout.sock")
+        mock_load.assert_not_called()
+
+    @patch("pdf2zh.doclayout.OnnxModel.load_available")
+    def test_threads_load_once(self, mock_load):
+        mock_load.side_effect = lambda: time.sleep(0.05) or MagicMock()
+        with ThreadPoolExecutor(8) as executor:
+            models = set(executor.map(lambda _: ModelInstance.get(), range(8)))
+        self.assertEqual(len(models), 1)
+        mock_load.assert_called_once()
+
 
 class TestYoloResult(unittest.TestCase):
     def test_yolo_result(self):
@@ -87,6 +216,44 @@ class TestYoloResult(unittest.TestCase):
         self.assertGreater(result.boxes[0].conf, result.boxes[1].conf)
         self.assertEqual(result.names, names)
 
+    def test_arrays(self):
+        boxes = np.array(
+            [
+                [50, 100, 150, 200, 0.8, 1],
+                [100, 200, 300, 400, 0.9, 0],
+                [0, 0, 10, 10, 0.8, 2],
+            ]
+        )
+        result = YoloResult(boxes, {0: "text", 1: "figure", 2: "table"})
+        self.assertEqual(len(result), 3)
+        np.testing.assert_array_equal(result.conf, np.float32([0.9, 0.8, 0.8]))
+        np.testing.assert_array_equal(result.cls, [0, 1, 2])  # stable order
+        np.testing.assert_array_equal(result.xyxy[0], [100, 200, 300, 400])
+        np.testing.assert_array_equal(
+            result.is_class(["figure", "table"]), [False, True, True]
+        )
+        np.testing.assert_array_equal(result.boxes[1].xyxy, [50, 100, 150, 200])
+
+    def test_empty(self):
+        result = YoloResult(np.zeros((0, 6)), ["class1"])
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.boxes, [])
+        self.assertEqual(result.is_class(["class1"]).shape, (0,))
+        self.assertEqual(len(YoloResult([], ["class1"])), 0)
+
+
+class TestNms(unittest.TestCase):
+    def test_nms(self):
+        xyxy = np.array(
+            [[0, 0, 10, 10], [1, 0, 11, 10], [1, 0, 11, 10], [20, 20, 30, 30]],
+            dtype=np.float32,
+        )
+        conf = np.array([0.5, 0.9, 0.8, 0.7])
+        cls = np.array([0, 0, 1, 0])
+        # The second box suppresses the first, the third has another class
+        np.testing.assert_array_equal(nms(xyxy, conf, cls, 0.5), [1, 2, 3])
+        np.testing.assert_array_equal(nms(xyxy, conf, cls, 0.9), [1, 2, 3, 0])
+
 
 class TestYoloBox(unittest.TestCase):
     def test_yolo_box(self):
@@ -0,0 +1,66 @@
+import unittest
+import pymupdf
+from pdf2zh.high_level import insert_fonts, page_has_text, resource_xrefs
+
+
+class TestPageHasText(unittest.TestCase):
+    def setUp(self):
+        template = pymupdf.open()
+        template.new_page().insert_text((10, 40), "Header")
+        doc = pymupdf.open()
+        doc.new_page().insert_text((72, 72), "Plain text")
+        doc.new_page().show_pdf_page(pymupdf.Rect(0, 0, 595, 842), template, 0)
+        doc.new_page().insert_image(
+            pymupdf.Rect(0, 0, 100, 100),
+            pixmap=pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 10, 10)),
+        )
+        doc.new_page()
+        page = doc.new_page()
+        page.insert_font("helv")
+        page.draw_rect(pymupdf.Rect(10, 10, 50, 50))
+        self.doc = pymupdf.open(stream=doc.tobytes())
+
+    def test_text_page(self):
+        self.assertTrue(page_has_text(self.doc, 0))
+
+    def test_text_in_form_xobject(self):
+        self.assertTrue(page_has_text(self.doc, 1))
+
+    def test_image_page(self):
+        self.assertFalse(page_has_text(self.doc, 2))
+
+    def test_blank_page(self):
+        self.assertFalse(page_has_text(self.doc, 3))
+
+    def test_fonts_without_text(self):
+        self.assertFalse(page_has_text(self.doc, 4))
+
+
+class TestInsertFonts(unittest.TestCase):
+    def setUp(self):
+        doc = pymupdf.open()
+        doc.new_page().insert_text((72, 72), "Plain text")
+        page = doc.new_page()
+        page.insert_font("helv")
+        page.draw_rect(pymupdf.Rect(10, 10, 50, 50))
+        self.doc = pymupdf.open(stream=doc.tobytes())
+
+    def fonts(self, pageno):
+        return {name for _, _, _, _, name, *_ in self.doc[pageno].get_fonts()}
+
+    def test_text_pages_only(self):
+        page = self.doc[1]
+        resources = self.doc.xref_get_key(page.xref, "Resources")
+        before = self.doc.xref_object(page.xref)
+        insert_fonts(self.doc, [("tiro", None)], {0})
+        self.assertIn("tiro", self.fonts(0))
+        self.assertEqual(self.fonts(1), {"helv"})
+        self.assertEqual(self.doc.xref_object(page.xref), before)
+        self.assertEqual(self.doc.xref_get_key(page.xref, "Resources"), resources)
+
+    def test_resource_xrefs(self):
+        page = self.doc[0]
+        xrefs = resource_xrefs(self.doc, 0)
+        self.assertIn(page.xref, xrefs)
+        self.assertIn(page.get_fonts()[0][0], xrefs)
+        self.assertNotIn(self.doc[1].xref, xrefs)
@@ -0,0 +1,157 @@
+import os
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from unittest import mock
+import numpy as np
+from pdf2zh.doclayout import YoloResult
+from pdf2zh.layout_server import LayoutClient, LayoutServer, get_authkey
+
+
+class FakeModel:
+    stride = 32
+    names = {0: "text", 1: "figure"}
+
+    def __init__(self):
+        self.batches = []
+        self.kwargs = []
+
+    def predict_batch(self, images, imgsz=1024, rgb=False, **kwargs):
+        self.batches.append(len(images))
+        self.kwargs.append(kwargs)
+        if imgsz == 0:
+            raise ValueError("bad size")
+        # One box per page spanning the page, with the first pixel as class
+        return [
+            YoloResult(
+                boxes=[[0, 0, image.shape[1], image.shape[0], 0.9, image[0, 0, 0]]],
+                names=self.names,
+            )
+            for image in images
+        ]
+
+
+class TestLayoutServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.tmp.name, "layout.sock")
+        patcher = mock.patch(
+            "pdf2zh.layout_server.KEY_PATH", os.path.join(self.tmp.name, "key")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.model = FakeModel()
+        self.server = LayoutServer(self.model, self.address, max_wait=0.2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        while not os.path.exists(self.address):
+            threading.Event().wait(0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.tmp.cleanup()
+
+    def test_predict(self):
+        client = LayoutClient(self.address)
+        self.assertEqual(client.stride, 32)
+        image = np.ones((64, 48, 3), dtype=np.uint8)
+        result = client.predict(image, imgsz=64, rgb=True)[0]
+        self.assertEqual(result.names, {0: "text", 1: "figure"})
+        self.assertEqual(len(result.boxes), 1)
+        np.testing.assert_array_equal(result.boxes[0].xyxy, [0, 0, 48, 64])
+        self.assertEqual(result.boxes[0].cls, 1)
+
+    def test_errors(self):
+        client = LayoutClient(self.address)
+        image = np.ones((64, 48, 3), dtype=np.uint8)
+        with self.assertRaisesRegex(RuntimeError, "bad size"):
+            client.predict(image, imgsz=0)
+        self.assertEqual(len(client.predict(image, imgsz=64)[0].boxes), 1)
+
+    def test_batches_across_clients(self):
+        clients = [LayoutClient(self.address) for _ in range(4)]
+        sizes = [(64, 48), (64, 48), (64, 48), (32, 32)]
+
+        def predict(i):
+            image = np.full((*sizes[i], 3), i % 2, dtype=np.uint8)
+            return clients[i].predict(image, imgsz=64)[0].boxes[0]
+
+        with ThreadPoolExecutor(4) as executor:
+            boxes = list(executor.map(predict, range(4)))
+        self.assertEqual([int(b.cls) for b in boxes], [0, 1, 0, 1])
+        self.assertEqual([b.xyxy[2] for b in boxes], [48, 48, 48, 32])
+        self.assertEqual(sum(self.model.batches), 4)
+        self.assertLess(len(self.model.batches), 4)  # same-size pages were batched
+
+    def test_predict_arguments(self):
+        client = LayoutClient(self.address)
+        image = np.ones((64, 48, 3), dtype=np.uint8)
+        client.predict(image, imgsz=64, conf=0.5, iou=0.45)
+        client.predict(image, imgsz=64)
+        self.assertEqual(self.model.kwargs, [{"conf": 0.5, "iou": 0.45}, {}])
+        with self.assertRaises(TypeError):
+            client.predict(image, imgsz=64, agnostic=True)
+
+    def test_socket_private(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.address).st_mode), 0o600)
+
+    def test_authentication(self):
+        with self.assertRaises(AuthenticationError):
+            LayoutClient(self.address, authkey=b"wrong").stride
+        self.assertEqual(LayoutClient(self.address).stride, 32)
+
+    def test_running_server_kept(self):
+        with self.assertRaisesRegex(RuntimeError, "already listening"):
+            LayoutServer(self.model, self.address).serve_forever()
+        self.assertEqual(LayoutClient(self.address).stride, 32)
+
+
+class TestStaleSocket(unittest.TestCase):
+    def test_stale_socket_replaced(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            address = os.path.join(tmp, "layout.sock")
+            # Left over by a server that was killed
+            sock = socket.socket(socket.AF_UNIX)
+            sock.bind(address)
+            sock.close()
+            server = LayoutServer(FakeModel(), address, authkey=b"key")
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                while server.listener is None:
+                    threading.Event().wait(0.01)
+                self.assertEqual(LayoutClient(address, authkey=b"key").stride, 32)
+            finally:
+                server.shutdown()
+                thread.join()
+
+    def test_other_file_kept(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            address = os.path.join(tmp, "layout.sock")
+            open(address, "w").close()
+            with self.assertRaisesRegex(RuntimeError, "not a socket"):
+                LayoutServer(FakeModel(), address, authkey=b"key").serve_forever()
+            self.assertTrue(os.path.isfile(address))
+
+
+class TestAuthkey(unittest.TestCase):
+    @mock.patch("pdf2zh.layout_server.ConfigManager.get", return_value=None)
+    def test_key_file(self, mock_get):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pdf2zh", "key")
+            with mock.patch("pdf2zh.layout_server.KEY_PATH", path):
+                key = get_authkey()
+                self.assertEqual(len(key), 64)
+                self.assertEqual(get_authkey(), key)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["key"])
+
+    @mock.patch("pdf2zh.layout_server.ConfigManager.get", return_value="secret")
+    def test_configured_key(self, mock_get):
+        self.assertEqual(get_authkey(), b"secret")
+        mock_get.assert_called_with("LAYOUT_SERVER_KEY")
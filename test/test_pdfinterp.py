@@ -0,0 +1,125 @@
+import io
+import unittest
+from unittest.mock import patch
+import pymupdf
+from pdfminer.layout import LTPage
+from pdfminer.pdfinterp import PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import PDFStream
+from pdfminer.psparser import KWD
+from pdf2zh import pdfinterp
+from pdf2zh.converter import PDFConverterEx
+from pdf2zh.pdfinterp import EMIT_DROP, EMIT_RAW, EMIT_REWRITE, PDFPageInterpreterEx
+
+
+class TestDispatchTable(unittest.TestCase):
+    def test_operator_names(self):
+        table = PDFPageInterpreterEx.dispatch_table()
+        self.assertEqual(table[KWD(b"f*")][0], "f*")
+        self.assertIs(table[KWD(b"f*")][1], PDFPageInterpreterEx.do_f_a)
+        self.assertEqual(table[KWD(b"'")][0], "'")
+        self.assertEqual(table[KWD(b'"')][0], '"')
+        self.assertNotIn(KWD(b"xyz"), table)
+
+    def test_arity_and_emit(self):
+        table = PDFPageInterpreterEx.dispatch_table()
+        self.assertEqual(table[KWD(b"cm")][2:], (6, EMIT_RAW))
+        self.assertEqual(table[KWD(b"S")][2:], (0, EMIT_REWRITE))
+        self.assertEqual(table[KWD(b"Tj")][2:], (1, EMIT_DROP))
+        self.assertEqual(table[KWD(b"BDC")][2:], (2, EMIT_DROP))
+        self.assertEqual(table[KWD(b"EMC")][2:], (0, EMIT_DROP))
+
+    def test_built_once_per_class(self):
+        class Sub(PDFPageInterpreterEx):
+            def do_BX(self) -> None:
+                pass
+
+        self.assertIs(
+            PDFPageInterpreterEx.dispatch_table(), PDFPageInterpreterEx.dispatch_table()
+        )
+        self.assertIs(Sub.dispatch_table()[KWD(b"BX")][1], Sub.do_BX)
+
+
+class TestExecute(unittest.TestCase):
+    def setUp(self):
+        rsrcmgr = PDFResourceManager()
+        device = PDFConverterEx(rsrcmgr)
+        device.cur_item = LTPage(1, (0, 0, 100, 100))
+        self.interpreter = PDFPageInterpreterEx(rsrcmgr, device, {})
+        self.interpreter.init_resources({})
+        self.interpreter.init_state((1, 0, 0, 1, 0, 0))
+
+    def test_path_operators(self):
+        stream = PDFStream({}, b"q 1 0 0 1 5 5 cm 0.5 g 0 0 10 10 re f Q")
+        self.assertEqual(
+            self.interpreter.execute([stream]),
+            b"q 1 0 0 1 5 5 cm 0.5 g 0 0 10 10 re f Q ",
+        )
+
+    def test_skips_unknown_and_short_operators(self):
+        stream = PDFStream({}, b"1 xyz 1 2 cm q")
+        self.assertEqual(self.interpreter.execute([stream]), b"q ")
+
+    def test_copies_original_bytes(self):
+        stream = PDFStream({}, b"/GS#20a gs [3 1] 0 d /P0 cs (it's) Tj %c\n0 0 m")
+        self.assertEqual(
+            self.interpreter.execute([stream]),
+            b"/GS#20a gs [3 1] 0 d /P0 cs 0 0 m ",
+        )
+
+    def test_rewrites_formula_lines(self):
+        stream = PDFStream({}, b"0 G 0 0 m 10 0 l S 0 0 m 10 10 l S")
+        self.assertEqual(
+            self.interpreter.execute([stream]),
+            b"0 G 0 0 m 10 0 l n S 0 0 m 10 10 l S ",
+        )
+
+    def test_joins_streams(self):
+        streams = [PDFStream({}, b"q 1 0 0 1"), PDFStream({}, b"5 5 cm Q")]
+        self.assertEqual(self.interpreter.execute(streams), b"q 1 0 0 1\n5 5 cm Q ")
+
+
+class TestFormCache(unittest.TestCase):
+    def make_pdf(self, rects):
+        template = pymupdf.open()
+        template.new_page(width=300, height=100).insert_text((10, 40), "Header")
+        doc = pymupdf.open()
+        for rect in rects:
+            doc.new_page().show_pdf_page(pymupdf.Rect(rect), template, 0)
+        return doc.tobytes()
+
+    def interpret(self, data):
+        rsrcmgr = PDFResourceManager()
+        device = PDFConverterEx(rsrcmgr)
+        device.end_figure = lambda _: b""
+        device.end_page = lambda _: b""
+        interpreter = PDFPageInterpreterEx(rsrcmgr, device, {})
+        with (
+            patch.object(
+                pdfinterp, "iter_objects", wraps=pdfinterp.iter_objects
+            ) as parse,
+            patch.object(
+                PDFPageInterpreterEx,
+                "execute_objects",
+                autospec=True,
+                side_effect=PDFPageInterpreterEx.execute_objects,
+            ) as execute,
+        ):
+            for pageno, page in enumerate(PDFPage.get_pages(io.BytesIO(data))):
+                page.pageno = pageno
+                page.page_xref = page.pageid
+                interpreter.process_page(page)
+        return parse, execute
+
+    def test_same_ctm_reuses_patch(self):
+        parse, execute = self.interpret(self.make_pdf([(50, 20, 350, 120)] * 3))
+        # 3 pages and 3 per-page wrapper forms, the shared form runs once
+        self.assertEqual(parse.call_count, 7)
+        self.assertEqual(execute.call_count, 7)
+
+    def test_different_ctm_reuses_parsed_objects(self):
+        rects = [(50, 20, 350, 120), (100, 600, 400, 700)]
+        parse, execute = self.interpret(self.make_pdf(rects))
+        # The shared form is parsed once but executed for each CTM
+        self.assertEqual(parse.call_count, 5)
+        self.assertEqual(execute.call_count, 6)
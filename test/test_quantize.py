@@ -0,0 +1,181 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+import onnx
+import onnxruntime
+import pymupdf
+from onnx import TensorProto, helper, numpy_helper
+from pdf2zh.doclayout import (
+    OnnxModel,
+    YoloResult,
+    box_iou,
+    optimized_model_path,
+    quantized_model_path,
+)
+from pdf2zh.quantize import compare, main, quantize, sample_pages
+
+
+def make_model(path, value=100.0):
+    # Tiny stand-in for the layout model: one box per page from a 1x1 conv
+    weight = np.full((6, 3, 1, 1), value, dtype=np.float32)
+    graph = helper.make_graph(
+        [
+            helper.make_node("Conv", ["images", "W"], ["conv"]),
+            helper.make_node("ReduceMean", ["conv"], ["mean"], axes=[2, 3]),
+            helper.make_node("Reshape", ["mean", "shape"], ["output"]),
+        ],
+        "toy",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, [1, 3, "h", "w"])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 1, 6])],
+        [
+            numpy_helper.from_array(weight, "W"),
+            numpy_helper.from_array(np.array([1, 1, 6], dtype=np.int64), "shape"),
+        ],
+    )
+    model = helper.make_model(
+        graph, ir_version=9, opset_imports=[helper.make_opsetid("", 17)]
+    )
+    model.metadata_props.add(key="stride", value="32")
+    model.metadata_props.add(key="names", value="{0: 'text'}")
+    onnx.save(model, path)
+
+
+class TestQuantize(unittest.TestCase):
+    def test_quantized_model_path(self):
+        self.assertEqual(
+            quantized_model_path("/models/layout.onnx"), "/models/layout.int8.onnx"
+        )
+
+    @patch("pdf2zh.doclayout.OnnxModel.__init__", return_value=None)
+    @patch("pdf2zh.doclayout.get_doclayout_onnx_model_path")
+    @patch("pdf2zh.doclayout.ConfigManager.get")
+    def test_precision(self, mock_get, mock_path, mock_init):
+        with tempfile.TemporaryDirectory() as tmp:
+            fp32 = os.path.join(tmp, "layout.onnx")
+            mock_path.return_value = fp32
+            mock_get.return_value = "int8"
+            OnnxModel.from_pretrained()  # no INT8 model yet
+            mock_init.assert_called_with(fp32)
+            open(quantized_model_path(fp32), "wb").close()
+            OnnxModel.from_pretrained(intra_op_threads=2)
+            mock_init.assert_called_with(quantized_model_path(fp32), intra_op_threads=2)
+            mock_get.return_value = None
+            OnnxModel.from_pretrained()
+            mock_init.assert_called_with(fp32)
+            mock_get.return_value = "fp16"
+            with self.assertRaises(ValueError):
+                OnnxModel.from_pretrained()
+
+    @patch("pdf2zh.doclayout.ConfigManager.get", return_value=None)
+    def test_static_and_dynamic(self, mock_get):
+        images = [np.full((128, 96, 3), 200, dtype=np.uint8)] * 2
+        with tempfile.TemporaryDirectory() as tmp:
+            fp32 = os.path.join(tmp, "model.onnx")
+            make_model(fp32)
+            for mode in ["static", "dynamic"]:
+                int8 = os.path.join(tmp, f"model.{mode}.onnx")
+                quantize(fp32, int8, images, mode=mode)
+                model = OnnxModel(int8)
+                self.assertEqual(model.stride, 32)
+                self.assertEqual(len(model.predict(images[0], imgsz=128)[0].boxes), 1)
+            with self.assertRaises(ValueError):
+                quantize(fp32, int8, images, mode="int4")
+
+
+class TestSamplePages(unittest.TestCase):
+    def test_rendered_like_translate_patch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sample.pdf")
+            with pymupdf.open() as doc:
+                for _ in range(3):
+                    page = doc.new_page(width=2000, height=1000)
+                    page.draw_rect(page.rect, color=(1, 0, 0), fill=(1, 0, 0))
+                doc.save(path)
+            images = list(sample_pages([path], 2, pixel_budget=20000))
+            self.assertEqual(len(images), 2)
+            self.assertEqual(images[0].shape, (100, 200, 3))
+            np.testing.assert_array_equal(images[0][50, 100], [255, 0, 0])  # RGB
+            (gray,) = sample_pages([path], 1, pixel_budget=20000, gray=True)
+            self.assertEqual(gray.shape, (100, 200))
+
+
+class TestMain(unittest.TestCase):
+    def test_ignores_optimized_model_path(self):
+        images = [np.full((128, 96, 3), 200, dtype=np.uint8)] * 2
+        with tempfile.TemporaryDirectory() as tmp:
+            fp32 = os.path.join(tmp, "model.onnx")
+            int8 = os.path.join(tmp, "model.int8.onnx")
+            make_model(fp32)
+            config = {"ONNX_OPTIMIZED_MODEL_PATH": os.path.join(tmp, "cache.onnx")}
+            with (
+                patch("pdf2zh.doclayout.ConfigManager.get", side_effect=config.get),
+                patch("pdf2zh.quantize.sample_pages", return_value=images),
+                patch("pdf2zh.quantize.compare", wraps=compare) as mock_compare,
+            ):
+                self.assertEqual(
+                    main(["sample.pdf", "--model", fp32, "--min-recall", "0"]), 0
+                )
+            reference, candidate = mock_compare.call_args.args[:2]
+            self.assertEqual(reference.model_path, fp32)
+            self.assertEqual(candidate.model_path, int8)
+            self.assertEqual(sorted(os.listdir(tmp)), ["model.int8.onnx", "model.onnx"])
+
+
+class TestOptimizedModel(unittest.TestCase):
+    @patch("pdf2zh.doclayout.ConfigManager.get", return_value=None)
+    def test_one_graph_per_model(self, mock_get):
+        image = np.full((64, 64, 3), 200, dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = os.path.join(tmp, "optimized.onnx")
+            a = os.path.join(tmp, "a.onnx")
+            b = os.path.join(tmp, "b.onnx")
+            make_model(a, 100.0)
+            make_model(b, -100.0)
+            expected = {}
+            for path in [a, b]:
+                boxes = OnnxModel(path).predict(image, imgsz=64)[0].boxes
+                expected[path] = [box.conf for box in boxes]
+            self.assertNotEqual(expected[a], expected[b])
+            for _ in range(2):  # optimized, then loaded from the cache
+                for path in [a, b]:
+                    model = OnnxModel(path, optimized_model_path=cache)
+                    boxes = model.predict(image, imgsz=64)[0].boxes
+                    self.assertEqual([box.conf for box in boxes], expected[path])
+            self.assertEqual(len(os.listdir(tmp)), 4)
+            level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.assertNotEqual(
+                optimized_model_path(cache, a, level),
+                optimized_model_path(cache, b, level),
+            )
+            os.utime(a, ns=(0, 1))  # the model file changed
+            self.assertNotIn(
+                os.path.basename(optimized_model_path(cache, a, level)),
+                os.listdir(tmp),
+            )
+
+
+class TestCompare(unittest.TestCase):
+    def fake_model(self, boxes):
+        model = MagicMock()
+        model.predict.return_value = [YoloResult(boxes=boxes, names={0: "a", 1: "b"})]
+        return model
+
+    def test_box_iou(self):
+        a = np.array([[0, 0, 10, 10]], dtype=np.float64)
+        b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]])
+        np.testing.assert_allclose(box_iou(a, b), [[1.0, 1 / 3, 0.0]])
+
+    def test_compare(self):
+        reference = self.fake_model(
+            [[0, 0, 10, 10, 0.9, 0], [20, 20, 30, 30, 0.8, 1], [40, 40, 50, 50, 0.7, 0]]
+        )
+        candidate = self.fake_model([[0, 0, 10, 11, 0.9, 0], [20, 20, 30, 30, 0.8, 0]])
+        stats = compare(reference, candidate, [np.zeros((64, 64, 3))])
+        self.assertTrue(reference.predict.call_args.kwargs["rgb"])
+        self.assertEqual(stats["reference_boxes"], 3)
+        self.assertEqual(stats["candidate_boxes"], 2)
+        self.assertAlmostEqual(stats["recall"], 1 / 3)
+        self.assertAlmostEqual(stats["precision"], 1 / 2)
+        self.assertAlmostEqual(stats["mean_iou"], 10 / 11)
@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+import pymupdf
+from multiprocessing.shared_memory import SharedMemory
+from pdf2zh.raster import PageRasterizer, render_page
+
+
+class TestRenderPage(unittest.TestCase):
+    def setUp(self):
+        self.doc = pymupdf.open()
+        self.doc.new_page(width=595.3, height=841.9)  # A4
+        self.doc.new_page(width=2383.9, height=3370.4)  # A0
+        self.doc[0].draw_rect(pymupdf.Rect(100, 100, 200, 200), fill=(1, 0, 0))
+
+    def test_default_resolution(self):
+        image, scale = render_page(self.doc[0], 1024 * 1024)
+        self.assertEqual(scale, 1.0)
+        self.assertEqual(image.shape, (842, 596, 3))
+        np.testing.assert_array_equal(image[150, 150], [255, 0, 0])
+
+    def test_pixel_budget(self):
+        image, scale = render_page(self.doc[1], 1024 * 1024)
+        self.assertLess(scale, 0.5)
+        self.assertLessEqual(image.shape[0] * image.shape[1], 1.01 * 1024 * 1024)
+        self.assertAlmostEqual(image.shape[0] / scale, 3370.4, delta=1 / scale)
+
+    def test_max_scale(self):
+        image, scale = render_page(self.doc[0], 4 * 1024 * 1024, max_scale=2.0)
+        self.assertEqual(scale, 2.0)
+        self.assertEqual(image.shape[:2], (1684, 1191))
+
+    def test_gray(self):
+        image, scale = render_page(self.doc[0], 1024 * 1024, gray=True)
+        self.assertEqual(image.shape, (842, 596))
+        self.assertLess(image[150, 150], 255)
+        self.assertEqual(image[0, 0], 255)
+
+
+class TestPageRasterizer(unittest.TestCase):
+    def setUp(self):
+        self.doc = pymupdf.open()
+        for i in range(5):
+            page = self.doc.new_page(width=200 + 10 * i, height=300)
+            page.insert_text((20, 50), f"Page {i}")
+
+    def expected(self, pageno):
+        return render_page(self.doc[pageno], 1024 * 1024)[0]
+
+    def test_inline(self):
+        with PageRasterizer(self.doc, [0, 2, 3]) as rasterizer:
+            pages = [(n, image.copy(), s) for n, image, s in rasterizer]
+        self.assertEqual([n for n, _, _ in pages], [0, 2, 3])
+        for n, image, scale in pages:
+            np.testing.assert_array_equal(image, self.expected(n))
+            self.assertEqual(scale, 1.0)
+
+    def test_workers(self):
+        with PageRasterizer(self.doc, [4, 0, 1, 3], workers=2, prefetch=1) as r:
+            for n, image, scale in r:
+                np.testing.assert_array_equal(image, self.expected(n))
+            name = r.shm.name
+        # The shared document is released
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name)
+
+    def test_early_exit(self):
+        with PageRasterizer(self.doc, [0, 1, 2, 3, 4], workers=2) as r:
+            for n, image, scale in r:
+                if n == 1:
+                    break
+            pending = [future for _, future in r.pending]
+        self.assertTrue(pending)
+        for future in pending:
+            if not future.cancelled():
+                with self.assertRaises(FileNotFoundError):
+                    SharedMemory(future.result()[0])
@@ -0,0 +1,143 @@
+import unittest
+
+import requests
+
+from pdf2zh.retry import CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class TestIsRetryable(unittest.TestCase):
+    def test_status_codes(self):
+        self.assertTrue(is_retryable(StatusError(429)))
+        self.assertTrue(is_retryable(StatusError(503)))
+        self.assertFalse(is_retryable(StatusError(400)))
+        self.assertFalse(is_retryable(StatusError(401)))
+
+    def test_requests_http_error(self):
+        response = requests.Response()
+        response.status_code = 403
+        self.assertFalse(is_retryable(requests.HTTPError(response=response)))
+        response.status_code = 502
+        self.assertTrue(is_retryable(requests.HTTPError(response=response)))
+
+    def test_exception_types(self):
+        self.assertTrue(is_retryable(requests.ConnectionError()))
+        self.assertTrue(is_retryable(TimeoutError()))
+        self.assertFalse(is_retryable(ValueError("bad config")))
+        self.assertFalse(is_retryable(CircuitOpenError()))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            "test",
+            window=4,
+            failure_rate=0.5,
+            min_calls=4,
+            cooldown=10,
+            clock=self.clock,
+        )
+
+    def test_opens_on_failure_rate(self):
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_half_open_probe(self):
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.clock.now = 10
+        self.breaker.before_call()  # probe
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_failure()  # probe failed, reopen
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.clock.now = 20
+        self.breaker.before_call()
+        self.breaker.record_success()  # probe succeeded, close
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=3, initial_wait=0, max_wait=0)
+        self.calls = 0
+
+    def test_retries_transient_errors(self):
+        def flaky():
+            self.calls += 1
+            if self.calls < 3:
+                raise StatusError(503)
+            return "ok"
+
+        self.assertEqual(self.policy.call(None, flaky), "ok")
+        self.assertEqual(self.calls, 3)
+
+    def test_gives_up_after_max_attempts(self):
+        def failing():
+            self.calls += 1
+            raise StatusError(503)
+
+        with self.assertRaises(StatusError):
+            self.policy.call(None, failing)
+        self.assertEqual(self.calls, 3)
+
+    def test_fatal_errors_are_not_retried(self):
+        def unauthorized():
+            self.calls += 1
+            raise StatusError(401)
+
+        with self.assertRaises(StatusError):
+            self.policy.call(None, unauthorized)
+        self.assertEqual(self.calls, 1)
+
+    def test_breaker_fails_fast(self):
+        breaker = CircuitBreaker("test", window=2, min_calls=2, cooldown=60)
+
+        def failing():
+            self.calls += 1
+            raise StatusError(503)
+
+        with self.assertRaises(CircuitOpenError):
+            self.policy.call(breaker, failing)
+        self.assertEqual(self.calls, 2)
+        with self.assertRaises(CircuitOpenError):
+            self.policy.call(breaker, failing)
+        self.assertEqual(self.calls, 2)
+
+    def test_fatal_errors_do_not_open_breaker(self):
+        breaker = CircuitBreaker("test", window=2, min_calls=2, cooldown=60)
+
+        def rejected():
+            self.calls += 1
+            raise StatusError(400)
+
+        for _ in range(5):
+            with self.assertRaises(StatusError):
+                self.policy.call(breaker, rejected)
+        self.assertEqual(self.calls, 5)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
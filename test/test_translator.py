@@ -49,6 +49,17 @@ class TestTranslator(unittest.TestCase):
         no_cache_result = translator.translate(text)
         self.assertNotEqual(first_result, no_cache_result)
 
+    def test_get_cached(self):
+        translator = AutoIncreaseTranslator("en", "zh", "test", False)
+        translator.translate("Hello")
+        translator.translate("World")
+        self.assertEqual(
+            translator.get_cached(["Hello", "World", "Other"]),
+            {"Hello": "1", "World": "2"},
+        )
+        translator.ignore_cache = True
+        self.assertEqual(translator.get_cached(["Hello"]), {})
+
     def test_add_cache_impact_parameters(self):
         translator = AutoIncreaseTranslator("en", "zh", "test", False)
 